@@ -1,7 +1,137 @@
+import importlib
+
 from .string_cleaning_methods import *
-from .string_matching_methods import *
-from .structured_output_schema import *
-from .prompting import *
-from .loading_files import *
-from .extending_model_outputs import *
-from .running_models import *
+
+# The remaining modules depend on heavy packages (pandas, pydantic, langchain, pubchempy, wcvpy), so are only imported
+# when one of their attributes is first used. This keeps `import phytochemMiner` fast for users of the string methods.
+# New public attributes should be added here.
+_lazy_attributes = {
+    # string_matching_methods
+    'abbreviate_sci_name': 'string_matching_methods',
+    'precise_taxon_name_match': 'string_matching_methods',
+    'check_organism_names_match': 'string_matching_methods',
+    'check_compound_names_match': 'string_matching_methods',
+    'NameMatchIndex': 'string_matching_methods',
+    # structured_output_schema
+    'Taxon': 'structured_output_schema',
+    'TaxaData': 'structured_output_schema',
+    'deduplicate_and_standardise_output_taxa_lists': 'structured_output_schema',
+    'reconcile_taxa_across_chunks': 'structured_output_schema',
+    'occurrence_columns': 'structured_output_schema',
+    'flatten_taxa_data': 'structured_output_schema',
+    'deduplicate_extractions': 'structured_output_schema',
+    # evaluation
+    'evaluation_levels': 'evaluation',
+    'evaluate_outputs': 'evaluation',
+    # json_dumps
+    'write_file_atomically': 'json_dumps',
+    'load_json_dump': 'json_dumps',
+    'write_json_dump': 'json_dumps',
+    'get_json_dumps': 'json_dumps',
+    # loading_outputs
+    'load_json_dumps': 'loading_outputs',
+    # occurrence_export
+    'OccurrenceDatasetWriter': 'occurrence_export',
+    'read_occurrence_dataset': 'occurrence_export',
+    # prompting
+    'compound_description': 'prompting',
+    'standard_prompt': 'prompting',
+    # loading_files
+    'get_txt_from_file': 'loading_files',
+    'read_file_and_chunk': 'loading_files',
+    'split_text_chunks': 'loading_files',
+    'read_tokenized_file': 'loading_files',
+    'TokenizedDocument': 'loading_files',
+    'iter_normalised_text': 'loading_files',
+    'iter_file_chunks': 'loading_files',
+    'text_storage_options': 'loading_files',
+    'store_output_text': 'loading_files',
+    'get_output_text': 'loading_files',
+    # corpus_manifest
+    'CorpusManifest': 'corpus_manifest',
+    'CHUNKED': 'corpus_manifest',
+    'EXTRACTED': 'corpus_manifest',
+    'TAXA_RESOLVED': 'corpus_manifest',
+    'INCHI_RESOLVED': 'corpus_manifest',
+    # rate_limiting
+    'ServiceRateLimiter': 'rate_limiting',
+    'get_status_code': 'rate_limiting',
+    'get_retry_after': 'rate_limiting',
+    'is_retryable_error': 'rate_limiting',
+    # translation_cache
+    'SQLiteTranslationCache': 'translation_cache',
+    'CacheEntry': 'translation_cache',
+    # wcvp_snapshots
+    'save_wcvp_snapshot': 'wcvp_snapshots',
+    'load_wcvp_snapshot': 'wcvp_snapshots',
+    'get_wcvp': 'wcvp_snapshots',
+    # extending_model_outputs
+    'inchi_translation_cache': 'extending_model_outputs',
+    'smiles_translation_cache': 'extending_model_outputs',
+    'translation_cache_db': 'extending_model_outputs',
+    'get_inchi_translation_cache': 'extending_model_outputs',
+    'get_smiles_translation_cache': 'extending_model_outputs',
+    'get_accepted_name_cache': 'extending_model_outputs',
+    'use_translation_caches': 'extending_model_outputs',
+    'pubchem_rate_limiter': 'extending_model_outputs',
+    'cir_rate_limiter': 'extending_model_outputs',
+    'get_accepted_info_for_names': 'extending_model_outputs',
+    'add_accepted_info_to_outputs': 'extending_model_outputs',
+    'add_accepted_info': 'extending_model_outputs',
+    'resolve_name_to_inchi': 'extending_model_outputs',
+    'is_valid_inchikey': 'extending_model_outputs',
+    'is_probably_valid_organic_smiles': 'extending_model_outputs',
+    'resolve_name_to_smiles': 'extending_model_outputs',
+    'resolve_names_to_inchi': 'extending_model_outputs',
+    'retry_failed_translations': 'extending_model_outputs',
+    'add_inchi_keys_to_outputs': 'extending_model_outputs',
+    'add_inchi_keys': 'extending_model_outputs',
+    'set_inchi_keys': 'extending_model_outputs',
+    'add_all_extra_info_to_output': 'extending_model_outputs',
+    'add_all_extra_info_to_outputs': 'extending_model_outputs',
+    'aresolve_name_to_inchi': 'extending_model_outputs',
+    'aadd_inchi_keys': 'extending_model_outputs',
+    'aadd_all_extra_info_to_output': 'extending_model_outputs',
+    # running_models
+    'run_phytochem_model': 'running_models',
+    'arun_phytochem_model': 'running_models',
+    'run_phytochem_model_on_corpus': 'running_models',
+    'get_deepseek_rate_limiter': 'running_models',
+    'get_input_size_limit': 'running_models',
+    'get_phytochem_model': 'running_models',
+    'get_model_response_cache': 'running_models',
+    'model_response_cache_db': 'running_models',
+    'resume_corpus_run': 'running_models',
+    'extract_from_text_file': 'running_models',
+    'refresh_inchi_keys_in_dumps': 'running_models',
+    # pipeline
+    'EXTRACTION_STAGE': 'pipeline',
+    'DEDUPLICATION_STAGE': 'pipeline',
+    'ACCEPTED_NAMES_STAGE': 'pipeline',
+    'COMPOUNDS_STAGE': 'pipeline',
+    'pipeline_stages': 'pipeline',
+    'get_stage_artifacts': 'pipeline',
+    'run_extraction_stage': 'pipeline',
+    'run_deduplication_stage': 'pipeline',
+    'run_accepted_names_stage': 'pipeline',
+    'run_compounds_stage': 'pipeline',
+    'serialise_outputs': 'pipeline',
+    'run_pipeline': 'pipeline',
+}
+
+__all__ = ['remove_double_spaces_and_break_characters', 'leading_trailing_whitespace', 'leading_trailing_punctuation',
+           'lowercase', 'clean_taxon_strings', 'clean_compound_strings', 'clean_taxon_series',
+           'clean_compound_series'] + list(_lazy_attributes)
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        module = importlib.import_module(f'.{_lazy_attributes[name]}', __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
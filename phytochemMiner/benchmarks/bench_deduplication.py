@@ -0,0 +1,59 @@
+import random
+import time
+
+from phytochemMiner import Taxon, deduplicate_and_standardise_output_taxa_lists, clean_taxon_strings, \
+    clean_compound_strings
+
+
+def _previous_deduplicate(taxa):
+    # The previous implementation, which rescanned and recleaned every taxon for each unique name
+    unique_scientific_names = []
+    for taxon in taxa:
+        if taxon.scientific_name is not None:
+            clean_name = clean_taxon_strings(taxon.scientific_name)
+            if clean_name not in unique_scientific_names:
+                unique_scientific_names.append(clean_name)
+
+    new_taxa_list = []
+    for name in unique_scientific_names:
+        compounds = []
+        for taxon in taxa:
+            if clean_taxon_strings(taxon.scientific_name) == name:
+                for condition in taxon.compounds or []:
+                    if condition == condition and condition.lower() != 'null':
+                        compounds.append(condition)
+        new_taxa_list.append((name, set(clean_compound_strings(c) for c in compounds) if compounds else None))
+    return new_taxa_list
+
+
+def get_synthetic_taxa(number_of_taxa: int, number_of_names: int, compounds_per_taxon: int = 10, seed: int = 0):
+    # Similar to outputs from review articles, where the same taxa are mentioned in many chunks with varied formatting
+    rng = random.Random(seed)
+    taxa = []
+    for _ in range(number_of_taxa):
+        name = f'Genus{rng.randrange(number_of_names // 10)} species{rng.randrange(number_of_names)}'
+        name = rng.choice([name, name.upper(), f' {name}.', f'{name}  '])
+        compounds = [f'Compound {rng.randrange(number_of_names * 5)}' for _ in range(compounds_per_taxon)]
+        taxa.append(Taxon(scientific_name=name, compounds=compounds))
+    return taxa
+
+
+def main():
+    for number_of_taxa in [500, 2000, 4000]:
+        taxa = get_synthetic_taxa(number_of_taxa, number_of_taxa // 2)
+
+        start = time.perf_counter()
+        result = deduplicate_and_standardise_output_taxa_lists(taxa)
+        new_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        previous_result = _previous_deduplicate(taxa)
+        previous_time = time.perf_counter() - start
+
+        assert [(t.scientific_name, set(t.compounds) if t.compounds else None) for t in result.taxa] == previous_result
+        print(f'{number_of_taxa} taxa: {new_time:.3f}s (previously {previous_time:.3f}s, '
+              f'{previous_time / new_time:.0f}x speedup)')
+
+
+if __name__ == '__main__':
+    main()
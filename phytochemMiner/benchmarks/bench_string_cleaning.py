@@ -0,0 +1,61 @@
+import random
+import time
+
+from phytochemMiner import clean_taxon_strings, clean_compound_strings, lowercase, leading_trailing_whitespace, \
+    leading_trailing_punctuation, remove_double_spaces_and_break_characters
+from phytochemMiner.string_cleaning_methods import _clean_taxon_string, _clean_compound_string
+
+
+def _previous_clean_taxon_strings(given_str):
+    # The previous implementation, which stripped whitespace and punctuation in a loop
+    low = lowercase(given_str)
+    while (leading_trailing_whitespace(low) != low) or (leading_trailing_punctuation(low) != low):
+        low = leading_trailing_whitespace(low)
+        low = leading_trailing_punctuation(low)
+    return remove_double_spaces_and_break_characters(low)
+
+
+def _previous_clean_compound_strings(given_str):
+    low = lowercase(given_str)
+    while (leading_trailing_whitespace(low) != low):
+        low = leading_trailing_whitespace(low)
+    return remove_double_spaces_and_break_characters(low)
+
+
+def get_synthetic_names(number_of_names: int, number_of_distinct_names: int, seed: int = 0):
+    # Names are repeated, as when the same taxa are cleaned during deduplication, matching and evaluation
+    rng = random.Random(seed)
+    distinct_names = []
+    for i in range(number_of_distinct_names):
+        name = f'Genus{i % 100} species{i} ({rng.choice(["L.", "Mill.", "DC."])})'
+        distinct_names.append(rng.choice([name, name.upper(), f' {name}.', f'"{name}",  ', f'{name}\n']))
+    return [rng.choice(distinct_names) for _ in range(number_of_names)]
+
+
+def _time(func, names):
+    start = time.perf_counter()
+    result = [func(name) for name in names]
+    return result, time.perf_counter() - start
+
+
+def main():
+    names = get_synthetic_names(200000, 5000)
+    for label, func, cached_func, previous_func in [
+        ('clean_taxon_strings', clean_taxon_strings, _clean_taxon_string, _previous_clean_taxon_strings),
+        ('clean_compound_strings', clean_compound_strings, _clean_compound_string, _previous_clean_compound_strings)]:
+        cached_func.cache_clear()
+        result, new_time = _time(func, names)
+        previous_result, previous_time = _time(previous_func, names)
+        assert result == previous_result
+        print(f'{label} on {len(names)} names: {new_time:.3f}s (previously {previous_time:.3f}s, '
+              f'{previous_time / new_time:.0f}x speedup)')
+
+        # Without the benefit of the cache
+        uncached_result, uncached_time = _time(cached_func.__wrapped__, names)
+        assert uncached_result == previous_result
+        print(f'{label} on {len(names)} names without caching: {uncached_time:.3f}s '
+              f'({previous_time / uncached_time:.0f}x speedup)')
+
+
+if __name__ == '__main__':
+    main()
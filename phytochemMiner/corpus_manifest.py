@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# Stages of processing a text file, in the order they're reached
+CHUNKED = 'chunked'
+EXTRACTED = 'extracted'
+TAXA_RESOLVED = 'taxa_resolved'
+INCHI_RESOLVED = 'inchi_resolved'
+stages = (CHUNKED, EXTRACTED, TAXA_RESOLVED, INCHI_RESOLVED)
+
+
+class CorpusManifest:
+    """
+    A record of how far each text file in a corpus run has been processed, stored in a SQLite database.
+
+    The stage of each file is updated as soon as it's reached, and outputs are written to the json dump at each stage,
+    so that a run which stops part way through can be resumed from where each file got to (see resume_corpus_run).
+    The parameters of the run are also recorded, so that it can be resumed with the same settings.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        :param db_path: Path to the SQLite database, which is created if it doesn't exist.
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS files (text_file TEXT PRIMARY KEY, json_dump TEXT, stage TEXT, '
+                           'error TEXT, updated REAL)')
+        connection.execute('CREATE TABLE IF NOT EXISTS parameters (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # As in SQLiteTranslationCache, keep one connection per thread and process
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add_files(self, json_dumps: dict):
+        """
+        Add text files to the manifest, given as a dict of text file -> json dump. Files already in the manifest keep
+        their stage.
+        """
+        self._connection().executemany('INSERT OR IGNORE INTO files (text_file, json_dump, updated) VALUES (?, ?, ?)',
+                                       [(text_file, json_dump, time.time()) for text_file, json_dump in
+                                        json_dumps.items()])
+
+    def set_stage(self, text_file: str, stage: str):
+        """
+        Record that a file has reached the given stage, clearing any previous error.
+        """
+        if stage not in stages:
+            raise ValueError(f'Unknown stage: {stage}. Should be one of {stages}')
+        self._connection().execute(
+            'INSERT INTO files (text_file, stage, updated) VALUES (?, ?, ?) ON CONFLICT(text_file) DO UPDATE SET '
+            'stage = excluded.stage, error = NULL, updated = excluded.updated', (text_file, stage, time.time()))
+
+    def record_error(self, text_file: str, error: str):
+        self._connection().execute(
+            'INSERT INTO files (text_file, error, updated) VALUES (?, ?, ?) ON CONFLICT(text_file) DO UPDATE SET '
+            'error = excluded.error, updated = excluded.updated', (text_file, error, time.time()))
+
+    def get_stage(self, text_file: str) -> Optional[str]:
+        """
+        Get the last stage the file reached, or None if it hasn't been processed.
+        """
+        row = self._connection().execute('SELECT stage FROM files WHERE text_file = ?', (text_file,)).fetchone()
+        return row[0] if row is not None else None
+
+    def has_reached(self, text_file: str, stage: str) -> bool:
+        reached = self.get_stage(text_file)
+        return reached is not None and stages.index(reached) >= stages.index(stage)
+
+    def get_json_dumps(self, unfinished_only: bool = False, finished_only: bool = False) -> dict:
+        """
+        Get a dict of text file -> json dump for files in the manifest, optionally only those which haven't reached
+        the last stage, or only those which have.
+        """
+        rows = self._connection().execute('SELECT text_file, json_dump, stage FROM files ORDER BY rowid')
+        return {text_file: json_dump for text_file, json_dump, stage in rows if
+                (not unfinished_only or stage != stages[-1]) and (not finished_only or stage == stages[-1])}
+
+    def get_status(self):
+        """
+        Get a DataFrame of the stage, error and time of last update of each file.
+        """
+        import pandas as pd
+
+        return pd.read_sql_query('SELECT text_file, json_dump, stage, error, updated FROM files ORDER BY rowid',
+                                 self._connection(), index_col='text_file')
+
+    def set_parameters(self, parameters: dict):
+        """
+        Record the parameters of the run, which must be json serialisable. A warning is given for parameters which
+        change those recorded for a previous run, as files processed with the previous parameters are not redone.
+        """
+        previous = self.get_parameters()
+        changed = [key for key, value in parameters.items() if key in previous and
+                   previous[key] != json.loads(json.dumps(value))]
+        if len(changed) > 0:
+            print(f'WARNING: changing the parameters of the run in {self.db_path}: ' +
+                  ', '.join(f'{key} from {previous[key]!r} to {parameters[key]!r}' for key in changed))
+        self._connection().executemany('INSERT OR REPLACE INTO parameters (key, value) VALUES (?, ?)',
+                                       [(key, json.dumps(value)) for key, value in parameters.items()])
+
+    def get_parameters(self) -> dict:
+        return {key: json.loads(value) for key, value in
+                self._connection().execute('SELECT key, value FROM parameters')}
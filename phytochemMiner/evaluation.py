@@ -0,0 +1,110 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from phytochemMiner import flatten_taxa_data, NameMatchIndex
+from phytochemMiner.string_matching_methods import _taxon_match_key, _compound_match_key
+
+# Levels at which pairs are compared. Each level compares pairs of a taxon and a compound column
+evaluation_levels = {
+    'scientific_name': ('scientific_name_key', 'compound_key'),
+    'accepted_name': ('accepted_name', 'compound_key'),
+    'inchi_key': ('accepted_name', 'inchi_key_simp'),
+}
+
+
+def _get_taxon_keys(occurrences: pd.DataFrame, annotation_occurrences: pd.DataFrame = None) -> list:
+    # Keys are only computed once for each distinct name in each paper. Names which match an annotated name of the same
+    # paper, e.g. as an abbreviation, are given the key of the annotated name
+    indexes = {}
+    if annotation_occurrences is not None:
+        indexes = {paper_id: NameMatchIndex(names.dropna().unique().tolist()) for paper_id, names in
+                   annotation_occurrences.groupby('paper_id', sort=False)['scientific_name']}
+    keys = {}
+    pairs = occurrences[['paper_id', 'scientific_name']].dropna().drop_duplicates()
+    for paper_id, name in pairs.itertuples(index=False):
+        if name == '':
+            continue
+        key = _taxon_match_key(name)
+        index = indexes.get(paper_id)
+        matched_keys = [_taxon_match_key(match) for match in index.matches(name)] if index is not None else []
+        if len(matched_keys) > 0 and key not in matched_keys:
+            key = matched_keys[0]
+        keys[(paper_id, name)] = key
+    return [keys.get((paper_id, name), np.nan) for paper_id, name in
+            zip(occurrences['paper_id'], occurrences['scientific_name'])]
+
+
+def _add_match_keys(occurrences: pd.DataFrame, annotation_occurrences: pd.DataFrame = None) -> pd.DataFrame:
+    occurrences = occurrences.copy()
+    occurrences['scientific_name_key'] = _get_taxon_keys(occurrences, annotation_occurrences)
+    occurrences['compound_key'] = occurrences['compound'].map(
+        {name: _compound_match_key(name) for name in occurrences['compound'].dropna().unique()})
+    # Names which are empty once cleaned can't be matched
+    occurrences[['scientific_name_key', 'compound_key']] = occurrences[['scientific_name_key', 'compound_key']].replace(
+        '', np.nan)
+    return occurrences
+
+
+def _get_scores(counts: pd.DataFrame) -> pd.DataFrame:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        counts['precision'] = counts['true_positives'] / (counts['true_positives'] + counts['false_positives'])
+        counts['recall'] = counts['true_positives'] / (counts['true_positives'] + counts['false_negatives'])
+        counts['f1'] = 2 * counts['precision'] * counts['recall'] / (counts['precision'] + counts['recall'])
+    return counts
+
+
+def evaluate_outputs(outputs: dict, annotations: dict, levels: List[str] = None) -> tuple:
+    """
+    Compare model outputs to annotations of the same papers, as (taxon, compound) pairs.
+
+    Pairs are compared at these levels:
+    - scientific_name: taxon names match as in check_organism_names_match, so abbreviated names match the annotated
+      names of the same paper, and compounds match as in check_compound_names_match
+    - accepted_name: accepted names are equal and compounds match as in check_compound_names_match
+    - inchi_key: accepted names and simplified InChIKeys are equal
+
+    Pairs which are missing the values needed at a level are ignored at that level. Output taxon names are matched to
+    annotated names with a NameMatchIndex of each paper, and pairs are then found with joins over the whole corpus,
+    rather than comparing each pair of names. Where an output name matches several annotated names, e.g. an ambiguous
+    abbreviation, it's matched to the first.
+
+    :param outputs: A dict of paper id -> TaxaData from the model.
+    :param annotations: A dict of paper id -> TaxaData of annotations. Only papers in annotations are evaluated, and
+    papers without an output are treated as having no extracted pairs.
+    :param levels: The levels to evaluate at. Defaults to all of evaluation_levels.
+    :return: A DataFrame of the number of true positives, false positives and false negatives, precision, recall and
+    F1 score of each paper at each level, and a DataFrame of the same for the whole corpus at each level (using the
+    total counts over papers).
+    """
+    levels = levels or list(evaluation_levels)
+    missing_outputs = [paper_id for paper_id in annotations if paper_id not in outputs]
+    if len(missing_outputs) > 0:
+        print(f'WARNING: no outputs given for {len(missing_outputs)} annotated papers, e.g. {missing_outputs[0]}')
+    paper_ids = list(annotations)
+
+    annotation_occurrences = flatten_taxa_data(annotations)
+    output_occurrences = _add_match_keys(flatten_taxa_data({paper_id: outputs[paper_id] for paper_id in paper_ids
+                                                            if paper_id in outputs}), annotation_occurrences)
+    annotation_occurrences = _add_match_keys(annotation_occurrences)
+
+    per_paper = []
+    for level in levels:
+        taxon_column, compound_column = evaluation_levels[level]
+        pair_columns = ['paper_id', taxon_column, compound_column]
+        output_pairs = output_occurrences[pair_columns].dropna().drop_duplicates()
+        annotation_pairs = annotation_occurrences[pair_columns].dropna().drop_duplicates()
+        merged = output_pairs.merge(annotation_pairs, on=pair_columns, how='outer', indicator=True)
+
+        merged['true_positives'] = merged['_merge'] == 'both'
+        merged['false_positives'] = merged['_merge'] == 'left_only'
+        merged['false_negatives'] = merged['_merge'] == 'right_only'
+        counts = merged.groupby('paper_id')[['true_positives', 'false_positives', 'false_negatives']].sum()
+        counts = counts.reindex(pd.Index(paper_ids, name='paper_id'), fill_value=0).astype(int)
+        counts.insert(0, 'level', level)
+        per_paper.append(counts)
+    per_paper = pd.concat(per_paper).reset_index()
+
+    corpus = per_paper.groupby('level', sort=False)[['true_positives', 'false_positives', 'false_negatives']].sum()
+    return _get_scores(per_paper), _get_scores(corpus)
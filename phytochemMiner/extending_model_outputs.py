@@ -1,88 +1,256 @@
+import asyncio
+import json
 import os
-import pickle
-import time
-import urllib
+import threading
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 
-import cirpy
+import numpy as np
 import pandas as pd
 
 from phytochempy.compound_properties import simplify_inchi_key
-from pubchempy import get_compounds
 from wcvpy.wcvp_name_matching import get_accepted_info_from_names_in_column, get_genus_from_full_name
 
-from phytochemMiner import TaxaData, clean_compound_strings
+from phytochemMiner import TaxaData, clean_compound_strings, clean_taxon_strings, SQLiteTranslationCache, \
+    ServiceRateLimiter, get_wcvp
+from phytochemMiner.translation_cache import FAILED, NOT_FOUND
 
 _phytochemMiner_cache_path = os.path.join(Path.home(), '.phytochemMiner_cache')
+# Previous versions pickled the whole cache to these files, they are migrated into translation_cache_db on first use
 inchi_translation_cache = os.path.join(_phytochemMiner_cache_path, 'inchi_translation_cache.pkl')
 smiles_translation_cache = os.path.join(_phytochemMiner_cache_path, 'smiles_translation_cache.pkl')
+translation_cache_db = os.path.join(_phytochemMiner_cache_path, 'translation_cache.sqlite')
 
-try:
-    pkled_inchi_translation_result = pickle.load(open(inchi_translation_cache, 'rb'))
-except FileNotFoundError:
-    pkled_inchi_translation_result = {}
+# Caches are opened on first use, rather than on import
+_inchi_translation_result = None
+_smiles_translation_result = None
+_accepted_name_result = None
+_translation_cache_lock = threading.Lock()
 
-try:
-    pkled_smiles_translation_result = pickle.load(open(smiles_translation_cache, 'rb'))
-except FileNotFoundError:
-    pkled_smiles_translation_result = {}
 
-_original_timeout = 0.34
-_timeout = [0.3]
+def get_inchi_translation_cache():
+    """
+    Get the cache of standardised compound names to InChIKeys, opening it on first use.
+    """
+    global _inchi_translation_result
+    with _translation_cache_lock:
+        if _inchi_translation_result is None:
+            _inchi_translation_result = SQLiteTranslationCache(translation_cache_db, 'inchi',
+                                                               legacy_pickle=inchi_translation_cache)
+    return _inchi_translation_result
 
 
-def add_accepted_info(deepseek_output: TaxaData, _wcvp_taxa: pd.DataFrame):
-    deepseek_names = pd.DataFrame([c.scientific_name for c in deepseek_output.taxa], columns=['scientific_name'])
-    acc_deepseek_names = get_accepted_info_from_names_in_column(deepseek_names, 'scientific_name', all_taxa=_wcvp_taxa)
-    acc_deepseek_names = acc_deepseek_names.set_index('scientific_name')
-    for taxon in deepseek_output.taxa:
-        taxon.accepted_name = acc_deepseek_names.loc[taxon.scientific_name, 'accepted_name']
-        taxon.accepted_species = acc_deepseek_names.loc[taxon.scientific_name, 'accepted_species']
-        taxon.accepted_genus = get_genus_from_full_name(taxon.accepted_species)
+def get_smiles_translation_cache():
+    """
+    Get the cache of standardised compound names to SMILES, opening it on first use.
+    """
+    global _smiles_translation_result
+    with _translation_cache_lock:
+        if _smiles_translation_result is None:
+            _smiles_translation_result = SQLiteTranslationCache(translation_cache_db, 'smiles',
+                                                                legacy_pickle=smiles_translation_cache)
+    return _smiles_translation_result
 
 
-def resolve_name_to_inchi(name: str):
+def get_accepted_name_cache():
     """
+    Get the cache of WCVP versions and cleaned scientific names to accepted names, opening it on first use.
+    """
+    global _accepted_name_result
+    with _translation_cache_lock:
+        if _accepted_name_result is None:
+            # Names which aren't matched won't be matched in later lookups in the same WCVP version, so don't expire
+            _accepted_name_result = SQLiteTranslationCache(translation_cache_db, 'accepted_names', not_found_ttl=None)
+    return _accepted_name_result
+
+
+def use_translation_caches(inchi_cache=None, smiles_cache=None):
+    """
+    Replace the backends used to cache name translations, e.g. with a SQLiteTranslationCache at a different path or
+    a plain dict to avoid writing to disk.
+
+    :param inchi_cache: A MutableMapping of standardised compound names to InChIKeys.
+    :param smiles_cache: A MutableMapping of standardised compound names to SMILES.
+    """
+    global _inchi_translation_result, _smiles_translation_result
+    with _translation_cache_lock:
+        if inchi_cache is not None:
+            _inchi_translation_result = inchi_cache
+        if smiles_cache is not None:
+            _smiles_translation_result = smiles_cache
+
+
+# Distinguishes names missing from a cache from names cached as not found
+_not_cached = object()
+
+
+def _get_many(cache, keys: list) -> dict:
+    # Read many names in one query from SQLiteTranslationCache, or one at a time from other mappings
+    if isinstance(cache, SQLiteTranslationCache):
+        return cache.get_many(keys)
+    found = {}
+    for key in keys:
+        value = cache.get(key, _not_cached)
+        if value is not _not_cached:
+            found[key] = value
+    return found
+
+
+def _set_many(cache, items: dict):
+    if isinstance(cache, SQLiteTranslationCache):
+        cache.set_many(items)
+    else:
+        cache.update(items)
+
+
+def _record_failed_search(cache, standard_name: str):
+    # Failed searches may succeed later, so are retried once they expire from the cache
+    if isinstance(cache, SQLiteTranslationCache):
+        cache.record_failure(standard_name)
+    else:
+        cache[standard_name] = None
+
 
+# PubChem allows at most 5 requests per second, so stay below this when resolving names from many workers.
+# CIR doesn't publish a limit, so is limited more conservatively.
+pubchem_rate_limiter = ServiceRateLimiter(requests_per_second=4)
+cir_rate_limiter = ServiceRateLimiter(requests_per_second=2)
+
+
+def _match_names_to_wcvp(names: List[str], _wcvp_taxa: pd.DataFrame) -> pd.DataFrame:
+    unique_names = pd.DataFrame({'scientific_name': names})
+    acc_names = get_accepted_info_from_names_in_column(unique_names, 'scientific_name', all_taxa=get_wcvp(_wcvp_taxa))
+    acc_names = acc_names.drop_duplicates(subset='scientific_name').set_index('scientific_name')
+    return acc_names[['accepted_name', 'accepted_species']]
+
+
+def _accepted_name_cache_key(wcvp_version: str, name: str) -> str:
+    return json.dumps([wcvp_version, clean_taxon_strings(name)])
+
+
+def get_accepted_info_for_names(names: List[str], _wcvp_taxa: pd.DataFrame, wcvp_version: str = None) -> pd.DataFrame:
     """
+    Match names to the WCVP, matching each distinct name only once.
+
+    When a wcvp_version is given, results are cached on disk for the version and the cleaned name, and only names
+    missing from the cache are matched to the WCVP. Hits and misses are recorded in the cache stats, see
+    get_accepted_name_cache().get_stats().
+
+    :param names: Scientific names, which may contain duplicates.
+    :param _wcvp_taxa: A copy of the wcvp, from get_all_taxa, or the path to a snapshot from save_wcvp_snapshot.
+    Snapshots are only loaded if some names aren't cached.
+    :param wcvp_version: The version of the given wcvp, e.g. the version passed to get_all_taxa.
+    :return: A DataFrame indexed by the distinct given names with accepted_name, accepted_species and accepted_genus
+    columns.
+    """
+    unique_names = list(pd.unique(pd.Series([n for n in names if n is not None], dtype=object)))
+    acc_names = pd.DataFrame(columns=['accepted_name', 'accepted_species'],
+                             index=pd.Index([], name='scientific_name'), dtype=object)
+
+    names_to_match = unique_names
+    if wcvp_version is not None and len(unique_names) > 0:
+        cache = get_accepted_name_cache()
+        keys = {name: _accepted_name_cache_key(wcvp_version, name) for name in unique_names}
+        cached = cache.get_many(list(keys.values()))
+        names_to_match = [name for name in unique_names if keys[name] not in cached]
+        cached_names = [name for name in unique_names if keys[name] in cached]
+        if len(cached_names) > 0:
+            acc_names = pd.DataFrame([json.loads(cached[keys[name]]) for name in cached_names],
+                                     columns=['accepted_name', 'accepted_species'],
+                                     index=pd.Index(cached_names, name='scientific_name'), dtype=object)
+
+    if len(names_to_match) > 0:
+        matched_names = _match_names_to_wcvp(names_to_match, _wcvp_taxa)
+        if wcvp_version is not None:
+            matched_to_cache = matched_names.astype(object).where(matched_names.notna(), None)
+            cache.set_many({keys[name]: json.dumps([row['accepted_name'], row['accepted_species']])
+                            for name, row in matched_to_cache.iterrows()})
+        acc_names = pd.concat([acc_names, matched_names]) if len(acc_names) > 0 else matched_names
+
+    # Unmatched names are given as NaN, whether they come from the cache or wcvpy
+    acc_names = acc_names.astype(object).where(acc_names.notna(), np.nan)
+    genera = {species: get_genus_from_full_name(species) for species in acc_names['accepted_species'].dropna().unique()}
+    acc_names['accepted_genus'] = acc_names['accepted_species'].map(genera)
+    return acc_names
+
+
+def add_accepted_info_to_outputs(deepseek_outputs: List[TaxaData], _wcvp_taxa: pd.DataFrame,
+                                 wcvp_version: str = None):
+    """
+    Add accepted names to many outputs, e.g. over a whole corpus, matching all of their names to the WCVP in one batch.
+    """
+    all_names = [taxon.scientific_name for deepseek_output in deepseek_outputs for taxon in deepseek_output.taxa]
+    acc_names = get_accepted_info_for_names(all_names, _wcvp_taxa, wcvp_version=wcvp_version).to_dict('index')
+    for deepseek_output in deepseek_outputs:
+        for taxon in deepseek_output.taxa:
+            acc_info = acc_names.get(taxon.scientific_name, {})
+            taxon.accepted_name = acc_info.get('accepted_name')
+            taxon.accepted_species = acc_info.get('accepted_species')
+            taxon.accepted_genus = acc_info.get('accepted_genus')
+    return deepseek_outputs
+
+
+def add_accepted_info(deepseek_output: TaxaData, _wcvp_taxa: pd.DataFrame, wcvp_version: str = None):
+    add_accepted_info_to_outputs([deepseek_output], _wcvp_taxa, wcvp_version=wcvp_version)
+
+
+def _standardise_compound_name(name: str):
     standard_name = clean_compound_strings(name)
     standard_name = standard_name.replace('β', 'beta')
     standard_name = standard_name.replace('α', 'alpha')
     standard_name = standard_name.replace('ψ', 'psi')
     standard_name = standard_name.replace('γ', 'gamma')
     standard_name = standard_name.replace('δ', 'delta')
+    return standard_name
+
+
+def _lookup_inchi_key(standard_name: str, name: str):
+    # Returns the InChIKey, or None if not found, and whether the search failed
+    out = None
     failed_search = False
-    if standard_name not in pkled_inchi_translation_result:
-        out = None
-        if standard_name is not None and standard_name != '':
+    if standard_name is not None and standard_name != '':
+
+        import cirpy
+        from pubchempy import get_compounds, PubChemHTTPError
+        try:
+            compounds = pubchem_rate_limiter.call(get_compounds, standard_name, 'name')
+            if compounds is not None and len(compounds) > 0:
+                out = compounds[0].inchikey  # Take first result
+            else:
+                # print(f"Name not found in PubChem: {standard_name}")
+
+                inch = cir_rate_limiter.call(cirpy.resolve, standard_name, 'stdinchikey')
+                if inch is not None:
+                    out = inch.replace('InChIKey=', '')
+
+        except (urllib.error.HTTPError, urllib.error.URLError, PubChemHTTPError):
+            out = None
+            failed_search = True
+            print(f'WARNING: not resolved: {name}')
+    if out is not None:
+        assert is_valid_inchikey(out)
+    return out, failed_search
 
-            try:
-                time.sleep(_timeout[0])
-                compounds = get_compounds(standard_name, 'name')
-                if compounds is not None and len(compounds) > 0:
-                    out = compounds[0].inchikey  # Take first result
-                else:
-                    # print(f"Name not found in PubChem: {standard_name}")
 
-                    inch = cirpy.resolve(standard_name, 'stdinchikey')
-                    if inch is not None:
-                        out = inch.replace('InChIKey=', '')
+def resolve_name_to_inchi(name: str):
+    """
 
-                _timeout[0] = _original_timeout
-            except (urllib.error.HTTPError, urllib.error.URLError):
-                out = None
-                failed_search = True
-                print(f'WARNING: not resolved: {name}')
-                _timeout[0] = _timeout[0] * 2
-        if out is not None:
-            assert is_valid_inchikey(out)
-        pkled_inchi_translation_result[standard_name] = out
-        if not failed_search:
-            with  open(inchi_translation_cache, 'wb') as pfile:
-                pickle.dump(pkled_inchi_translation_result, pfile)
-    if pkled_inchi_translation_result[standard_name] is not None:
-        assert is_valid_inchikey(pkled_inchi_translation_result[standard_name])
-    return pkled_inchi_translation_result[standard_name]
+    """
+    inchi_translation_result = get_inchi_translation_cache()
+    standard_name = _standardise_compound_name(name)
+    # Read the cache once, as entries may expire straight away, e.g. with a failed_ttl of 0
+    out = inchi_translation_result.get(standard_name, _not_cached)
+    if out is _not_cached:
+        out, failed_search = _lookup_inchi_key(standard_name, name)
+        if failed_search:
+            _record_failed_search(inchi_translation_result, standard_name)
+        else:
+            inchi_translation_result[standard_name] = out
+    if out is not None:
+        assert is_valid_inchikey(out)
+    return out
 
 
 def is_valid_inchikey(inchikey: str):
@@ -103,70 +271,179 @@ def resolve_name_to_smiles(name: str):
     """
 
         """
-    standard_name = clean_compound_strings(name)
-    standard_name = standard_name.replace('β', 'beta')
-    standard_name = standard_name.replace('α', 'alpha')
-    standard_name = standard_name.replace('ψ', 'psi')
-    standard_name = standard_name.replace('γ', 'gamma')
-    standard_name = standard_name.replace('δ', 'delta')
+    smiles_translation_result = get_smiles_translation_cache()
+    standard_name = _standardise_compound_name(name)
     failed_search = False
-    if standard_name not in pkled_smiles_translation_result:
+    out = smiles_translation_result.get(standard_name, _not_cached)
+    if out is _not_cached:
         out = None
         if standard_name is not None and standard_name != '':
 
+            import cirpy
+            from pubchempy import get_compounds, PubChemHTTPError
             try:
-
-                time.sleep(_timeout[0])
-                compounds = get_compounds(standard_name, 'name')
+                compounds = pubchem_rate_limiter.call(get_compounds, standard_name, 'name')
                 if compounds is not None and len(compounds) > 0:
                     out = compounds[0].smiles  # Take first result
                 else:
                     # print(f"Name not found in PubChem: {standard_name}")
 
-                    out = cirpy.resolve(standard_name, 'smiles')
+                    out = cir_rate_limiter.call(cirpy.resolve, standard_name, 'smiles')
 
-                _timeout[0] = _original_timeout
-            except (urllib.error.HTTPError, urllib.error.URLError):
+            except (urllib.error.HTTPError, urllib.error.URLError, PubChemHTTPError):
                 out = None
                 failed_search = True
                 print(f'WARNING: not resolved: {name}')
-                _timeout[0] = _timeout[0] * 2
 
-        pkled_smiles_translation_result[standard_name] = out
-        if not failed_search:
-            with  open(smiles_translation_cache, 'wb') as pfile:
-                pickle.dump(pkled_smiles_translation_result, pfile)
+        if failed_search:
+            _record_failed_search(smiles_translation_result, standard_name)
+        else:
+            smiles_translation_result[standard_name] = out
+
+    return out
+
+
+def resolve_names_to_inchi(names: List[str], max_workers: int = 4) -> dict:
+    """
+    Resolve many compound names to InChIKeys at once.
 
-    return pkled_smiles_translation_result[standard_name]
+    Names are deduplicated on their standardised form and the cache is read for all of them at once. Only names
+    missing from the cache are looked up, using a pool of workers which share pubchem_rate_limiter and
+    cir_rate_limiter, and their results are then written to the cache at once. As in resolve_name_to_inchi, CIR is
+    only queried for names which aren't found in PubChem.
 
+    :param names: The compound names to resolve.
+    :param max_workers: The maximum number of lookups to run at once.
+    :return: A dict of each given name to its InChIKey, or None if it couldn't be resolved.
+    """
+    inchi_translation_result = get_inchi_translation_cache()
+    standard_names = {name: _standardise_compound_name(name) for name in names if name is not None}
+    resolved = _get_many(inchi_translation_result, list(dict.fromkeys(standard_names.values())))
+    names_to_lookup = {}
+    for name, standard_name in standard_names.items():
+        if standard_name not in resolved and standard_name not in names_to_lookup:
+            names_to_lookup[standard_name] = name
+
+    if len(names_to_lookup) > 0:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            lookups = list(executor.map(_lookup_inchi_key, names_to_lookup, names_to_lookup.values()))
+        found = {}
+        for standard_name, (inchi_key, failed_search) in zip(names_to_lookup, lookups):
+            resolved[standard_name] = inchi_key
+            if failed_search:
+                _record_failed_search(inchi_translation_result, standard_name)
+            else:
+                found[standard_name] = inchi_key
+        _set_many(inchi_translation_result, found)
+
+    return {name: resolved[standard_name] for name, standard_name in standard_names.items()}
+
+
+def retry_failed_translations(include_not_found: bool = False, max_workers: int = 4) -> dict:
+    """
+    Look up again all names in the InChIKey and SMILES caches whose previous lookup failed, e.g. due to network errors,
+    regardless of whether they have expired.
 
-def add_inchi_keys(deepseek_output: TaxaData):
+    :param include_not_found: Whether to also look up names which were previously not found.
+    :param max_workers: The maximum number of lookups to run at once.
+    :return: A dict of each cache table to the number of retried names which are now resolved.
+    """
+    statuses = [FAILED, NOT_FOUND] if include_not_found else [FAILED]
+    number_resolved = {}
+    for cache, resolver in [(get_inchi_translation_cache(), resolve_name_to_inchi),
+                            (get_smiles_translation_cache(), resolve_name_to_smiles)]:
+        if not isinstance(cache, SQLiteTranslationCache):
+            continue
+        names = [name for status in statuses for name in cache.keys_with_status(status)]
+        for name in names:
+            del cache[name]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(resolver, names))
+        number_resolved[cache.table] = sum(result is not None for result in results)
+    return number_resolved
+
+
+def add_inchi_keys_to_outputs(deepseek_outputs: List[TaxaData], max_workers: int = 4):
+    """
+    Add InChIKeys to many outputs, e.g. over a whole corpus, resolving all of their compound names in one batch with
+    resolve_names_to_inchi.
+    """
+    all_compounds = [compound for deepseek_output in deepseek_outputs for taxon in deepseek_output.taxa
+                     for compound in taxon.compounds or []]
+    resolved = resolve_names_to_inchi(all_compounds, max_workers=max_workers)
+    for deepseek_output in deepseek_outputs:
+        set_inchi_keys(deepseek_output, resolved)
+
+    return deepseek_outputs
+
+
+def set_inchi_keys(deepseek_output: TaxaData, resolved: dict) -> bool:
+    """
+    Set the InChIKeys of the compounds in an output from a dict of compound names to InChIKeys, e.g. from
+    resolve_names_to_inchi.
+
+    :return: Whether any of the output's InChIKeys changed.
+    """
+    changed = False
     for taxon in deepseek_output.taxa:
         inchi_key_out_dict = {}
         inchi_key_simp_out_dict = {}
         for compound in taxon.compounds or []:
-            inchi_key = resolve_name_to_inchi(compound)
+            inchi_key = resolved[compound]
             if inchi_key is not None:
                 inchi_key_out_dict[compound] = inchi_key
                 inchi_key_simp_out_dict[compound] = simplify_inchi_key(inchi_key)
+        if getattr(taxon, 'inchi_keys', None) != inchi_key_out_dict or \
+                getattr(taxon, 'inchi_key_simps', None) != inchi_key_simp_out_dict:
+            changed = True
         taxon.inchi_keys = inchi_key_out_dict
         taxon.inchi_key_simps = inchi_key_simp_out_dict
+    return changed
+
 
+def add_inchi_keys(deepseek_output: TaxaData, max_workers: int = 4):
+    add_inchi_keys_to_outputs([deepseek_output], max_workers=max_workers)
     return deepseek_output
 
 
-def add_all_extra_info_to_output(deepseek_output: TaxaData, wcvp: pd.DataFrame):
-    add_accepted_info(deepseek_output, wcvp)
+def add_all_extra_info_to_output(deepseek_output: TaxaData, wcvp: pd.DataFrame, wcvp_version: str = None):
+    add_accepted_info(deepseek_output, wcvp, wcvp_version=wcvp_version)
     add_inchi_keys(deepseek_output)
     # print(deepseek_output)
 
 
+def add_all_extra_info_to_outputs(deepseek_outputs: List[TaxaData], wcvp: pd.DataFrame, wcvp_version: str = None,
+                                  max_workers: int = 4):
+    """
+    Add accepted names and InChIKeys to a batch of outputs, matching and resolving names once for the whole batch.
+    """
+    add_accepted_info_to_outputs(deepseek_outputs, wcvp, wcvp_version=wcvp_version)
+    add_inchi_keys_to_outputs(deepseek_outputs, max_workers=max_workers)
+    return deepseek_outputs
+
+
+async def aresolve_name_to_inchi(name: str):
+    """
+    Async version of resolve_name_to_inchi, run in a worker thread so the event loop isn't blocked while reading the
+    cache or waiting on PubChem/CIR.
+    """
+    return await asyncio.to_thread(resolve_name_to_inchi, name)
+
+
+async def aadd_inchi_keys(deepseek_output: TaxaData, max_workers: int = 4):
+    # Lookups are batched and rate limited in worker threads, see add_inchi_keys_to_outputs
+    return await asyncio.to_thread(add_inchi_keys, deepseek_output, max_workers)
+
+
+async def aadd_all_extra_info_to_output(deepseek_output: TaxaData, wcvp: pd.DataFrame, wcvp_version: str = None):
+    await asyncio.to_thread(add_accepted_info, deepseek_output, wcvp, wcvp_version)
+    await aadd_inchi_keys(deepseek_output)
+
+
 if __name__ == '__main__':
-    pkled_result = pickle.load(open(inchi_translation_cache, 'rb'))
-    for c in pkled_result:
-        if pkled_result[c] is not None:
-            assert is_valid_inchikey(pkled_result[c])
-    pkled_result = pickle.load(open(smiles_translation_cache, 'rb'))
-    for c in pkled_result:
-        if pkled_result[c] is not None:
-            assert is_probably_valid_organic_smiles(pkled_result[c])
+    for c, inchikey in get_inchi_translation_cache().items():
+        if inchikey is not None:
+            assert is_valid_inchikey(inchikey)
+    for c, smiles in get_smiles_translation_cache().items():
+        if smiles is not None:
+            assert is_probably_valid_organic_smiles(smiles)
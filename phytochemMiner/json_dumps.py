@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+
+from phytochemMiner import TaxaData
+
+
+def write_file_atomically(path: str, write):
+    """
+    Write a file by writing it to a temporary file and then renaming it, so that a crash part way through writing can't
+    leave a partially written file. The temporary file is removed if writing fails.
+
+    :param path: The path of the file.
+    :param write: A function which is given the path of the temporary file to write to.
+    """
+    temp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(temp_file)
+        os.replace(temp_file, path)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def load_json_dump(json_dump: str) -> TaxaData:
+    """
+    Load and validate an output written by write_json_dump.
+    """
+    with open(json_dump, "r") as file_:
+        json_dict = json.load(file_)
+    return TaxaData.model_validate(json_dict)
+
+
+def write_json_dump(output: TaxaData, json_dump: str):
+    """
+    Write an output to a json dump, see write_file_atomically.
+    """
+
+    def write(path: str):
+        with open(path, "w") as file_:
+            json_out = output.model_dump(mode="json")
+            json.dump(json_out, file_)
+
+    write_file_atomically(json_dump, write)
+
+
+def get_json_dumps(text_files: list, json_dump_dir: str = None) -> dict:
+    """
+    Get a dict of text file -> path of its json dump in json_dump_dir, named after the text file. json_dump_dir is
+    created if it doesn't exist.
+
+    If json_dump_dir is None, the json dumps are None. Raises a ValueError if text files with the same name would be
+    written to the same json dump.
+    """
+    json_dumps = {}
+    for text_file in text_files:
+        json_dump = None
+        if json_dump_dir is not None:
+            json_dump = os.path.join(json_dump_dir, os.path.splitext(os.path.basename(text_file))[0] + '.json')
+            if json_dump in json_dumps.values():
+                raise ValueError(f'Multiple text files would be written to {json_dump}')
+        json_dumps[text_file] = json_dump
+    if json_dump_dir is not None:
+        os.makedirs(json_dump_dir, exist_ok=True)
+    return json_dumps
@@ -1,4 +1,5 @@
-from langchain_text_splitters import TokenTextSplitter
+import bisect
+import re
 
 from phytochemMiner import remove_double_spaces_and_break_characters
 
@@ -14,19 +15,273 @@ def get_txt_from_file(txt_file: str):
     return out
 
 
-def read_file_and_chunk(txt_file: str, context_size: int) -> list:
-    # chunking specific to models: https://python.langchain.com/v0.1/docs/use_cases/extraction/how_to/handle_long_text/
-    text = get_txt_from_file(txt_file)
-    text_splitter = TokenTextSplitter(
-        # Controls the size of each chunk
-        chunk_size=context_size,
-        # Controls overlap between chunks
-        chunk_overlap=500,
-    )
+def read_file_and_chunk(txt_file: str, context_size: int, overlap: int = 500) -> list:
+    """
+    Read a text file and split it into chunks of at most context_size tokens, aligned to sentence boundaries where
+    possible, with up to overlap tokens shared between consecutive chunks. See TokenizedDocument.
+    """
+    document = read_tokenized_file(txt_file)
+    return document.chunks(context_size, overlap=overlap)
+
+
+def read_tokenized_file(txt_file: str, encoding='gpt2'):
+    """
+    Read a text file and tokenize it once, so that it can be chunked at different sizes. See TokenizedDocument.
+    """
+    return TokenizedDocument(get_txt_from_file(txt_file), encoding=encoding)
+
+
+# A sentence ends with punctuation followed by whitespace and the start of a new sentence. Requiring an upper case
+# letter, digit or bracket to follow avoids splitting after abbreviations such as 'F. elastica' or 'et al.'
+# Paragraph breaks can't be used, as line breaks are removed by get_txt_from_file.
+_sentence_end = re.compile(r'[.!?](?=\s+[A-Z0-9(\[])')
+
+
+class TokenizedDocument:
+    """
+    A text which is tokenized once, so that it can be chunked (and chunks split again) at different sizes without
+    re-tokenizing it.
+
+    Chunks are given as (start, end) token spans. Chunk ends are moved back to the end of a sentence where one is found
+    in the second half of the chunk, and the next chunk starts at the first sentence within the overlap, so that e.g.
+    compound names aren't cut in half. Chunk text is sliced from the original text using the token offsets.
+    """
+
+    def __init__(self, text: str, encoding='gpt2', tokens: list = None):
+        """
+        :param text: The text, e.g. from get_txt_from_file.
+        :param encoding: The name of a tiktoken encoding, or a tiktoken Encoding. Defaults to the encoding used by
+        langchain's TokenTextSplitter.
+        :param tokens: The tokens of the text, if it has already been encoded.
+        """
+        import tiktoken
+
+        if isinstance(encoding, str):
+            encoding = tiktoken.get_encoding(encoding)
+        self.text = text
+        if tokens is None:
+            # Special tokens are treated as normal text, as they may appear in articles
+            tokens = encoding.encode(text, disallowed_special=())
+        # The character offset of the start of each token, followed by the end of the text
+        _, offsets = encoding.decode_with_offsets(tokens)
+        self._offsets = offsets + [len(text)]
+        # The indices of tokens which start a new sentence
+        self._sentence_starts = sorted(set(bisect.bisect_left(self._offsets, match.end())
+                                           for match in _sentence_end.finditer(text)) - {0, len(tokens)})
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def char_offset(self, token: int) -> int:
+        """
+        Get the character offset in the text of the start of the token at the given index.
+        """
+        return self._offsets[token]
+
+    def span_text(self, span: tuple) -> str:
+        """
+        Get the text of a (start, end) token span.
+        """
+        start, end = span
+        return self.text[self._offsets[start]:self._offsets[end]].strip()
+
+    def _last_sentence_start(self, lower: int, upper: int):
+        # The last sentence start in (lower, upper], or None
+        i = bisect.bisect_right(self._sentence_starts, upper) - 1
+        if i >= 0 and self._sentence_starts[i] > lower:
+            return self._sentence_starts[i]
+        return None
+
+    def _first_sentence_start(self, lower: int, upper: int):
+        # The first sentence start in [lower, upper), or None
+        i = bisect.bisect_left(self._sentence_starts, lower)
+        if i < len(self._sentence_starts) and self._sentence_starts[i] < upper:
+            return self._sentence_starts[i]
+        return None
+
+    def starts_character(self, token: int) -> bool:
+        """
+        Whether the token at the given index starts at the start of a character, rather than part way through a
+        character made of several tokens.
+        """
+        # Tokens within a character are given the offset of the character, see tiktoken's decode_with_offsets
+        return token == 0 or self._offsets[token] > self._offsets[token - 1]
+
+    def chunk_spans(self, chunk_size: int, overlap: int = 500, start: int = 0) -> list:
+        """
+        Split the document into token spans of at most chunk_size tokens, with up to overlap tokens shared between
+        consecutive spans.
+
+        :param start: The token to start the first span at.
+        """
+        if chunk_size <= overlap:
+            raise ValueError(f'Chunk size ({chunk_size}) must be larger than the overlap ({overlap})')
+        spans = []
+        while start < len(self):
+            end = min(start + chunk_size, len(self))
+            if end < len(self):
+                sentence_start = self._last_sentence_start(start + chunk_size // 2, end)
+                if sentence_start is not None:
+                    end = sentence_start
+            spans.append((start, end))
+            if end == len(self):
+                break
+            next_start = max(end - overlap, start + 1)
+            sentence_start = self._first_sentence_start(next_start, end)
+            start = sentence_start if sentence_start is not None else next_start
+        return spans
+
+    def chunks(self, chunk_size: int, overlap: int = 500) -> list:
+        """
+        Split the document into chunks of text of at most chunk_size tokens, see chunk_spans.
+        """
+        return [self.span_text(span) for span in self.chunk_spans(chunk_size, overlap=overlap)]
+
+    def split_span(self, span: tuple, overlap: int = 100) -> list:
+        """
+        Split a token span in two, at the sentence start closest to its middle token if there is one in the middle half
+        of the span. The halves share overlap tokens either side of the split, up to a quarter of the span, so that
+        both halves are always shorter than the span. Spans too short to be split are returned on their own.
+        """
+        start, end = span
+        length = end - start
+        if length <= overlap or length < 2:
+            return [span]
+        overlap = min(overlap, length // 4)
+        middle = start + length // 2
+        candidates = [s for s in [self._last_sentence_start(start + length // 4, middle),
+                                  self._first_sentence_start(middle, end - length // 4)] if s is not None]
+        if len(candidates) > 0:
+            middle = min(candidates, key=lambda s: abs(s - middle))
+        return [(start, min(middle + overlap // 2, end)), (max(middle - overlap // 2, start), end)]
 
-    texts = text_splitter.split_text(text)
 
-    return texts
+def iter_normalised_text(txt_file: str, block_size: int = 2 ** 20):
+    """
+    Read a text file incrementally, yielding pieces of text which join to give the same text as get_txt_from_file.
+
+    Only one block of block_size characters is held in memory at a time, so this can be used for very large files.
+    """
+    started = False
+    carry = ''
+    with open(txt_file, "r", encoding="utf8") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            words = (carry + block).split()
+            # The last word may continue in the next block
+            carry = words.pop() if len(words) > 0 and not block[-1].isspace() else ''
+            if len(words) > 0:
+                yield (' ' if started else '') + ' '.join(words)
+                started = True
+    if carry:
+        yield (' ' if started else '') + carry
+
+
+def iter_file_chunks(txt_file: str, context_size: int, overlap: int = 500, encoding='gpt2',
+                     block_size: int = 2 ** 20):
+    """
+    Read a text file incrementally and yield the same chunks as read_file_and_chunk, holding at most a block of text
+    and the end of the previous chunk in memory at once.
+
+    :param txt_file: The text file.
+    :param context_size: The maximum number of tokens in a chunk.
+    :param overlap: The maximum number of tokens shared between consecutive chunks.
+    :param encoding: The tiktoken encoding, see TokenizedDocument.
+    :param block_size: The number of characters read from the file at once. This should be several times the number
+    of characters in a chunk, so that each block gives complete chunks.
+    """
+    import tiktoken
+
+    if isinstance(encoding, str):
+        encoding = tiktoken.get_encoding(encoding)
+    text = ''
+    tokens = []
+    # The token the next chunk starts at
+    start = 0
+    for piece in iter_normalised_text(txt_file, block_size=block_size):
+        text += piece
+        # Pieces end at the end of a word, so encoding them separately gives the same tokens as the whole text
+        tokens.extend(encoding.encode(piece, disallowed_special=()))
+        document = TokenizedDocument(text, encoding=encoding, tokens=tokens)
+        spans = document.chunk_spans(context_size, overlap=overlap, start=start)
+        if len(spans) > 1:
+            # The last chunk may be extended by the following text, so is chunked again with it
+            for span in spans[:-1]:
+                yield document.span_text(span)
+            start = spans[-1][0]
+            # Keep the tokens from the start of the last chunk, rather than encoding its text again, which may
+            # give different tokens. Text is only cut between characters.
+            cut = start
+            while not document.starts_character(cut):
+                cut -= 1
+            text = text[document.char_offset(cut):]
+            tokens = tokens[cut:]
+            start -= cut
+    if text.strip():
+        document = TokenizedDocument(text, encoding=encoding, tokens=tokens)
+        for span in document.chunk_spans(context_size, overlap=overlap, start=start):
+            yield document.span_text(span)
+
+
+# Ways of storing the text of a document in its outputs, see store_output_text
+text_storage_options = ('full', 'reference', 'sidecar')
+
+
+def store_output_text(output, text: str, text_file: str, text_storage: str = 'full', json_dump: str = None):
+    """
+    Store the text an output was extracted from in the output.
+
+    With text_storage='full' the whole text is stored in output.text. Otherwise, a sha256 hash of the text is stored in
+    output.text_sha256 and the path to read it from in output.text_path, which is either the original text_file
+    ('reference') or a gzipped copy of the text written alongside the json_dump ('sidecar'). Use get_output_text to
+    get the text back.
+    """
+    import hashlib
+    import os
+
+    if text_storage == 'full':
+        output.text = text
+        return
+    if text_storage == 'reference':
+        text_path = text_file
+    elif text_storage == 'sidecar':
+        if json_dump is None:
+            raise ValueError('A json_dump is needed to store text in a sidecar file')
+        import gzip
+        text_path = os.path.splitext(json_dump)[0] + '.txt.gz'
+        with gzip.open(text_path, 'wt', encoding='utf8') as f:
+            f.write(text)
+    else:
+        raise ValueError(f'Unknown text_storage: {text_storage}. Should be one of {text_storage_options}')
+    output.text_sha256 = hashlib.sha256(text.encode('utf8')).hexdigest()
+    output.text_path = os.path.abspath(text_path)
+
+
+def get_output_text(output) -> str:
+    """
+    Get the text an output was extracted from, however it was stored (see store_output_text).
+
+    Referenced text is only read when this is called, and is checked against the stored hash.
+    """
+    text = getattr(output, 'text', None)
+    if text is not None:
+        return text
+    text_path = getattr(output, 'text_path', None)
+    if text_path is None:
+        raise ValueError('Output has no stored text')
+    if text_path.endswith('.gz'):
+        import gzip
+        with gzip.open(text_path, 'rt', encoding='utf8') as f:
+            text = f.read()
+    else:
+        text = get_txt_from_file(text_path)
+
+    import hashlib
+    if hashlib.sha256(text.encode('utf8')).hexdigest() != output.text_sha256:
+        raise ValueError(f'Text in {text_path} has changed since the output was created')
+    return text
 
 
 def split_text_chunks(text_chunks, overlap=500):
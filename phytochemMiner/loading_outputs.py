@@ -0,0 +1,68 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List
+
+import pandas as pd
+
+from phytochemMiner import Taxon, TaxaData, flatten_taxa_data
+
+
+def _read_json_dump(json_dump: str, include_text: bool, validate: bool) -> TaxaData:
+    with open(json_dump, "r") as file_:
+        json_dict = json.load(file_)
+    if not include_text:
+        json_dict.pop('text', None)
+    if validate:
+        return TaxaData.model_validate(json_dict)
+    taxa = json_dict.pop('taxa', None)
+    if taxa is not None:
+        taxa = [Taxon.model_construct(**taxon) for taxon in taxa]
+    return TaxaData.model_construct(taxa=taxa, **json_dict)
+
+
+def _get_paper_id(json_dump: str) -> str:
+    # Json dumps are named after their text files, see run_phytochem_model_on_corpus
+    return os.path.splitext(os.path.basename(json_dump))[0]
+
+
+def _load_json_dump_batch(json_dumps: List[str], include_text: bool, validate: bool, flatten: bool):
+    outputs = [_read_json_dump(json_dump, include_text, validate) for json_dump in json_dumps]
+    if flatten:
+        # Flatten in the worker, so only the rows are sent back
+        return flatten_taxa_data({_get_paper_id(json_dump): output for json_dump, output in zip(json_dumps, outputs)})
+    return outputs
+
+
+def load_json_dumps(json_dumps, include_text: bool = True, validate: bool = True, as_dataframe: bool = False,
+                    max_workers: int = None, batch_size: int = 64):
+    """
+    Load many json dumps, e.g. from run_phytochem_model_on_corpus, in parallel over a pool of processes.
+
+    :param json_dumps: A list of json dumps, or a directory of them.
+    :param include_text: Whether to keep the text stored in each output. Outputs are much smaller without it.
+    :param validate: Whether to validate the outputs. If False, outputs are built with model_construct, which is much
+    faster but should only be used for trusted dumps written by this package.
+    :param as_dataframe: If True, return the occurrences in the outputs as a DataFrame (see flatten_taxa_data), with
+    the name of each json dump (without its extension) as the paper id.
+    :param max_workers: The maximum number of processes to use. Defaults to the number of CPUs.
+    :param batch_size: The number of json dumps loaded by a process at once.
+    :return: A list of TaxaData in the same order as json_dumps, or a DataFrame if as_dataframe is True.
+    """
+    if isinstance(json_dumps, str):
+        json_dumps = sorted(os.path.join(json_dumps, f) for f in os.listdir(json_dumps) if f.endswith('.json'))
+    batches = [json_dumps[i:i + batch_size] for i in range(0, len(json_dumps), batch_size)]
+    load_batch = partial(_load_json_dump_batch, include_text=include_text, validate=validate, flatten=as_dataframe)
+
+    if len(batches) <= 1 or max_workers == 1:
+        results = [load_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(load_batch, batches))
+
+    if as_dataframe:
+        if len(results) == 0:
+            return flatten_taxa_data({})
+        return pd.concat(results, ignore_index=True)
+    return [output for batch in results for output in batch]
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from typing import List
+
+import pandas as pd
+
+from phytochemMiner import TaxaData, flatten_taxa_data, occurrence_columns
+
+
+def _get_schema():
+    import pyarrow as pa
+
+    return pa.schema([(column, pa.string()) for column in occurrence_columns])
+
+
+def _get_part_files(dataset_dir: str) -> list:
+    # Part names start with the time they were written, so sorting them gives the order they were written in
+    return sorted(os.path.join(dataset_dir, f) for f in os.listdir(dataset_dir) if f.endswith('.parquet'))
+
+
+class OccurrenceDatasetWriter:
+    """
+    Write the occurrences in outputs (see flatten_taxa_data) to a Parquet dataset as they are produced, so that the
+    occurrences of a whole corpus can be loaded at once with read_occurrence_dataset rather than from every json dump.
+
+    Occurrences are buffered and written to a new part file of the dataset whenever rows_per_part rows have been added,
+    and when the writer is closed. Each part is written atomically, so the dataset can be read while a run is going.
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, dataset_dir: str, rows_per_part: int = 100000):
+        """
+        :param dataset_dir: Directory of the dataset, which is created if it doesn't exist. Parts are added to any
+        already in the directory.
+        :param rows_per_part: The number of occurrences to buffer before writing a part.
+        """
+        self.dataset_dir = dataset_dir
+        self.rows_per_part = rows_per_part
+        self._buffer = []
+        self._buffered_rows = 0
+        self._lock = threading.Lock()
+        os.makedirs(dataset_dir, exist_ok=True)
+
+    def add(self, paper_id: str, output: TaxaData):
+        """
+        Add the occurrences in the output of a paper.
+        """
+        occurrences = flatten_taxa_data({paper_id: output})
+        with self._lock:
+            self._buffer.append(occurrences)
+            self._buffered_rows += len(occurrences)
+            if self._buffered_rows >= self.rows_per_part:
+                self._write_part()
+
+    def flush(self):
+        """
+        Write any buffered occurrences to a new part.
+        """
+        with self._lock:
+            self._write_part()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_part(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._buffered_rows == 0:
+            self._buffer = []
+            return
+        occurrences = pd.concat(self._buffer, ignore_index=True)
+        table = pa.Table.from_pandas(occurrences, schema=_get_schema(), preserve_index=False)
+        part_name = f'part-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}'
+        temp_file = os.path.join(self.dataset_dir, f'{part_name}.tmp')
+        pq.write_table(table, temp_file)
+        os.replace(temp_file, os.path.join(self.dataset_dir, f'{part_name}.parquet'))
+        self._buffer = []
+        self._buffered_rows = 0
+
+
+def read_occurrence_dataset(dataset_dir: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Load the occurrences written by OccurrenceDatasetWriter, e.g. during run_phytochem_model_on_corpus.
+
+    If a paper was written more than once, e.g. when files were rerun, only the rows from its latest part are kept.
+
+    Requires pyarrow.
+
+    :param dataset_dir: Directory of the dataset.
+    :param columns: Columns to load. Defaults to all of occurrence_columns.
+    :return: A DataFrame of occurrences, as from flatten_taxa_data.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = list(columns or occurrence_columns)
+    read_columns = columns if 'paper_id' in columns else ['paper_id'] + columns
+    part_files = _get_part_files(dataset_dir)
+    if len(part_files) == 0:
+        return pd.DataFrame(columns=columns)
+
+    tables = [pq.read_table(part_file, columns=read_columns, schema=_get_schema()) for part_file in part_files]
+    occurrences = pa.concat_tables(tables).to_pandas()
+    part_numbers = pd.Series(range(len(tables))).repeat([table.num_rows for table in tables]).to_numpy()
+
+    # Drop rows of papers which appear in a later part
+    latest_part = pd.Series(part_numbers).groupby(occurrences['paper_id'].to_numpy()).transform('max').to_numpy()
+    occurrences = occurrences[part_numbers == latest_part].reset_index(drop=True)
+    return occurrences[columns]
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from tqdm import tqdm
+
+from phytochemMiner import TaxaData, get_txt_from_file, store_output_text, add_accepted_info_to_outputs, \
+    add_inchi_keys_to_outputs, extract_from_text_file, deduplicate_extractions
+from phytochemMiner import load_json_dump, write_json_dump, get_json_dumps, write_file_atomically
+
+# Stages of the pipeline, in order. The artifacts of each stage are written to a subdirectory of the artifact
+# directory with the stage's name
+EXTRACTION_STAGE = 'extracted'
+DEDUPLICATION_STAGE = 'deduplicated'
+ACCEPTED_NAMES_STAGE = 'accepted_names'
+COMPOUNDS_STAGE = 'compounds'
+pipeline_stages = (EXTRACTION_STAGE, DEDUPLICATION_STAGE, ACCEPTED_NAMES_STAGE, COMPOUNDS_STAGE)
+
+
+def get_stage_artifacts(text_files: list, artifact_dir: str, stage: str) -> dict:
+    """
+    Get a dict of text file -> path of the artifact written for it by the given stage.
+    """
+    if stage not in pipeline_stages:
+        raise ValueError(f'Unknown stage: {stage}. Should be one of {pipeline_stages}')
+    return get_json_dumps(text_files, os.path.join(artifact_dir, stage))
+
+
+def _is_up_to_date(input_path: str, output_path: str) -> bool:
+    # Outputs written after their inputs were last changed don't need to be remade
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+
+def _get_files_to_run(inputs: dict, outputs: dict, rerun: bool) -> list:
+    files_to_run = []
+    for text_file, input_path in inputs.items():
+        if not os.path.exists(input_path):
+            print(f'WARNING: skipping {text_file} as {input_path} does not exist. Has the previous stage been run?')
+        elif rerun or not _is_up_to_date(input_path, outputs[text_file]):
+            files_to_run.append(text_file)
+    return files_to_run
+
+
+def _map_files(func, text_files: list, max_workers: int) -> tuple:
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {text_file: executor.submit(func, text_file) for text_file in text_files}
+        for text_file, future in tqdm(futures.items(), total=len(futures)):
+            try:
+                results[text_file] = future.result()
+            except Exception as e:
+                print(f'WARNING: failed to process {text_file}: {e}')
+                errors[text_file] = e
+    return results, errors
+
+
+def run_extraction_stage(model, text_files: list, context_window: int, artifact_dir: str, max_concurrency: int = 8,
+                         rate_limiter=None, rerun: bool = False, single_chunk: bool = True,
+                         max_chunk_concurrency: int = 4, max_split_depth: int = 3, chunk_overlap: int = 500,
+                         response_cache=None) -> dict:
+    """
+    Get the model's outputs for each chunk of each text file, before any post-processing, as in run_phytochem_model.
+
+    This is the only stage which makes requests to the model, so files are only extracted again if their text file
+    has changed since they were last extracted, or rerun is True.
+
+    :return: A dict of text file -> Exception for files which failed.
+    """
+    text_file_paths = {text_file: text_file for text_file in text_files}
+    artifacts = get_stage_artifacts(text_files, artifact_dir, EXTRACTION_STAGE)
+    if rate_limiter is not None:
+        model = model.model_copy(update={'rate_limiter': rate_limiter})
+
+    def extract(text_file):
+        extractions, split_depth, _ = extract_from_text_file(
+            model, text_file, context_window, single_chunk=single_chunk, max_chunk_concurrency=max_chunk_concurrency,
+            max_split_depth=max_split_depth, chunk_overlap=chunk_overlap, response_cache=response_cache)
+        _write_artifact({'text_file': text_file, 'chunk_split_depth': split_depth,
+                         'extractions': [e.model_dump(mode='json') if e is not None else None for e in extractions]},
+                        artifacts[text_file])
+
+    _, errors = _map_files(extract, _get_files_to_run(text_file_paths, artifacts, rerun), max_concurrency)
+    return errors
+
+
+def run_deduplication_stage(text_files: list, artifact_dir: str, single_chunk: bool = True,
+                            text_storage: str = 'full', max_workers: int = 8, rerun: bool = False) -> dict:
+    """
+    Deduplicate and standardise the taxa extracted from each text file, and store the text in the output (see
+    store_output_text).
+
+    :return: A dict of text file -> Exception for files which failed.
+    """
+    inputs = get_stage_artifacts(text_files, artifact_dir, EXTRACTION_STAGE)
+    artifacts = get_stage_artifacts(text_files, artifact_dir, DEDUPLICATION_STAGE)
+
+    def deduplicate(text_file):
+        with open(inputs[text_file], 'r') as file_:
+            extracted = json.load(file_)
+        extractions = [TaxaData.model_validate(e) if e is not None else None for e in extracted['extractions']]
+        output = deduplicate_extractions(extractions, reconcile_chunks=not single_chunk)
+        output.chunk_split_depth = extracted['chunk_split_depth']
+        store_output_text(output, get_txt_from_file(text_file), text_file, text_storage, artifacts[text_file])
+        write_json_dump(output, artifacts[text_file])
+
+    _, errors = _map_files(deduplicate, _get_files_to_run(inputs, artifacts, rerun), max_workers)
+    return errors
+
+
+def _run_batched_stage(add_info, text_files: list, artifact_dir: str, input_stage: str, output_stage: str,
+                       max_workers: int, rerun: bool, batch_size: int) -> dict:
+    # Load outputs with a pool of workers, add info to each batch at once and write the outputs of the batch. If adding
+    # info fails, every file in the batch is given the error
+    inputs = get_stage_artifacts(text_files, artifact_dir, input_stage)
+    artifacts = get_stage_artifacts(text_files, artifact_dir, output_stage)
+    files_to_run = _get_files_to_run(inputs, artifacts, rerun)
+    errors = {}
+    for i in range(0, len(files_to_run), batch_size):
+        outputs, load_errors = _map_files(lambda text_file: load_json_dump(inputs[text_file]),
+                                          files_to_run[i:i + batch_size], max_workers)
+        errors.update(load_errors)
+        try:
+            add_info(list(outputs.values()))
+        except Exception as e:
+            print(f'WARNING: failed to process a batch of {len(outputs)} files: {e}')
+            errors.update({text_file: e for text_file in outputs})
+            continue
+        _, write_errors = _map_files(lambda text_file: write_json_dump(outputs[text_file], artifacts[text_file]),
+                                     list(outputs), max_workers)
+        errors.update(write_errors)
+    return errors
+
+
+def run_accepted_names_stage(text_files: list, artifact_dir: str, wcvp: pd.DataFrame, wcvp_version: str = None,
+                             max_workers: int = 8, rerun: bool = False, batch_size: int = 1000) -> dict:
+    """
+    Add accepted names to the deduplicated outputs, matching the names in each batch of files to the WCVP at once (see
+    add_accepted_info_to_outputs).
+
+    Rerun this stage when the WCVP is updated.
+
+    :return: A dict of text file -> Exception for files which failed.
+    """
+    return _run_batched_stage(
+        lambda outputs: add_accepted_info_to_outputs(outputs, wcvp, wcvp_version=wcvp_version), text_files,
+        artifact_dir, DEDUPLICATION_STAGE, ACCEPTED_NAMES_STAGE, max_workers, rerun, batch_size)
+
+
+def run_compounds_stage(text_files: list, artifact_dir: str, max_workers: int = 8, rerun: bool = False,
+                        batch_size: int = 1000) -> dict:
+    """
+    Add InChIKeys to the outputs with accepted names, resolving the compounds in each batch of files at once (see
+    add_inchi_keys_to_outputs).
+
+    Rerun this stage to retry compounds which couldn't be resolved.
+
+    :return: A dict of text file -> Exception for files which failed.
+    """
+    return _run_batched_stage(lambda outputs: add_inchi_keys_to_outputs(outputs, max_workers=max_workers), text_files,
+                              artifact_dir, ACCEPTED_NAMES_STAGE, COMPOUNDS_STAGE, max_workers, rerun, batch_size)
+
+
+def serialise_outputs(text_files: list, artifact_dir: str, json_dump_dir: str) -> dict:
+    """
+    Copy the final outputs to json_dump_dir, as written by run_phytochem_model_on_corpus.
+
+    :return: A dict of text file -> final output path, for files which have been through every stage.
+    """
+    inputs = get_stage_artifacts(text_files, artifact_dir, COMPOUNDS_STAGE)
+    json_dumps = get_json_dumps(text_files, json_dump_dir)
+    written = {}
+    for text_file in text_files:
+        if os.path.exists(inputs[text_file]):
+            if not _is_up_to_date(inputs[text_file], json_dumps[text_file]):
+                _copy_atomic(inputs[text_file], json_dumps[text_file])
+            written[text_file] = json_dumps[text_file]
+    return written
+
+
+def run_pipeline(model, text_files: list, context_window: int, wcvp: pd.DataFrame, artifact_dir: str,
+                 json_dump_dir: str, wcvp_version: str = None, max_concurrency: int = 8, rate_limiter=None,
+                 single_chunk: bool = True, text_storage: str = 'full', response_cache=None,
+                 rerun_from: str = None) -> dict:
+    """
+    Run every stage of the pipeline over a corpus, persisting the artifacts of each stage in artifact_dir, and write the
+    final outputs to json_dump_dir.
+
+    Stages are skipped for files whose artifacts are up to date, so e.g. after updating the WCVP only the accepted name
+    and compound stages need to be run again, with rerun_from=ACCEPTED_NAMES_STAGE. Each stage can also be run on its
+    own with the run_*_stage functions.
+
+    :return: A dict of stage -> dict of text file -> Exception for files which failed at each stage.
+    """
+    if rerun_from is not None and rerun_from not in pipeline_stages:
+        raise ValueError(f'Unknown stage: {rerun_from}. Should be one of {pipeline_stages}')
+    rerun = {stage: rerun_from is not None and pipeline_stages.index(stage) >= pipeline_stages.index(rerun_from)
+             for stage in pipeline_stages}
+
+    errors = {EXTRACTION_STAGE: run_extraction_stage(model, text_files, context_window, artifact_dir,
+                                                     max_concurrency=max_concurrency, rate_limiter=rate_limiter,
+                                                     rerun=rerun[EXTRACTION_STAGE], single_chunk=single_chunk,
+                                                     response_cache=response_cache)}
+    errors[DEDUPLICATION_STAGE] = run_deduplication_stage(text_files, artifact_dir, single_chunk=single_chunk,
+                                                          text_storage=text_storage,
+                                                          rerun=rerun[DEDUPLICATION_STAGE])
+    errors[ACCEPTED_NAMES_STAGE] = run_accepted_names_stage(text_files, artifact_dir, wcvp, wcvp_version=wcvp_version,
+                                                            rerun=rerun[ACCEPTED_NAMES_STAGE])
+    errors[COMPOUNDS_STAGE] = run_compounds_stage(text_files, artifact_dir, rerun=rerun[COMPOUNDS_STAGE])
+    serialise_outputs(text_files, artifact_dir, json_dump_dir)
+    return errors
+
+
+def _write_artifact(artifact: dict, path: str):
+    def write(temp_file: str):
+        with open(temp_file, 'w') as file_:
+            json.dump(artifact, file_)
+
+    write_file_atomically(path, write)
+
+
+def _copy_atomic(source: str, destination: str):
+    write_file_atomically(destination, lambda temp_file: shutil.copyfile(source, temp_file))
@@ -0,0 +1,195 @@
+import asyncio
+import random
+import threading
+import time
+import urllib.error
+from email.utils import parsedate_to_datetime
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+# Status codes which indicate that a request may succeed if tried again later
+_retryable_status_codes = {408, 429, 500, 502, 503, 504}
+
+
+def get_status_code(error: Exception):
+    """
+    Get the HTTP status code from errors raised by urllib, pubchempy or HTTP clients used by langchain models.
+    """
+    for attribute in ['code', 'status_code']:
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def _get_headers(error):
+    headers = getattr(error, 'headers', None)
+    if headers is None:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+    return headers
+
+
+def get_retry_after(error: Exception):
+    """
+    Get the number of seconds to wait from the Retry-After header of a failed response, if given.
+    """
+    headers = _get_headers(error)
+    if headers is None:
+        # pubchempy errors don't keep the headers, but are raised from the urllib error which does
+        headers = _get_headers(error.__cause__)
+    if headers is None:
+        return None
+    retry_after = headers.get('Retry-After')
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        # Can also be given as an HTTP date
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable_error(error: Exception):
+    """
+    Whether an error is likely to be transient, i.e. rate limiting, server errors or network problems.
+    """
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in _retryable_status_codes
+    if isinstance(error, (urllib.error.URLError, ConnectionError, TimeoutError)):
+        return True
+    # e.g. openai.RateLimitError, openai.APIConnectionError and openai.APITimeoutError from models
+    return any(s in type(error).__name__ for s in ['RateLimit', 'Connection', 'Timeout'])
+
+
+class ServiceRateLimiter(BaseRateLimiter):
+    """
+    A thread-safe rate limiter for requests to a single service.
+
+    Requests are limited with a token bucket, and when requests fail with transient errors all users of the limiter
+    back off together, using exponential backoff with jitter or the service's Retry-After header where given.
+
+    As this is a langchain rate limiter, it can also be given to chat models to limit requests to LLM providers.
+    """
+
+    def __init__(self, requests_per_second: float, max_bucket_size: float = 1, base_backoff: float = 0.5,
+                 max_backoff: float = 60, max_retries: int = 5):
+        """
+        :param requests_per_second: The sustained rate at which requests are allowed.
+        :param max_bucket_size: The maximum number of requests that can be made in a burst.
+        :param base_backoff: The backoff in seconds after the first failure, doubled for each consecutive failure.
+        :param max_backoff: The maximum backoff in seconds.
+        :param max_retries: The number of times a failed request is retried by `call` and `retry`.
+        """
+        self.requests_per_second = requests_per_second
+        self.max_bucket_size = max_bucket_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._tokens = max_bucket_size
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._consecutive_failures = 0
+
+    def _time_until_available(self) -> float:
+        """Take a token if one is available, otherwise return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._tokens = min(self.max_bucket_size,
+                               self._tokens + (now - self._last_refill) * self.requests_per_second)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.requests_per_second
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._time_until_available()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            wait = self._time_until_available()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+
+    def report_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+    def report_failure(self, retry_after: float = None):
+        """
+        Back off all requests after a transient failure.
+
+        :param retry_after: The minimum time to wait in seconds, e.g. from a Retry-After header.
+        """
+        with self._lock:
+            self._consecutive_failures += 1
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_failures - 1))
+            # Full jitter, so that workers which failed together don't all retry at once
+            delay = random.uniform(0, backoff)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def retry(self, func, *args, **kwargs):
+        """
+        Call func, retrying with backoff if it raises a transient error. func is expected to acquire from this limiter
+        itself, e.g. when calling a model that was given this limiter. The error is raised when retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                self.report_failure(get_retry_after(e))
+                attempt += 1
+            else:
+                self.report_success()
+                return result
+
+    async def aretry(self, func, *args, **kwargs):
+        """
+        Async version of retry, for coroutine functions.
+        """
+        attempt = 0
+        while True:
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                self.report_failure(get_retry_after(e))
+                attempt += 1
+            else:
+                self.report_success()
+                return result
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func once a request is allowed, retrying with backoff if it raises a transient error.
+        """
+
+        def acquire_and_call():
+            self.acquire()
+            return func(*args, **kwargs)
+
+        return self.retry(acquire_and_call)
@@ -1,96 +1,592 @@
+import asyncio
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import langchain_core
 import pandas as pd
 import pydantic_core
+from tqdm import tqdm
 
-from phytochemMiner import read_file_and_chunk, standard_prompt, TaxaData, \
-    deduplicate_and_standardise_output_taxa_lists, get_txt_from_file
-from phytochemMiner import add_inchi_keys, add_all_extra_info_to_output
+from phytochemMiner import read_tokenized_file, store_output_text, standard_prompt, TaxaData, deduplicate_extractions
+from phytochemMiner import load_json_dump, write_json_dump, get_json_dumps
+from phytochemMiner import add_inchi_keys, add_accepted_info, aadd_inchi_keys, resolve_names_to_inchi, set_inchi_keys, \
+    ServiceRateLimiter, is_retryable_error, get_retry_after, SQLiteTranslationCache, translation_cache_db
+from phytochemMiner import CorpusManifest, CHUNKED, EXTRACTED, TAXA_RESOLVED, INCHI_RESOLVED
+from phytochemMiner import OccurrenceDatasetWriter, read_occurrence_dataset
+
+# Structured outputs of the model for each chunk, see get_model_response_cache
+model_response_cache_db = os.path.join(os.path.dirname(translation_cache_db), 'model_response_cache.sqlite')
 
 
 def run_phytochem_model(model, text_file: str, context_window: int, wcvp: pd.DataFrame, json_dump: str = None,
-                        single_chunk: bool = True, rerun=True, rerun_inchi_resolution: bool = True) -> TaxaData:
-    if not rerun and os.path.exists(json_dump):
-        with open(json_dump, "r") as file_:
-            json_dict = json.load(file_)
-            output = TaxaData.model_validate(json_dict)
-        if rerun_inchi_resolution:
-            add_inchi_keys(output)
-            with open(json_dump, "w") as file_:
-                json_out = output.model_dump(mode="json")
-                json.dump(json_out, file_)
-        return output
-
-    if not single_chunk:
-        raise NotImplementedError
-    text_chunks = read_file_and_chunk(text_file, context_window)
+                        single_chunk: bool = True, rerun=True, rerun_inchi_resolution: bool = True,
+                        wcvp_version: str = None, max_chunk_concurrency: int = 4,
+                        max_split_depth: int = 3, chunk_overlap: int = 500, text_storage: str = 'full',
+                        response_cache=None, manifest: CorpusManifest = None) -> TaxaData:
+    """
+    Extract phytochemical occurrences from a text file and add accepted names and InChIKeys to the output.
+
+    Texts which don't fit in the context window are split into chunks aligned to sentences, sharing up to
+    chunk_overlap tokens, which are sent to the model concurrently (up to max_chunk_concurrency at once) and their
+    outputs merged. With single_chunk=False, long documents are expected
+    to be split, and taxa from different chunks are also reconciled (see reconcile_taxa_across_chunks).
+
+    When a chunk's output can't be parsed or is cut off by the model's max output tokens, the chunk is split in two
+    and the halves retried concurrently, up to max_split_depth times. Outputs which were cut off are kept if their chunk
+    can't be split any further. The text is only tokenized once for this. The depth reached is recorded in the output's
+    chunk_split_depth.
+
+    The text is stored in the output according to text_storage, see store_output_text. By default the whole text is
+    stored, but for large corpora only a reference to it can be stored instead.
+
+    If a response_cache is given (e.g. from get_model_response_cache), the model's output for each chunk is cached, so
+    that rerunning unchanged chunks with the same prompt and model makes no requests to the model.
+
+    If a manifest is given, the output is written to the json_dump after each stage and the stage recorded in the
+    manifest, and stages the file has already reached are skipped. See resume_corpus_run.
+    """
+    _check_manifest_json_dump(manifest, json_dump)
+    if _has_reached(manifest, text_file, json_dump, EXTRACTED):
+        deduplicated_extractions = load_json_dump(json_dump)
+    else:
+        if not rerun and os.path.exists(json_dump):
+            output = load_json_dump(json_dump)
+            if rerun_inchi_resolution:
+                add_inchi_keys(output)
+                write_json_dump(output, json_dump)
+            if manifest is not None:
+                manifest.set_stage(text_file, INCHI_RESOLVED)
+            return output
+
+        extractions, split_depth, document = extract_from_text_file(
+            model, text_file, context_window, single_chunk=single_chunk, max_chunk_concurrency=max_chunk_concurrency,
+            max_split_depth=max_split_depth, chunk_overlap=chunk_overlap, response_cache=response_cache,
+            manifest=manifest)
+
+        deduplicated_extractions = deduplicate_extractions(extractions, reconcile_chunks=not single_chunk)
+        deduplicated_extractions.chunk_split_depth = split_depth
+        store_output_text(deduplicated_extractions, document.text, text_file, text_storage, json_dump)
+        _checkpoint(deduplicated_extractions, text_file, json_dump, manifest, EXTRACTED)
+
+    if not _has_reached(manifest, text_file, json_dump, TAXA_RESOLVED):
+        add_accepted_info(deduplicated_extractions, wcvp, wcvp_version=wcvp_version)
+        _checkpoint(deduplicated_extractions, text_file, json_dump, manifest, TAXA_RESOLVED)
+    if not _has_reached(manifest, text_file, json_dump, INCHI_RESOLVED):
+        add_inchi_keys(deduplicated_extractions)
+        _checkpoint(deduplicated_extractions, text_file, json_dump, manifest, INCHI_RESOLVED)
+
+    if json_dump and manifest is None:
+        write_json_dump(deduplicated_extractions, json_dump)
+
+    return deduplicated_extractions
+
+
+def extract_from_text_file(model, text_file: str, context_window: int, single_chunk: bool = True,
+                           max_chunk_concurrency: int = 4, max_split_depth: int = 3, chunk_overlap: int = 500,
+                           response_cache=None, manifest: CorpusManifest = None) -> tuple:
+    """
+    The extraction stage of run_phytochem_model: chunk the text file and get the model's output for each chunk.
+
+    Returns:
+    tuple
+        The list of outputs for each chunk (before deduplication), the depth of chunk splitting reached and the
+        TokenizedDocument of the text.
+    """
+    document = read_tokenized_file(text_file)
+    chunk_spans = document.chunk_spans(context_window, overlap=chunk_overlap)
+    if manifest is not None:
+        manifest.set_stage(text_file, CHUNKED)
     if single_chunk:
         # For most of analysis, will be testing on single chunks as this is how we've annotated them.
         # In this instance, the chunks should fit in the context window
-        if not len(text_chunks) == 1:
+        if not len(chunk_spans) == 1:
+            print(f'splitting chunks for {text_file}')
+    extractor = _get_extractor(model, response_cache)
+    extractions, split_depth = _extract_from_chunks(model, extractor, document, chunk_spans, max_chunk_concurrency,
+                                                    text_file, max_split_depth=max_split_depth)
+    return extractions, split_depth, document
+
+
+async def arun_phytochem_model(model, text_file: str, context_window: int, wcvp: pd.DataFrame, json_dump: str = None,
+                               single_chunk: bool = True, rerun=True, rerun_inchi_resolution: bool = True,
+                               wcvp_version: str = None, max_chunk_concurrency: int = 4,
+                               max_split_depth: int = 3, chunk_overlap: int = 500,
+                               text_storage: str = 'full', response_cache=None,
+                               manifest: CorpusManifest = None) -> TaxaData:
+    """
+    Async version of run_phytochem_model, for use within an asyncio event loop.
+
+    Model calls use the async langchain interface and file access, accepted name matching and compound resolution
+    are run in worker threads, so the event loop isn't blocked and many documents can be processed at once.
+    """
+    _check_manifest_json_dump(manifest, json_dump)
+    if await asyncio.to_thread(_has_reached, manifest, text_file, json_dump, EXTRACTED):
+        deduplicated_extractions = await asyncio.to_thread(load_json_dump, json_dump)
+    else:
+        if not rerun and os.path.exists(json_dump):
+            output = await asyncio.to_thread(load_json_dump, json_dump)
+            if rerun_inchi_resolution:
+                await aadd_inchi_keys(output)
+                await asyncio.to_thread(write_json_dump, output, json_dump)
+            if manifest is not None:
+                await asyncio.to_thread(manifest.set_stage, text_file, INCHI_RESOLVED)
+            return output
+
+        document = await asyncio.to_thread(read_tokenized_file, text_file)
+        chunk_spans = document.chunk_spans(context_window, overlap=chunk_overlap)
+        if manifest is not None:
+            await asyncio.to_thread(manifest.set_stage, text_file, CHUNKED)
+        if single_chunk and not len(chunk_spans) == 1:
             print(f'splitting chunks for {text_file}')
+        extractor = _get_extractor(model, response_cache)
+        extractions, split_depth = await _aextract_from_chunks(model, extractor, document, chunk_spans,
+                                                               max_chunk_concurrency, text_file,
+                                                               max_split_depth=max_split_depth)
+
+        deduplicated_extractions = deduplicate_extractions(extractions, reconcile_chunks=not single_chunk)
+        deduplicated_extractions.chunk_split_depth = split_depth
+        await asyncio.to_thread(store_output_text, deduplicated_extractions, document.text, text_file, text_storage,
+                                json_dump)
+        await asyncio.to_thread(_checkpoint, deduplicated_extractions, text_file, json_dump, manifest, EXTRACTED)
+
+    if not await asyncio.to_thread(_has_reached, manifest, text_file, json_dump, TAXA_RESOLVED):
+        await asyncio.to_thread(add_accepted_info, deduplicated_extractions, wcvp, wcvp_version=wcvp_version)
+        await asyncio.to_thread(_checkpoint, deduplicated_extractions, text_file, json_dump, manifest, TAXA_RESOLVED)
+    if not await asyncio.to_thread(_has_reached, manifest, text_file, json_dump, INCHI_RESOLVED):
+        await aadd_inchi_keys(deduplicated_extractions)
+        await asyncio.to_thread(_checkpoint, deduplicated_extractions, text_file, json_dump, manifest, INCHI_RESOLVED)
+
+    if json_dump and manifest is None:
+        await asyncio.to_thread(write_json_dump, deduplicated_extractions, json_dump)
+
+    return deduplicated_extractions
+
+
+def _check_manifest_json_dump(manifest, json_dump: str):
+    if manifest is not None and json_dump is None:
+        raise ValueError('A json_dump is needed to record progress in a manifest')
+
+
+def _has_reached(manifest, text_file: str, json_dump: str, stage: str) -> bool:
+    # Stages are only skipped if their output was written
+    return manifest is not None and manifest.has_reached(text_file, stage) and os.path.exists(json_dump)
+
+
+def _checkpoint(output: TaxaData, text_file: str, json_dump: str, manifest, stage: str):
+    if manifest is not None:
+        write_json_dump(output, json_dump)
+        manifest.set_stage(text_file, stage)
+
+
+def _get_extractor(model, response_cache=None):
     # A few different methods, depending on the specific model are used to get a structured output
     # and this is handled by with_structured_output. See https://python.langchain.com/docs/how_to/structured_output/
-    extractor = standard_prompt | model.with_structured_output(schema=TaxaData, include_raw=False)
+    # The raw output is included so that outputs which are cut off by the model's max output tokens can be detected
+    extractor = standard_prompt | model.with_structured_output(schema=TaxaData, include_raw=True)
+    if response_cache is not None:
+        return _CachedExtractor(extractor, response_cache, _get_response_cache_prefix(model))
+    return extractor
+
+
+def get_model_response_cache(db_path: str = None):
+    """
+    Get a persistent cache of the model's structured output for each chunk, which can be passed as the response_cache
+    of run_phytochem_model and run_phytochem_model_on_corpus.
+
+    Outputs are keyed on a hash of the prompt, output schema, model name and parameters, and the chunk text, so any
+    change to these means chunks are sent to the model again.
+
+    :param db_path: Path to the SQLite database. Defaults to model_response_cache_db.
+    :return: A SQLiteTranslationCache. Any MutableMapping (e.g. a dict) can be used instead.
+    """
+    return SQLiteTranslationCache(db_path or model_response_cache_db, 'model_responses', not_found_ttl=None)
+
+
+def _get_response_cache_prefix(model) -> str:
+    # _identifying_params includes the model name and hyperparameters, e.g. temperature
+    return json.dumps([standard_prompt.pretty_repr(), TaxaData.model_json_schema(), type(model).__name__,
+                       model._identifying_params], sort_keys=True, default=str)
+
+
+class _CachedExtractor:
+    """
+    Wraps an extractor so that outputs for chunks which have been seen before are taken from a cache.
+
+    Only outputs which parsed and weren't cut off are cached.
+    """
+
+    def __init__(self, extractor, response_cache, key_prefix: str):
+        self.extractor = extractor
+        self.response_cache = response_cache
+        self.key_prefix = key_prefix
+
+    def _key(self, input_: dict) -> str:
+        return hashlib.sha256(json.dumps([self.key_prefix, input_['text']]).encode('utf8')).hexdigest()
+
+    def _get_cached(self, keys: list) -> dict:
+        if hasattr(self.response_cache, 'get_many'):
+            cached = self.response_cache.get_many(keys)
+        else:
+            cached = {key: self.response_cache[key] for key in keys if key in self.response_cache}
+        return {key: {'raw': None, 'parsed': TaxaData.model_validate(json.loads(value)) if value != 'null' else None,
+                      'parsing_error': None} for key, value in cached.items()}
+
+    def _cache_result(self, key: str, result):
+        if not isinstance(result, Exception) and not _needs_splitting(result):
+            parsed = result['parsed']
+            self.response_cache[key] = json.dumps(parsed.model_dump(mode='json') if parsed is not None else None)
+
+    def _split_cached(self, inputs: list):
+        keys = [self._key(input_) for input_ in inputs]
+        cached = self._get_cached(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        return keys, [cached.get(key) for key in keys], missing
+
+    def invoke(self, input_: dict, config=None):
+        return self.batch([input_], config)[0]
+
+    async def ainvoke(self, input_: dict, config=None):
+        return (await self.abatch([input_], config))[0]
+
+    def batch(self, inputs: list, config=None, return_exceptions: bool = False) -> list:
+        keys, results, missing = self._split_cached(inputs)
+        if len(missing) > 0:
+            new_results = self.extractor.batch([inputs[i] for i in missing], config,
+                                               return_exceptions=return_exceptions)
+            for i, result in zip(missing, new_results):
+                self._cache_result(keys[i], result)
+                results[i] = result
+        return results
+
+    async def abatch(self, inputs: list, config=None, return_exceptions: bool = False) -> list:
+        keys, results, missing = await asyncio.to_thread(self._split_cached, inputs)
+        if len(missing) > 0:
+            new_results = await self.extractor.abatch([inputs[i] for i in missing], config,
+                                                      return_exceptions=return_exceptions)
+            for i, result in zip(missing, new_results):
+                await asyncio.to_thread(self._cache_result, keys[i], result)
+                results[i] = result
+        return results
+
+
+def _retry_model_call(model, error: Exception, func, *args, **kwargs):
+    # Retry a request which failed with error, e.g. a rate limit error. Requests are paced by the model's rate limiter,
+    # so the failure is reported to it first, so that all workers sharing a ServiceRateLimiter back off before retrying
+    rate_limiter = getattr(model, 'rate_limiter', None)
+    if isinstance(rate_limiter, ServiceRateLimiter):
+        rate_limiter.report_failure(get_retry_after(error))
+        return rate_limiter.retry(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+async def _aretry_model_call(model, error: Exception, func, *args, **kwargs):
+    rate_limiter = getattr(model, 'rate_limiter', None)
+    if isinstance(rate_limiter, ServiceRateLimiter):
+        rate_limiter.report_failure(get_retry_after(error))
+        return await rate_limiter.aretry(func, *args, **kwargs)
+    return await func(*args, **kwargs)
+
+
+# When there is too much info extracted the extractor can't parse the output json.
+# This can also happen because of limits on model max output tokens
+_output_parse_errors = (langchain_core.exceptions.OutputParserException, pydantic_core._pydantic_core.ValidationError)
+
+
+def _needs_splitting(result) -> bool:
+    if isinstance(result, _output_parse_errors):
+        return True
+    if result.get('parsing_error') is not None:
+        return True
+    raw = result.get('raw')
+    # The output was cut off by the model's max output tokens, so may be missing extractions even if it parsed
+    return raw is not None and getattr(raw, 'response_metadata', {}).get('finish_reason') == 'length'
+
+
+def _extract_from_chunks(model, extractor, document, chunk_spans: list, max_concurrency: int, text_file: str,
+                         max_split_depth: int = 3, split_overlap: int = 100) -> tuple:
+    """
+    Run the extractor over the chunks (token spans of the TokenizedDocument) concurrently.
+
+    Chunks whose output can't be parsed or is cut off are split in two (with split_overlap tokens of overlap) and the
+    halves from all such chunks are retried together, up to max_split_depth times. Once a chunk can't be split any
+    further, its output is kept if it was only cut off, and discarded if it couldn't be parsed.
+
+    Returns the extractions and the depth of splitting reached.
+    """
+    extractions = []
+    depth = 0
+    while True:
+        inputs = [{"text": document.span_text(span)} for span in chunk_spans]
+        results = extractor.batch(inputs, {"max_concurrency": max_concurrency}, return_exceptions=True)
+        for i in _get_failed_requests(results):
+            results[i] = _retry_model_call(model, results[i], extractor.invoke, inputs[i])
+        chunk_spans, chunk_extractions = _process_chunk_results(document, chunk_spans, results, text_file,
+                                                                max_split_depth, split_overlap, depth)
+        extractions.extend(chunk_extractions)
+        if len(chunk_spans) == 0:
+            return extractions, depth
+        depth += 1
+
+
+async def _aextract_from_chunks(model, extractor, document, chunk_spans: list, max_concurrency: int, text_file: str,
+                                max_split_depth: int = 3, split_overlap: int = 100) -> tuple:
+    # Async version of _extract_from_chunks, only the requests to the model differ
+    extractions = []
+    depth = 0
+    while True:
+        inputs = [{"text": document.span_text(span)} for span in chunk_spans]
+        results = await extractor.abatch(inputs, {"max_concurrency": max_concurrency}, return_exceptions=True)
+        for i in _get_failed_requests(results):
+            results[i] = await _aretry_model_call(model, results[i], extractor.ainvoke, inputs[i])
+        chunk_spans, chunk_extractions = _process_chunk_results(document, chunk_spans, results, text_file,
+                                                                max_split_depth, split_overlap, depth)
+        extractions.extend(chunk_extractions)
+        if len(chunk_spans) == 0:
+            return extractions, depth
+        depth += 1
+
+
+def _get_failed_requests(results: list) -> list:
+    # Get the indices of results which are transient errors from the model, e.g. rate limiting, so should be retried.
+    # Other errors are raised, apart from parse errors which are handled by splitting the chunk
+    failed_requests = []
+    for i, result in enumerate(results):
+        if isinstance(result, Exception) and not isinstance(result, _output_parse_errors):
+            if not is_retryable_error(result):
+                raise result
+            failed_requests.append(i)
+    return failed_requests
+
+
+def _process_chunk_results(document, chunk_spans: list, results: list, text_file: str, max_split_depth: int,
+                           split_overlap: int, depth: int) -> tuple:
+    # Get the outputs of the chunks, and the spans to retry from splitting the chunks whose output failed
+    extractions = []
+    split_spans = []
+    for span, result in zip(chunk_spans, results):
+        if not _needs_splitting(result):
+            extractions.append(result['parsed'])
+            continue
+        halves = document.split_span(span, overlap=split_overlap) if depth < max_split_depth else [span]
+        if len(halves) > 1:
+            print(f'Warning: reducing size of chunk as output json is too large to parse or was cut off. '
+                  f'For file {text_file}')
+            split_spans.extend(halves)
+        elif not isinstance(result, Exception) and result.get('parsing_error') is None and \
+                result.get('parsed') is not None:
+            print(f'WARNING: keeping output which was cut off by max output tokens for text with length '
+                  f'{span[1] - span[0]} tokens in {text_file}, as the text can\'t be split further')
+            extractions.append(result['parsed'])
+        else:
+            print(f'WARNING: discarding output which could not be parsed for text with length {span[1] - span[0]} '
+                  f'tokens in {text_file}, as the text can\'t be split further')
+    return split_spans, extractions
+
+
+def run_phytochem_model_on_corpus(model, text_files: list, context_window: int, wcvp: pd.DataFrame,
+                                  json_dump_dir: str = None, max_concurrency: int = 8, rate_limiter=None,
+                                  single_chunk: bool = True, rerun=True, rerun_inchi_resolution: bool = True,
+                                  wcvp_version: str = None, text_storage: str = 'full', response_cache=None,
+                                  manifest_path: str = None, occurrence_dataset_dir: str = None):
+    """
+    Run the phytochem model over many text files concurrently.
+
+    Each file is processed with run_phytochem_model (so chunking, deduplication and add_all_extra_info_to_output are
+    unchanged) and files are fanned out over a thread pool, as the work is dominated by waiting on the network.
+
+    Parameters:
+    model:
+        The chat model, e.g. from get_phytochem_model.
+    text_files: list
+        Paths of the text files to process.
+    context_window: int
+        The input size limit of the model, used for chunking.
+    wcvp: pd.DataFrame
+        A copy of the wcvp to add accepted names to outputs, shared between workers, or the path to a snapshot from
+        save_wcvp_snapshot.
+    json_dump_dir: str, optional
+        Directory to write one json output per file, named after the text file.
+    max_concurrency: int
+        The maximum number of files processed at once.
+    rate_limiter: optional
+        A langchain rate limiter, e.g. from get_deepseek_rate_limiter, applied to every request the model makes.
+        If None, the model is used as given.
+        If this is a ServiceRateLimiter, failed requests are also retried with backoff.
+    wcvp_version: str, optional
+        The version of the given wcvp. If given, accepted names are cached on disk for this version.
+        See get_accepted_info_for_names.
+    text_storage: str
+        How the text of each file is stored in its output, see store_output_text.
+    response_cache: optional
+        A cache of the model's outputs for each chunk, shared between workers, see get_model_response_cache.
+    manifest_path: str, optional
+        Path to a CorpusManifest database recording the stage each file has reached, which requires a json_dump_dir.
+        Files which have already been processed in the manifest are loaded from their json dumps, and if the run
+        stops part way through it can be continued with resume_corpus_run.
+    occurrence_dataset_dir: str, optional
+        Directory of a Parquet dataset to write the occurrences in each output to as files finish, with the name of
+        each text file (without its extension) as the paper id. See OccurrenceDatasetWriter and
+        read_occurrence_dataset. Requires pyarrow. With a manifest, finished files from previous runs which are missing
+        from the dataset are also added to it.
+
+    Returns:
+    tuple
+        A dict of text file -> TaxaData for files that succeeded, in the order of text_files, and a dict of text file ->
+        Exception for files that failed.
+    """
+    json_dumps = get_json_dumps(text_files, json_dump_dir)
+
+    manifest = None
+    if manifest_path is not None:
+        if json_dump_dir is None:
+            raise ValueError('A json_dump_dir is needed to record progress in a manifest')
+        manifest = CorpusManifest(manifest_path)
+        manifest.set_parameters({'context_window': context_window, 'json_dump_dir': json_dump_dir,
+                                 'single_chunk': single_chunk, 'rerun': rerun,
+                                 'rerun_inchi_resolution': rerun_inchi_resolution, 'wcvp_version': wcvp_version,
+                                 'text_storage': text_storage, 'occurrence_dataset_dir': occurrence_dataset_dir})
+        manifest.add_files(json_dumps)
+
+    if rate_limiter is not None:
+        model = model.model_copy(update={'rate_limiter': rate_limiter})
+
+    occurrence_writer = None
+    if occurrence_dataset_dir is not None:
+        occurrence_writer = OccurrenceDatasetWriter(occurrence_dataset_dir)
+        if manifest is not None:
+            _export_missing_occurrences(manifest, occurrence_writer, json_dumps)
+
+    results = {}
+    errors = {}
     try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = {
+                executor.submit(run_phytochem_model, model, text_file, context_window, wcvp,
+                                json_dump=json_dumps[text_file], single_chunk=single_chunk, rerun=rerun,
+                                rerun_inchi_resolution=rerun_inchi_resolution, wcvp_version=wcvp_version,
+                                text_storage=text_storage, response_cache=response_cache, manifest=manifest): text_file
+                for text_file in json_dumps}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                text_file = futures[future]
+                try:
+                    results[text_file] = future.result()
+                except Exception as e:
+                    print(f'WARNING: failed to process {text_file}: {e}')
+                    errors[text_file] = e
+                    if manifest is not None:
+                        manifest.record_error(text_file, repr(e))
+                    continue
+                if occurrence_writer is not None:
+                    occurrence_writer.add(_get_paper_id(text_file), results[text_file])
+    finally:
+        if occurrence_writer is not None:
+            occurrence_writer.close()
+    # Files finish in any order, so give results in the order of text_files
+    return {text_file: results[text_file] for text_file in json_dumps if text_file in results}, errors
 
-        extractions = extractor.batch(
-            [{"text": text} for text in text_chunks],
-            {"max_concurrency": 1},
-            # limit the concurrency by passing max concurrency! Otherwise Requests rate limit exceeded
-        )
-    except (langchain_core.exceptions.OutputParserException, pydantic_core._pydantic_core.ValidationError) as e:
-        raise NotImplementedError
-        # When there is too much info extracted the extractor can't parse the output json, so make chunks smaller.
-        # This can also happen because of limits on model max output tokens
-        print(f'Warning: reducing size of chunk as output json is too large to parse. For file {text_file}')
-
-        new_chunks = split_text_chunks(text_chunks)
-        print(f'Length of old chunk: {len(text_chunks[0])}')
-
-        extractions = []
-        for text in new_chunks:
-            try:
-                chunk_output = extractor.invoke({"text": text})
-                extractions.append(chunk_output)
-            except Exception as e:
-                more_chunks = split_text_chunks([text])
-                for more_text in more_chunks:
-                    try:
-                        chunk_output = extractor.invoke({"text": more_text})
-                        extractions.append(chunk_output)
-                    except Exception as e:
-                        # print(f'Unknown error "{e}" for text with length {len(more_text)}: {more_text}')
-                        even_more_chunks = split_text_chunks([more_text])
-                        for even_more_text in even_more_chunks:
-                            try:
-                                chunk_output = extractor.invoke({"text": even_more_text})
-                                extractions.append(chunk_output)
-                            except Exception as e:
-                                print(
-                                    f'Unknown error "{e}" for text with length {len(even_more_text)}: {even_more_text}')
-
-    output = []
-
-    for extraction in extractions:
-        if extraction is not None:
-            if extraction.taxa is not None:
-                output.extend(extraction.taxa)
-
-    deduplicated_extractions = deduplicate_and_standardise_output_taxa_lists(output)
-    add_all_extra_info_to_output(deduplicated_extractions, wcvp)
-
-    text = get_txt_from_file(text_file)
-    deduplicated_extractions.text = text
-
-    if json_dump:
-        with open(json_dump, "w") as file_:
-            json_out = deduplicated_extractions.model_dump(mode="json")
-            json.dump(json_out, file_)
 
-    return deduplicated_extractions
+def _get_paper_id(text_file: str) -> str:
+    return os.path.splitext(os.path.basename(text_file))[0]
+
+
+def _export_missing_occurrences(manifest: CorpusManifest, occurrence_writer, text_files):
+    # Occurrences are buffered by the writer, so if a previous run stopped before the writer was closed, files which
+    # finished in that run may be missing from the dataset. Files in this run are exported when they finish.
+    exported = set(read_occurrence_dataset(occurrence_writer.dataset_dir, columns=['paper_id'])['paper_id'])
+    for text_file, json_dump in manifest.get_json_dumps(finished_only=True).items():
+        paper_id = _get_paper_id(text_file)
+        if text_file not in text_files and paper_id not in exported and os.path.exists(json_dump):
+            occurrence_writer.add(paper_id, load_json_dump(json_dump))
+
+
+def resume_corpus_run(manifest_path: str, model, wcvp: pd.DataFrame, max_concurrency: int = 8, rate_limiter=None,
+                      response_cache=None):
+    """
+    Continue a run of run_phytochem_model_on_corpus which used the given manifest_path, with the same parameters.
+
+    Only files which didn't finish are processed, and each continues from the last stage it reached, so e.g. files
+    which had been extracted aren't sent to the model again. The model, wcvp and other arguments which can't be
+    recorded in the manifest must be given again.
+
+    Returns:
+    tuple
+        As run_phytochem_model_on_corpus, for the files which hadn't finished.
+    """
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(manifest_path)
+    manifest = CorpusManifest(manifest_path)
+    parameters = manifest.get_parameters()
+    text_files = list(manifest.get_json_dumps(unfinished_only=True))
+    return run_phytochem_model_on_corpus(model, text_files, parameters['context_window'], wcvp,
+                                         json_dump_dir=parameters['json_dump_dir'], max_concurrency=max_concurrency,
+                                         rate_limiter=rate_limiter, single_chunk=parameters['single_chunk'],
+                                         rerun=parameters.get('rerun', True),
+                                         rerun_inchi_resolution=parameters.get('rerun_inchi_resolution', True),
+                                         wcvp_version=parameters['wcvp_version'],
+                                         text_storage=parameters['text_storage'], response_cache=response_cache,
+                                         manifest_path=manifest_path,
+                                         occurrence_dataset_dir=parameters.get('occurrence_dataset_dir'))
+
+
+def refresh_inchi_keys_in_dumps(json_dumps, max_workers: int = 8) -> list:
+    """
+    Resolve the compounds in many existing json dumps to InChIKeys again, e.g. after failed lookups have been retried.
+
+    All the dumps are scanned for compound names first, without validating them, and each distinct name is resolved
+    once with resolve_names_to_inchi. Only dumps whose InChIKeys have changed are rewritten.
+
+    :param json_dumps: A list of json dumps, or a directory of them.
+    :param max_workers: The maximum number of files read or written, and names resolved, at once.
+    :return: The json dumps which were rewritten.
+    """
+    if isinstance(json_dumps, str):
+        json_dumps = sorted(os.path.join(json_dumps, f) for f in os.listdir(json_dumps) if f.endswith('.json'))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        compound_names = list(executor.map(_read_compound_names, json_dumps))
+    resolved = resolve_names_to_inchi(list(dict.fromkeys(name for names in compound_names for name in names)),
+                                      max_workers=max_workers)
+
+    def update_json_dump(json_dump):
+        output = load_json_dump(json_dump)
+        if set_inchi_keys(output, resolved):
+            write_json_dump(output, json_dump)
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        changed = list(tqdm(executor.map(update_json_dump, json_dumps), total=len(json_dumps)))
+    return [json_dump for json_dump, dump_changed in zip(json_dumps, changed) if dump_changed]
+
+
+def _read_compound_names(json_dump: str) -> list:
+    with open(json_dump, "r") as file_:
+        json_dict = json.load(file_)
+    return [compound for taxon in json_dict.get('taxa') or [] for compound in taxon.get('compounds') or []]
+
+
+def get_deepseek_rate_limiter(requests_per_second: float = 2, max_bucket_size: int = 8):
+    """
+    Gets a token bucket rate limiter for requests to the DeepSeek API.
+
+    DeepSeek doesn't publish a fixed request quota but delays responses under heavy load, so the defaults allow short
+    bursts (up to max_bucket_size requests, matching the default concurrency of run_phytochem_model_on_corpus) while
+    keeping the sustained request rate modest. When requests fail with rate limit or server errors, all workers using
+    the limiter back off together before retrying.
+
+    Parameters:
+    requests_per_second: float
+        The sustained rate at which requests are allowed.
+    max_bucket_size: int
+        The maximum number of requests that can be made in a burst.
+
+    Returns:
+    ServiceRateLimiter
+        A rate limiter which can be passed to get_phytochem_model or run_phytochem_model_on_corpus.
+    """
+    return ServiceRateLimiter(requests_per_second=requests_per_second, max_bucket_size=max_bucket_size)
 
 
 def get_input_size_limit(total_context_window_k: int):
@@ -100,7 +596,7 @@ def get_input_size_limit(total_context_window_k: int):
     return input_size
 
 
-def get_phytochem_model(apikey: str = None, dotenv_path=None):
+def get_phytochem_model(apikey: str = None, dotenv_path=None, rate_limiter=None):
     """
     Gets an instance of the DeepSeek model configured with the specified parameters.
 
@@ -115,6 +611,9 @@ def get_phytochem_model(apikey: str = None, dotenv_path=None):
     dotenv_path: str, optional
         The file path to a `.env` file containing environment variables, including the API
         key under DEEPSEEK_API_KEY=. Defaults to None.
+    rate_limiter: optional
+        A langchain rate limiter applied to every request the model makes, e.g. from get_deepseek_rate_limiter.
+        Defaults to None.
 
     Returns:
     tuple
@@ -141,8 +640,8 @@ def get_phytochem_model(apikey: str = None, dotenv_path=None):
         load_dotenv(dotenv_path=dotenv_path)
 
         model = ChatDeepSeek(
-            model="deepseek-chat", **hparams)
+            model="deepseek-chat", rate_limiter=rate_limiter, **hparams)
     else:
         model = ChatDeepSeek(
-            model="deepseek-chat", api_key=apikey, **hparams)
+            model="deepseek-chat", api_key=apikey, rate_limiter=rate_limiter, **hparams)
     return model, get_input_size_limit(128)
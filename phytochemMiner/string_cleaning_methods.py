@@ -1,3 +1,9 @@
+from functools import lru_cache
+
+__all__ = ['remove_double_spaces_and_break_characters', 'leading_trailing_whitespace', 'leading_trailing_punctuation',
+           'lowercase', 'clean_taxon_strings', 'clean_compound_strings', 'clean_taxon_series', 'clean_compound_series']
+
+
 def remove_double_spaces_and_break_characters(given_text: str) -> str:
     '''
     This will simplify a text by removing double spaces and all whitespace characters (e.g. space, tab, newline, return, formfeed).
@@ -61,6 +67,23 @@ def lowercase(given_str: str):
         return given_str
 
 
+# Characters removed from the ends of taxon names. The whitespace characters are those removed by str.strip()
+_whitespace_characters = '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006' \
+                         '\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+_punctuation_characters = '!"#$%&\'()*,-./:;<=>?@[\\]^_`{|}~'
+_taxon_strip_characters = _whitespace_characters + _punctuation_characters
+
+
+@lru_cache(maxsize=2 ** 16)
+def _clean_taxon_string(given_str: str) -> str:
+    return " ".join(given_str.lower().strip(_taxon_strip_characters).split())
+
+
+@lru_cache(maxsize=2 ** 16)
+def _clean_compound_string(given_str: str) -> str:
+    return " ".join(given_str.lower().split())
+
+
 def clean_taxon_strings(given_str: str):
     """
     Clean the given string by removing leading/trailing whitespace,
@@ -70,14 +93,15 @@ def clean_taxon_strings(given_str: str):
 
     A clean string should be retrievable from the original text when all lower case.
 
+    Results are cached, as the same names are cleaned many times. Values which aren't strings (e.g. None or NaN) are
+    returned unchanged.
+
     :param given_str: The string to be cleaned.
     :return: The cleaned string.
     """
-    low = lowercase(given_str)
-    while (leading_trailing_whitespace(low) != low) or (leading_trailing_punctuation(low) != low):
-        low = leading_trailing_whitespace(low)
-        low = leading_trailing_punctuation(low)
-    return remove_double_spaces_and_break_characters(low)
+    if isinstance(given_str, str):
+        return _clean_taxon_string(given_str)
+    return given_str
 
 
 def clean_compound_strings(given_str: str):
@@ -88,10 +112,42 @@ def clean_compound_strings(given_str: str):
 
     A clean string should be retrievable from the original text when all lower case.
 
+    Results are cached, as the same names are cleaned many times. Values which aren't strings (e.g. None or NaN) are
+    returned unchanged.
+
     :param given_str: The string to be cleaned.
     :return: The cleaned string.
     """
-    low = lowercase(given_str)
-    while (leading_trailing_whitespace(low) != low):
-        low = leading_trailing_whitespace(low)
-    return remove_double_spaces_and_break_characters(low)
+    if isinstance(given_str, str):
+        return _clean_compound_string(given_str)
+    return given_str
+
+
+def clean_taxon_series(series):
+    """
+    Apply clean_taxon_strings to a pandas Series, using vectorised string methods. Values which aren't strings are
+    returned unchanged.
+    """
+    is_str = series.map(_is_str)
+    if not is_str.any():
+        # The str accessor can't be used on e.g. a Series of only NaN
+        return series.copy()
+    cleaned = series.str.lower().str.strip(_taxon_strip_characters).str.replace(r'\s+', ' ', regex=True)
+    return cleaned.where(is_str, series)
+
+
+def clean_compound_series(series):
+    """
+    Apply clean_compound_strings to a pandas Series, using vectorised string methods. Values which aren't strings are
+    returned unchanged.
+    """
+    is_str = series.map(_is_str)
+    if not is_str.any():
+        # The str accessor can't be used on e.g. a Series of only NaN
+        return series.copy()
+    cleaned = series.str.lower().str.strip().str.replace(r'\s+', ' ', regex=True)
+    return cleaned.where(is_str, series)
+
+
+def _is_str(value) -> bool:
+    return isinstance(value, str)
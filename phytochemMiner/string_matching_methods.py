@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import List
+
 from wcvpy.wcvp_download import hybrid_characters
 from wcvpy.wcvp_name_matching import get_species_binomial_from_full_name
 
@@ -63,3 +66,64 @@ def check_compound_names_match(name1: str, name2: str):
     else:
 
         return False
+
+
+@lru_cache(maxsize=2 ** 16)
+def _taxon_match_key(name: str) -> str:
+    # Taxon names match (see precise_taxon_name_match) when these keys are equal
+    return "".join(get_species_binomial_from_full_name(clean_taxon_strings(name)).split())
+
+
+@lru_cache(maxsize=2 ** 16)
+def _compound_match_key(name: str) -> str:
+    # Compound names match (see check_compound_names_match) when these keys are equal
+    return "".join(clean_compound_strings(name).split())
+
+
+class NameMatchIndex:
+    """
+    An index of names which finds the names matching a given name with dictionary lookups, rather than comparing the
+    name with each indexed name in turn.
+
+    For taxa, names match as in check_organism_names_match, and for compounds as in check_compound_names_match. The
+    keys these comparisons rely on are computed once for each indexed name.
+    """
+
+    def __init__(self, names: List[str], name_type: str = 'taxon'):
+        """
+        :param names: The names to index. None names are ignored, as are empty taxon names, as they can't be matched.
+        :param name_type: Either 'taxon' or 'compound'.
+        """
+        if name_type not in ('taxon', 'compound'):
+            raise ValueError(f'Unknown name_type: {name_type}. Should be either taxon or compound')
+        self.name_type = name_type
+        self.names = list(dict.fromkeys(name for name in names if
+                                        name is not None and not (name_type == 'taxon' and name == '')))
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._index = {}
+        # For taxa, names whose abbreviations match the given name
+        self._abbreviation_index = {}
+        for name in self.names:
+            self._index.setdefault(self._key(name), []).append(name)
+            if name_type == 'taxon':
+                self._abbreviation_index.setdefault(self._key(abbreviate_sci_name(name)), []).append(name)
+
+    def _key(self, name: str) -> str:
+        return _taxon_match_key(name) if self.name_type == 'taxon' else _compound_match_key(name)
+
+    def matches(self, name: str) -> List[str]:
+        """
+        Get the indexed names which match the given name, in the order they were given.
+        """
+        if self.name_type == 'compound':
+            return list(self._index.get(self._key(name), []))
+
+        if name is None or name == "":
+            raise ValueError("Both names must be provided.")
+        key = self._key(name)
+        candidates = self._index.get(key, []) + self._index.get(self._key(abbreviate_sci_name(name)), []) + \
+                     self._abbreviation_index.get(key, [])
+        return sorted(set(candidates), key=self._positions.get)
+
+    def has_match(self, name: str) -> bool:
+        return len(self.matches(name)) > 0
@@ -1,10 +1,16 @@
-from typing import Optional, List
+from typing import Optional, List, Union
 
+import pandas as pd
 from pydantic import BaseModel, Field, Extra
 
 from phytochemMiner import clean_taxon_strings, clean_compound_strings
 
 
+# Columns of flattened outputs, one row per taxon and compound
+occurrence_columns = ['paper_id', 'scientific_name', 'accepted_name', 'accepted_species', 'compound', 'inchi_key',
+                      'inchi_key_simp']
+
+
 class Taxon(BaseModel, extra=Extra.allow):
     """Information about a plant or fungus."""
 
@@ -31,28 +37,104 @@ class TaxaData(BaseModel, extra=Extra.allow):
 
 
 def deduplicate_and_standardise_output_taxa_lists(taxa: List[Taxon], ) -> TaxaData:
-    """ Clean strings, as in read_annotation_json and then deduplicate results"""
-    unique_scientific_names = []
+    """ Clean strings, as in read_annotation_json and then deduplicate results.
+
+    Taxa are grouped on their cleaned scientific names, in the order the names first appear, and each name is only
+    cleaned once. Compounds are kept in the order they first appear."""
+    compounds_by_name = {}
     for taxon in taxa:
         if taxon.scientific_name is not None:
             clean_name = clean_taxon_strings(taxon.scientific_name)
-            if clean_name not in unique_scientific_names:
-                unique_scientific_names.append(clean_name)
+            name_compounds = compounds_by_name.setdefault(clean_name, [])
+            for condition in taxon.compounds or []:
+                if condition == condition and condition.lower() != 'null':
+                    name_compounds.append(condition)
 
     new_taxa_list = []
-    for name in unique_scientific_names:
-        new_taxon = Taxon(scientific_name=name, compounds=[])
-        for taxon in taxa:
-            if clean_taxon_strings(taxon.scientific_name) == name:
-                for condition in taxon.compounds or []:
-                    if condition == condition and condition.lower() != 'null':
-                        new_taxon.compounds.append(condition)
-
-        if len(new_taxon.compounds) == 0:
-            new_taxon.compounds = None
+    for name, compounds in compounds_by_name.items():
+        if len(compounds) == 0:
+            cleaned_compounds = None
         else:
-            cleaned_version = [clean_compound_strings(c) for c in new_taxon.compounds]
-            new_taxon.compounds = list(set(cleaned_version))
+            cleaned_compounds = list(dict.fromkeys(clean_compound_strings(c) for c in compounds))
+        new_taxa_list.append(Taxon(scientific_name=name, compounds=cleaned_compounds))
+    return TaxaData(taxa=new_taxa_list)
+
+
+def reconcile_taxa_across_chunks(taxa_data: TaxaData) -> TaxaData:
+    """
+    Merge taxa from deduplicated outputs of different chunks of the same document, where a taxon is given with an
+    abbreviated genus (e.g. f. elastica) because the full name only appears in an earlier chunk.
 
-        new_taxa_list.append(new_taxon)
+    Abbreviated names are only merged into a full name when exactly one full name in the output has that abbreviation.
+    Names and compounds are expected to be cleaned, as in deduplicate_and_standardise_output_taxa_lists.
+    """
+    from phytochemMiner import abbreviate_sci_name
+
+    full_names_by_abbreviation = {}
+    for taxon in taxa_data.taxa:
+        abbreviation = abbreviate_sci_name(taxon.scientific_name)
+        if abbreviation != taxon.scientific_name:
+            full_names_by_abbreviation.setdefault(abbreviation, []).append(taxon.scientific_name)
+
+    taxa_by_name = {taxon.scientific_name: taxon for taxon in taxa_data.taxa}
+    new_taxa_list = []
+    for taxon in taxa_data.taxa:
+        full_names = full_names_by_abbreviation.get(taxon.scientific_name, [])
+        if len(full_names) == 1:
+            full_taxon = taxa_by_name[full_names[0]]
+            if taxon.compounds is not None:
+                full_taxon.compounds = list(dict.fromkeys((full_taxon.compounds or []) + taxon.compounds))
+        else:
+            new_taxa_list.append(taxon)
     return TaxaData(taxa=new_taxa_list)
+
+
+def deduplicate_extractions(extractions: list, reconcile_chunks: bool = False) -> TaxaData:
+    """
+    Combine the outputs of the model for each chunk of a document into one output, see
+    deduplicate_and_standardise_output_taxa_lists. Outputs which are None are ignored.
+
+    If reconcile_chunks is True, taxa from different chunks are also reconciled (see reconcile_taxa_across_chunks).
+    """
+    output = []
+
+    for extraction in extractions:
+        if extraction is not None:
+            if extraction.taxa is not None:
+                output.extend(extraction.taxa)
+
+    deduplicated = deduplicate_and_standardise_output_taxa_lists(output)
+    if reconcile_chunks and len(extractions) > 1:
+        deduplicated = reconcile_taxa_across_chunks(deduplicated)
+    return deduplicated
+
+
+def _get_compound_info(info, compound: str):
+    # InChIKeys are stored as dicts of compound -> key
+    if isinstance(info, dict):
+        return info.get(compound)
+    return None
+
+
+def flatten_taxa_data(outputs: Union[dict, List[TaxaData]]) -> pd.DataFrame:
+    """
+    Flatten outputs into a table of (taxon, compound) occurrences, with the columns in occurrence_columns.
+
+    Taxa without compounds are given a single row with no compound.
+
+    :param outputs: A dict of paper id -> TaxaData, or a list of TaxaData which are identified by their position.
+    :return: A DataFrame with one row per taxon and compound.
+    """
+    if not isinstance(outputs, dict):
+        outputs = dict(enumerate(outputs))
+    rows = []
+    for paper_id, output in outputs.items():
+        for taxon in output.taxa or []:
+            accepted_name = getattr(taxon, 'accepted_name', None)
+            accepted_species = getattr(taxon, 'accepted_species', None)
+            inchi_keys = getattr(taxon, 'inchi_keys', None)
+            inchi_key_simps = getattr(taxon, 'inchi_key_simps', None)
+            for compound in taxon.compounds or [None]:
+                rows.append((paper_id, taxon.scientific_name, accepted_name, accepted_species, compound,
+                             _get_compound_info(inchi_keys, compound), _get_compound_info(inchi_key_simps, compound)))
+    return pd.DataFrame(rows, columns=occurrence_columns)
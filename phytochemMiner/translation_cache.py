@@ -0,0 +1,202 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import NamedTuple, Optional
+
+# Statuses of cached translations
+FOUND = 'found'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+
+class CacheEntry(NamedTuple):
+    value: Optional[str]
+    status: str
+    updated: float
+
+
+class SQLiteTranslationCache(MutableMapping):
+    """
+    A persistent mapping of names to their translations (e.g. compound names to InChIKeys), stored in a SQLite database.
+
+    Each new translation is upserted on its own, rather than rewriting the whole cache, and the database uses WAL mode
+    so that many threads and processes can read and write the same cache at once.
+
+    Each entry records whether the name was found, not found, or the lookup failed (e.g. due to network errors), and
+    when it was last updated. Not found and failed entries expire after not_found_ttl and failed_ttl respectively, after
+    which they are treated as missing so that the name is looked up again.
+
+    Any MutableMapping (e.g. a dict) can be used in place of this class, see use_translation_caches.
+    """
+
+    def __init__(self, db_path: str, table: str, legacy_pickle: str = None, not_found_ttl: float = 90 * 24 * 3600,
+                 failed_ttl: float = 3600):
+        """
+        :param db_path: Path to the SQLite database, which is created if it doesn't exist.
+        :param table: Name of the table holding this cache, so that caches can share a database.
+        :param legacy_pickle: Path to a pickled dict cache to import the first time the table is created.
+        :param not_found_ttl: Seconds before names which weren't found are looked up again. None to never expire.
+        :param failed_ttl: Seconds before names whose lookup failed are looked up again. None to never expire.
+        """
+        if not table.isidentifier():
+            raise ValueError(f'Invalid table name: {table}')
+        self.db_path = db_path
+        self.table = table
+        self.not_found_ttl = not_found_ttl
+        self.failed_ttl = failed_ttl
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._create_table(legacy_pickle)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads or forked processes, so keep one per thread and process
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_table(self, legacy_pickle: str = None):
+        connection = self._connection()
+        # Take the write lock before checking the table exists, so that only one process migrates the legacy pickle
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            columns = [row[1] for row in connection.execute(f'PRAGMA table_info({self.table})')]
+            if len(columns) == 0:
+                connection.execute(f'CREATE TABLE {self.table} (key TEXT PRIMARY KEY, value TEXT, status TEXT, '
+                                   f'updated REAL)')
+                if legacy_pickle is not None and os.path.exists(legacy_pickle):
+                    with open(legacy_pickle, 'rb') as pfile:
+                        legacy_cache = pickle.load(pfile)
+                    now = time.time()
+                    connection.executemany(
+                        f'INSERT OR IGNORE INTO {self.table} (key, value, status, updated) VALUES (?, ?, ?, ?)',
+                        [(key, value, FOUND if value is not None else NOT_FOUND, now) for key, value in
+                         legacy_cache.items()])
+            elif 'status' not in columns:
+                # Tables from before statuses were recorded only contain found and not found names
+                connection.execute(f'ALTER TABLE {self.table} ADD COLUMN status TEXT')
+                connection.execute(f'ALTER TABLE {self.table} ADD COLUMN updated REAL')
+                connection.execute(
+                    f"UPDATE {self.table} SET status = CASE WHEN value IS NULL THEN '{NOT_FOUND}' ELSE '{FOUND}' END, "
+                    f"updated = ?", (time.time(),))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get_entry(self, key) -> Optional[CacheEntry]:
+        """
+        Get the cached entry for the key, including expired entries, or None if it isn't in the cache.
+        """
+        row = self._connection().execute(f'SELECT value, status, updated FROM {self.table} WHERE key = ?',
+                                         (key,)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(*row)
+
+    def set_entry(self, key, value, status: str):
+        self._connection().execute(
+            f'INSERT INTO {self.table} (key, value, status, updated) VALUES (?, ?, ?, ?) '
+            f'ON CONFLICT(key) DO UPDATE SET value = excluded.value, status = excluded.status, '
+            f'updated = excluded.updated',
+            (key, value, status, time.time()))
+
+    def record_failure(self, key):
+        """
+        Record that looking up the key failed, so that it's retried after failed_ttl.
+        """
+        self.set_entry(key, None, FAILED)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        if entry.status == FOUND:
+            return True
+        ttl = self.failed_ttl if entry.status == FAILED else self.not_found_ttl
+        return ttl is None or time.time() - entry.updated < ttl
+
+    def keys_with_status(self, status: str) -> list:
+        """
+        Get all keys with the given status, including expired entries.
+        """
+        return [row[0] for row in
+                self._connection().execute(f'SELECT key FROM {self.table} WHERE status = ?', (status,))]
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Get the values of many keys at once, ignoring keys which are missing or expired. Hits and misses are counted in
+        the hits and misses attributes.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        # Stay below sqlite's limit on the number of query parameters
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self._connection().execute(
+                f'SELECT key, value, status, updated FROM {self.table} WHERE key IN ({",".join("?" * len(batch))})',
+                batch)
+            for key, value, status, updated in rows:
+                if self.is_fresh(CacheEntry(value, status, updated)):
+                    found[key] = value
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: dict):
+        """
+        Set the values of many keys at once, in a single transaction.
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                f'INSERT INTO {self.table} (key, value, status, updated) VALUES (?, ?, ?, ?) '
+                f'ON CONFLICT(key) DO UPDATE SET value = excluded.value, status = excluded.status, '
+                f'updated = excluded.updated',
+                [(key, value, FOUND if value is not None else NOT_FOUND, now) for key, value in items.items()])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of hits and misses from get_many, and the hit rate.
+        """
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else None}
+
+    def __getitem__(self, key):
+        entry = self.get_entry(key)
+        if entry is None or not self.is_fresh(entry):
+            raise KeyError(key)
+        return entry.value
+
+    def __contains__(self, key):
+        entry = self.get_entry(key)
+        return entry is not None and self.is_fresh(entry)
+
+    def __setitem__(self, key, value):
+        self.set_entry(key, value, FOUND if value is not None else NOT_FOUND)
+
+    def __delitem__(self, key):
+        if self._connection().execute(f'DELETE FROM {self.table} WHERE key = ?', (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        rows = self._connection().execute(f'SELECT key, value, status, updated FROM {self.table}').fetchall()
+        return (row[0] for row in rows if self.is_fresh(CacheEntry(*row[1:])))
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -0,0 +1,92 @@
+# Helpers for running models offline, shared by the tests of running_models and pipeline
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import tiktoken
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from phytochemMiner import Taxon, TaxaData, TokenizedDocument, get_txt_from_file
+
+# A byte level encoding, so that tests don't need to download an encoding
+byte_encoding = tiktoken.Encoding(
+    'bytes', pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+
+def extract_taxa(text: str) -> TaxaData:
+    # Whole sentences like 'Ficus elastica contains quercetin.'
+    return TaxaData(taxa=[Taxon(scientific_name=name, compounds=[compound]) for name, compound in
+                          re.findall(r'\b([A-Z][a-z]+ [a-z0-9]+) contains ([a-z0-9]+)\.', text)])
+
+
+def model_result(parsed, finish_reason: str = 'stop', parsing_error=None) -> dict:
+    return {'raw': AIMessage(content='', response_metadata={'finish_reason': finish_reason}), 'parsed': parsed,
+            'parsing_error': parsing_error}
+
+
+class FakeModel:
+    """
+    A chat model which extracts taxa from sentences like 'Ficus elastica contains quercetin.', or gives the outputs of
+    respond for the text of each chunk.
+    """
+
+    def __init__(self, respond=None, name: str = 'fake'):
+        self.respond = respond or (lambda text: model_result(extract_taxa(text)))
+        self.rate_limiter = None
+        self._identifying_params = {'model_name': name}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        return RunnableLambda(self._invoke)
+
+    def _invoke(self, prompt_value):
+        # As langchain chat models do
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        text = prompt_value.to_messages()[-1].content
+        with self._lock:
+            self.calls.append(text)
+        return self.respond(text)
+
+
+class ModelTestCase(unittest.TestCase):
+    """
+    Writes some text files, and stubs tokenization and the accepted name and compound lookups, so that models can be
+    run offline.
+    """
+
+    texts = {
+        'paper0': 'Ficus elastica contains quercetin. Ficus elastica contains rutin.',
+        'paper1': 'Mangifera indica contains mangiferin. The leaves are green.',
+        'paper2': 'Ficus religiosa contains lupeol.',
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.text_files = []
+        for paper_id, text in self.texts.items():
+            text_file = os.path.join(self.tmp_dir.name, f'{paper_id}.txt')
+            with open(text_file, 'w') as file_:
+                file_.write(text)
+            self.text_files.append(text_file)
+        self.json_dump_dir = os.path.join(self.tmp_dir.name, 'outputs')
+
+        patchers = [
+            mock.patch('phytochemMiner.running_models.read_tokenized_file',
+                       lambda text_file: TokenizedDocument(get_txt_from_file(text_file), encoding=byte_encoding)),
+            mock.patch('phytochemMiner.running_models.add_accepted_info'),
+            mock.patch('phytochemMiner.running_models.add_inchi_keys'),
+            mock.patch('phytochemMiner.running_models.aadd_inchi_keys', new_callable=mock.AsyncMock),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
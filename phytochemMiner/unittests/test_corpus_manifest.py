@@ -0,0 +1,81 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from phytochemMiner import CorpusManifest, CHUNKED, EXTRACTED, TAXA_RESOLVED, INCHI_RESOLVED
+
+
+class TestCorpusManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'manifest.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stages(self):
+        manifest = CorpusManifest(self.db_path)
+        manifest.add_files({'paper1.txt': 'outputs/paper1.json', 'paper2.txt': 'outputs/paper2.json'})
+        self.assertIsNone(manifest.get_stage('paper1.txt'))
+        self.assertFalse(manifest.has_reached('paper1.txt', CHUNKED))
+
+        manifest.set_stage('paper1.txt', EXTRACTED)
+        self.assertEqual(EXTRACTED, manifest.get_stage('paper1.txt'))
+        self.assertTrue(manifest.has_reached('paper1.txt', CHUNKED))
+        self.assertTrue(manifest.has_reached('paper1.txt', EXTRACTED))
+        self.assertFalse(manifest.has_reached('paper1.txt', TAXA_RESOLVED))
+
+        with self.assertRaises(ValueError):
+            manifest.set_stage('paper1.txt', 'unknown')
+
+    def test_unfinished_files(self):
+        manifest = CorpusManifest(self.db_path)
+        manifest.add_files({'paper1.txt': 'outputs/paper1.json', 'paper2.txt': 'outputs/paper2.json',
+                            'paper3.txt': 'outputs/paper3.json'})
+        manifest.set_stage('paper1.txt', INCHI_RESOLVED)
+        manifest.set_stage('paper2.txt', TAXA_RESOLVED)
+        self.assertEqual({'paper2.txt': 'outputs/paper2.json', 'paper3.txt': 'outputs/paper3.json'},
+                         manifest.get_json_dumps(unfinished_only=True))
+        self.assertEqual({'paper1.txt': 'outputs/paper1.json'}, manifest.get_json_dumps(finished_only=True))
+        self.assertEqual(3, len(manifest.get_json_dumps()))
+
+    def test_persisted_between_instances(self):
+        manifest = CorpusManifest(self.db_path)
+        manifest.add_files({'paper1.txt': 'outputs/paper1.json'})
+        manifest.set_stage('paper1.txt', EXTRACTED)
+        manifest.set_parameters({'context_window': 1000, 'wcvp_version': None})
+
+        manifest = CorpusManifest(self.db_path)
+        # Adding files again keeps their stage
+        manifest.add_files({'paper1.txt': 'outputs/paper1.json'})
+        self.assertEqual(EXTRACTED, manifest.get_stage('paper1.txt'))
+        self.assertEqual({'context_window': 1000, 'wcvp_version': None}, manifest.get_parameters())
+
+    def test_changed_parameters_warn(self):
+        manifest = CorpusManifest(self.db_path)
+        manifest.set_parameters({'context_window': 1000, 'rerun': False})
+        output = io.StringIO()
+        with redirect_stdout(output):
+            manifest.set_parameters({'context_window': 1000, 'rerun': False, 'text_storage': 'full'})
+        self.assertEqual('', output.getvalue())
+        with redirect_stdout(output):
+            manifest.set_parameters({'context_window': 2000, 'rerun': False})
+        self.assertIn('context_window from 1000 to 2000', output.getvalue())
+        self.assertEqual(2000, manifest.get_parameters()['context_window'])
+
+    def test_errors_cleared_by_later_stages(self):
+        manifest = CorpusManifest(self.db_path)
+        manifest.add_files({'paper1.txt': 'outputs/paper1.json'})
+        manifest.record_error('paper1.txt', 'TimeoutError()')
+        row = manifest._connection().execute("SELECT stage, error FROM files").fetchone()
+        self.assertEqual((None, 'TimeoutError()'), row)
+        manifest.set_stage('paper1.txt', CHUNKED)
+        row = manifest._connection().execute("SELECT stage, error FROM files").fetchone()
+        self.assertEqual((CHUNKED, None), row)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from phytochemMiner import Taxon, TaxaData, evaluate_outputs, flatten_taxa_data
+
+
+def _taxon(scientific_name, compounds, accepted_name=None, inchi_key_simps=None):
+    return Taxon(scientific_name=scientific_name, compounds=compounds, accepted_name=accepted_name,
+                 accepted_species=accepted_name, inchi_keys={}, inchi_key_simps=inchi_key_simps or {})
+
+
+outputs = {
+    'paper1': TaxaData(taxa=[
+        _taxon('Ficus elastica', ['Quercetin', 'rutin'], 'Ficus elastica', {'Quercetin': 'REFJWTPEDVJJIY'}),
+        _taxon('Mangifera indica', ['mangiferin'], 'Mangifera indica'),
+    ]),
+    'paper2': TaxaData(taxa=[
+        _taxon('Ficus religiosa', ['lupeol'], None),
+    ]),
+}
+annotations = {
+    'paper1': TaxaData(taxa=[
+        _taxon('Ficus elastica Roxb.', ['quercetin'], 'Ficus elastica', {'quercetin': 'REFJWTPEDVJJIY'}),
+        _taxon('Mangifera indica', ['mangiferin', 'catechin'], 'Mangifera indica'),
+    ]),
+    'paper2': TaxaData(taxa=[
+        _taxon('Ficus religiosa', ['lupeol'], 'Ficus religiosa'),
+    ]),
+    'paper3': TaxaData(taxa=[
+        _taxon('Ficus religiosa', ['lupeol'], 'Ficus religiosa'),
+    ]),
+}
+
+
+class TestFlattenTaxaData(unittest.TestCase):
+
+    def test_flatten(self):
+        occurrences = flatten_taxa_data(outputs)
+        self.assertEqual(4, len(occurrences))
+        self.assertEqual(['paper1', 'paper1', 'paper1', 'paper2'], occurrences['paper_id'].tolist())
+        self.assertEqual('REFJWTPEDVJJIY', occurrences['inchi_key_simp'].iloc[0])
+        self.assertTrue(occurrences['inchi_key_simp'].iloc[1:].isna().all())
+
+    def test_taxa_without_compounds(self):
+        occurrences = flatten_taxa_data([TaxaData(taxa=[Taxon(scientific_name='Ficus elastica', compounds=None)])])
+        self.assertEqual([0], occurrences['paper_id'].tolist())
+        self.assertIsNone(occurrences['compound'].iloc[0])
+
+
+class TestEvaluateOutputs(unittest.TestCase):
+
+    def test_per_paper(self):
+        per_paper, _ = evaluate_outputs(outputs, annotations)
+        scientific = per_paper[per_paper['level'] == 'scientific_name'].set_index('paper_id')
+        self.assertEqual([2, 1, 0], scientific['true_positives'].tolist())
+        self.assertEqual([1, 0, 0], scientific['false_positives'].tolist())
+        self.assertEqual([1, 0, 1], scientific['false_negatives'].tolist())
+        self.assertAlmostEqual(2 / 3, scientific.loc['paper1', 'precision'])
+        self.assertAlmostEqual(2 / 3, scientific.loc['paper1', 'recall'])
+
+        # The output for paper2 has no accepted name, so isn't counted
+        accepted = per_paper[per_paper['level'] == 'accepted_name'].set_index('paper_id')
+        self.assertEqual([2, 0, 0], accepted['true_positives'].tolist())
+        self.assertEqual([1, 1, 1], accepted['false_negatives'].tolist())
+
+        inchi = per_paper[per_paper['level'] == 'inchi_key'].set_index('paper_id')
+        self.assertEqual([1, 0, 0], inchi['true_positives'].tolist())
+        self.assertEqual([0, 0, 0], inchi['false_positives'].tolist())
+
+    def test_corpus(self):
+        _, corpus = evaluate_outputs(outputs, annotations, levels=['scientific_name'])
+        self.assertEqual(['scientific_name'], corpus.index.tolist())
+        self.assertEqual(3, corpus.loc['scientific_name', 'true_positives'])
+        self.assertEqual(1, corpus.loc['scientific_name', 'false_positives'])
+        self.assertEqual(2, corpus.loc['scientific_name', 'false_negatives'])
+        self.assertAlmostEqual(3 / 4, corpus.loc['scientific_name', 'precision'])
+        self.assertAlmostEqual(3 / 5, corpus.loc['scientific_name', 'recall'])
+
+    def test_abbreviated_names(self):
+        abbreviated_outputs = {
+            'paper1': TaxaData(taxa=[_taxon('F. elastica', ['quercetin']), _taxon('Mangifera indica', ['mangiferin'])]),
+        }
+        abbreviated_annotations = {
+            'paper1': TaxaData(taxa=[_taxon('Ficus elastica Roxb.', ['quercetin']),
+                                     _taxon('M. indica', ['mangiferin'])]),
+            # Abbreviations are only matched to names of the same paper
+            'paper2': TaxaData(taxa=[_taxon('Fagus elastica', ['lupeol'])]),
+        }
+        per_paper, corpus = evaluate_outputs(abbreviated_outputs, abbreviated_annotations, levels=['scientific_name'])
+        self.assertEqual([2, 0], per_paper['true_positives'].tolist())
+        self.assertEqual([0, 0], per_paper['false_positives'].tolist())
+        self.assertEqual([0, 1], per_paper['false_negatives'].tolist())
+        self.assertEqual(1.0, corpus.loc['scientific_name', 'precision'])
+
+
+if __name__ == "__main__":
+    unittest.main()
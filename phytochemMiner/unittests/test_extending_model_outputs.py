@@ -1,6 +1,19 @@
+import asyncio
+import os
+import tempfile
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 
-from phytochemMiner import resolve_name_to_inchi
+import numpy as np
+import pandas as pd
+import pubchempy
+
+from phytochemMiner import resolve_name_to_inchi, resolve_names_to_inchi, SQLiteTranslationCache, \
+    get_accepted_info_for_names, ServiceRateLimiter, retry_failed_translations, aresolve_name_to_inchi
+from phytochemMiner import extending_model_outputs
+
+glucose_inchi_key = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
 
 
 class TestResolveNameToInchi(unittest.TestCase):
@@ -22,5 +35,151 @@ class TestResolveNameToInchi(unittest.TestCase):
         self.assertIsNone(resolve_name_to_inchi(None))
 
 
+class TestResolveWithExpiringCache(unittest.TestCase):
+    # Not found and failed lookups expire straight away, so must not be read back from the cache
+    ttl = 0
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = SQLiteTranslationCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'), 'inchi',
+                                            not_found_ttl=self.ttl, failed_ttl=self.ttl)
+        self.lookups = []
+        self.patchers = [mock.patch.object(extending_model_outputs, '_inchi_translation_result', self.cache),
+                         mock.patch('pubchempy.get_compounds', self._get_compounds),
+                         mock.patch('cirpy.resolve', return_value=None),
+                         mock.patch.object(extending_model_outputs, 'pubchem_rate_limiter',
+                                           ServiceRateLimiter(requests_per_second=1000)),
+                         mock.patch.object(extending_model_outputs, 'cir_rate_limiter',
+                                           ServiceRateLimiter(requests_per_second=1000))]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def _get_compounds(self, name, namespace):
+        self.lookups.append(name)
+        if name == 'glucose':
+            return [SimpleNamespace(inchikey=glucose_inchi_key)]
+        if name == 'badrequest':
+            raise pubchempy.BadRequestError(400, 'PUGREST.BadRequest', [])
+        return []
+
+    def test_resolve_name(self):
+        self.assertEqual(glucose_inchi_key, resolve_name_to_inchi('Glucose'))
+        self.assertIsNone(resolve_name_to_inchi('surelythiscantbeacompound'))
+        self.assertIsNone(resolve_name_to_inchi('badrequest'))
+
+    def test_resolve_name_async(self):
+        self.assertEqual(glucose_inchi_key, asyncio.run(aresolve_name_to_inchi('Glucose')))
+        self.assertIsNone(asyncio.run(aresolve_name_to_inchi('badrequest')))
+        self.assertEqual(['glucose', 'badrequest'], self.lookups)
+
+    def test_resolve_names_once(self):
+        resolved = resolve_names_to_inchi(['glucose', 'surelythiscantbeacompound', 'badrequest', 'Glucose'])
+        self.assertEqual({'glucose': glucose_inchi_key, 'Glucose': glucose_inchi_key,
+                          'surelythiscantbeacompound': None, 'badrequest': None}, resolved)
+        self.assertEqual(['badrequest', 'glucose', 'surelythiscantbeacompound'], sorted(self.lookups))
+
+
+class TestResolveNamesToInchi(TestResolveWithExpiringCache):
+    ttl = 3600
+
+    def test_cache_read_and_written_in_batches(self):
+        self.cache['quercetin'] = 'REFJWTPEDVJJIY-UHFFFAOYSA-N'
+        names = ['Quercetin', 'glucose', 'surelythiscantbeacompound', 'badrequest', 'glucose']
+        with mock.patch.object(self.cache, 'get_entry', wraps=self.cache.get_entry) as get_entry, \
+                mock.patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many, \
+                mock.patch.object(self.cache, 'set_many', wraps=self.cache.set_many) as set_many:
+            resolved = resolve_names_to_inchi(names)
+        self.assertEqual({'Quercetin': 'REFJWTPEDVJJIY-UHFFFAOYSA-N', 'glucose': glucose_inchi_key,
+                          'surelythiscantbeacompound': None, 'badrequest': None}, resolved)
+        get_entry.assert_not_called()
+        get_many.assert_called_once()
+        set_many.assert_called_once_with({'glucose': glucose_inchi_key, 'surelythiscantbeacompound': None})
+        self.assertEqual(['badrequest', 'glucose', 'surelythiscantbeacompound'], sorted(self.lookups))
+
+        # All the names are now cached, including the failed lookup until it expires
+        self.lookups.clear()
+        self.assertEqual(resolved, resolve_names_to_inchi(names))
+        self.assertEqual([], self.lookups)
+
+    def test_retry_failed_translations(self):
+        self.cache.record_failure('glucose')
+        self.cache['surelythiscantbeacompound'] = None
+        self.cache['quercetin'] = 'REFJWTPEDVJJIY-UHFFFAOYSA-N'
+        with mock.patch.object(extending_model_outputs, '_smiles_translation_result', {}):
+            self.assertEqual({'inchi': 1}, retry_failed_translations())
+            self.assertEqual(['glucose'], self.lookups)
+            self.assertEqual(glucose_inchi_key, self.cache['glucose'])
+
+            self.lookups.clear()
+            self.assertEqual({'inchi': 0}, retry_failed_translations(include_not_found=True))
+            self.assertEqual(['surelythiscantbeacompound'], self.lookups)
+        self.assertEqual('REFJWTPEDVJJIY-UHFFFAOYSA-N', self.cache['quercetin'])
+
+
+wcvp = pd.DataFrame({'taxon_name': ['Ficus elastica', 'Ficus benjamina', 'Urostigma benjaminum'],
+                     'accepted_name': ['Ficus elastica', 'Ficus benjamina', 'Ficus benjamina'],
+                     'accepted_species': ['Ficus elastica', 'Ficus benjamina', 'Ficus benjamina']})
+
+
+class TestGetAcceptedInfoForNames(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        cache = SQLiteTranslationCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'), 'accepted_names',
+                                       not_found_ttl=None)
+        self.matched = []
+        self.patchers = [mock.patch.object(extending_model_outputs, '_accepted_name_result', cache),
+                         mock.patch.object(extending_model_outputs, 'get_accepted_info_from_names_in_column',
+                                           self._match_names)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def _match_names(self, names_df: pd.DataFrame, column: str, all_taxa: pd.DataFrame) -> pd.DataFrame:
+        self.matched.append(names_df[column].tolist())
+        return names_df.merge(all_taxa, how='left', left_on=column, right_on='taxon_name')
+
+    def test_names_matched_once(self):
+        names = ['Ficus elastica', 'Urostigma benjaminum', 'Ficus elastica', None, 'Urostigma benjaminum']
+        acc_names = get_accepted_info_for_names(names, wcvp)
+        self.assertEqual([['Ficus elastica', 'Urostigma benjaminum']], self.matched)
+        self.assertEqual(['Ficus elastica', 'Urostigma benjaminum'], acc_names.index.tolist())
+        self.assertEqual('Ficus benjamina', acc_names.loc['Urostigma benjaminum', 'accepted_name'])
+        self.assertEqual('Ficus', acc_names.loc['Urostigma benjaminum', 'accepted_genus'])
+
+    def test_cache_hits_skip_matching(self):
+        names = ['Ficus elastica', 'Urostigma benjaminum']
+        first = get_accepted_info_for_names(names, wcvp, wcvp_version='13')
+        second = get_accepted_info_for_names(names + ['Ficus benjamina'], wcvp, wcvp_version='13')
+        self.assertEqual([names, ['Ficus benjamina']], self.matched)
+        pd.testing.assert_frame_equal(first, second.loc[names])
+        self.assertEqual('Ficus benjamina', second.loc['Ficus benjamina', 'accepted_name'])
+
+    def test_other_version_misses_cache(self):
+        get_accepted_info_for_names(['Ficus elastica'], wcvp, wcvp_version='13')
+        get_accepted_info_for_names(['Ficus elastica'], wcvp, wcvp_version='14')
+        self.assertEqual([['Ficus elastica'], ['Ficus elastica']], self.matched)
+
+    def test_unmatched_names_are_nan(self):
+        names = ['Ficus elastica', 'Unknown name']
+        # Without a cache, from the matched names to cache, then from the cache
+        for wcvp_version in [None, '13', '13']:
+            acc_names = get_accepted_info_for_names(names, wcvp, wcvp_version=wcvp_version)
+            self.assertEqual('Ficus elastica', acc_names.loc['Ficus elastica', 'accepted_species'])
+            for column in ['accepted_name', 'accepted_species', 'accepted_genus']:
+                value = acc_names.loc['Unknown name', column]
+                self.assertTrue(isinstance(value, float) and np.isnan(value))
+        self.assertEqual(2, len(self.matched))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+import unittest
+
+_heavy_modules = ['pandas', 'pydantic', 'langchain_core', 'pubchempy', 'cirpy', 'wcvpy', 'phytochempy']
+
+
+def _run_in_fresh_interpreter(code: str) -> str:
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip()
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_string_methods_do_not_import_heavy_modules(self):
+        loaded = _run_in_fresh_interpreter(
+            'import sys\n'
+            'from phytochemMiner import clean_taxon_strings, clean_compound_strings\n'
+            f'print(",".join(m for m in {_heavy_modules!r} if m in sys.modules))')
+        self.assertEqual('', loaded)
+
+    def test_package_import_is_lazy(self):
+        # Checked from the modules loaded rather than timed, as timings are unreliable on shared machines
+        loaded = _run_in_fresh_interpreter(
+            'import sys\n'
+            'import phytochemMiner\n'
+            f'print(",".join(m for m in {_heavy_modules!r} if m in sys.modules))')
+        self.assertEqual('', loaded)
+
+
+if __name__ == "__main__":
+    unittest.main()
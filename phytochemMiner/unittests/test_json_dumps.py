@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from phytochemMiner import Taxon, TaxaData, write_file_atomically, load_json_dump, write_json_dump, get_json_dumps
+
+
+class TestJsonDumps(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_dump = os.path.join(self.tmp_dir.name, 'paper1.json')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_load(self):
+        output = TaxaData(taxa=[Taxon(scientific_name='Ficus elastica', compounds=['quercetin'])])
+        write_json_dump(output, self.json_dump)
+        self.assertEqual(output.model_dump(), load_json_dump(self.json_dump).model_dump())
+        self.assertEqual(['paper1.json'], os.listdir(self.tmp_dir.name))
+
+    def test_failed_write_is_removed(self):
+        with open(self.json_dump, 'w') as file_:
+            file_.write('previous')
+
+        def write(path: str):
+            with open(path, 'w') as file_:
+                file_.write('partial')
+            raise OSError('disk full')
+
+        with self.assertRaises(OSError):
+            write_file_atomically(self.json_dump, write)
+        # The previous file is kept and the temporary file is removed
+        self.assertEqual(['paper1.json'], os.listdir(self.tmp_dir.name))
+        with open(self.json_dump) as file_:
+            self.assertEqual('previous', file_.read())
+
+    def test_get_json_dumps(self):
+        json_dump_dir = os.path.join(self.tmp_dir.name, 'outputs')
+        json_dumps = get_json_dumps(['texts/paper1.txt', 'paper2.txt'], json_dump_dir)
+        self.assertEqual({'texts/paper1.txt': os.path.join(json_dump_dir, 'paper1.json'),
+                          'paper2.txt': os.path.join(json_dump_dir, 'paper2.json')}, json_dumps)
+        self.assertTrue(os.path.isdir(json_dump_dir))
+        self.assertEqual({'paper1.txt': None}, get_json_dumps(['paper1.txt']))
+        with self.assertRaises(ValueError):
+            get_json_dumps(['a/paper1.txt', 'b/paper1.txt'], json_dump_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import tiktoken
+
+from phytochemMiner import TokenizedDocument, get_txt_from_file, iter_normalised_text, iter_file_chunks, \
+    store_output_text, get_output_text
+
+# A byte level encoding, so that tests don't need to download an encoding
+byte_encoding = tiktoken.Encoding(
+    'bytes', pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+text = ("Ficus elastica contains quercetin. The leaves of F. elastica contain rutin and β-sitosterol. "
+        "Mangifera indica contains mangiferin. ") * 5
+
+
+class TestTokenizedDocument(unittest.TestCase):
+
+    def test_single_chunk(self):
+        document = TokenizedDocument(text, encoding=byte_encoding)
+        self.assertEqual([text.strip()], document.chunks(len(document), overlap=10))
+
+    def test_chunks_end_at_sentences(self):
+        document = TokenizedDocument(text, encoding=byte_encoding)
+        spans = document.chunk_spans(100, overlap=40)
+        self.assertGreater(len(spans), 1)
+        self.assertEqual(0, spans[0][0])
+        self.assertEqual(len(document), spans[-1][1])
+        for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+            self.assertLessEqual(end - start, 100)
+            self.assertLess(start, next_start)
+            # Overlapping, but by no more than the overlap
+            self.assertLessEqual(next_start, end)
+            self.assertGreaterEqual(next_start, end - 40)
+        for chunk in document.chunks(100, overlap=40)[:-1]:
+            self.assertTrue(chunk.endswith('.'), chunk)
+
+    def test_chunks_dont_split_abbreviations(self):
+        document = TokenizedDocument(text, encoding=byte_encoding)
+        for chunk in document.chunks(100, overlap=40):
+            self.assertFalse(chunk.startswith('elastica'), chunk)
+
+    def test_split_span(self):
+        document = TokenizedDocument(text, encoding=byte_encoding)
+        first, second = document.split_span((0, len(document)), overlap=20)
+        self.assertEqual(0, first[0])
+        self.assertEqual(len(document), second[1])
+        self.assertEqual(20, first[1] - second[0])
+        # Split at the start of a sentence, with the overlap either side
+        self.assertTrue(document.span_text((second[0] + 10, len(document)))[0].isupper())
+
+    def test_split_span_with_large_overlap(self):
+        document = TokenizedDocument(text, encoding=byte_encoding)
+        # Overlaps of over half the span are reduced, so that the halves are always shorter than the span
+        for span in [(0, 60), (20, 100), (35, 110)]:
+            for half in document.split_span(span, overlap=span[1] - span[0] - 1):
+                self.assertLess(half[1] - half[0], span[1] - span[0])
+                self.assertTrue(span[0] <= half[0] < half[1] <= span[1])
+
+    def test_short_spans_not_split(self):
+        document = TokenizedDocument('Ficus elastica', encoding=byte_encoding)
+        self.assertEqual([(0, len(document))], document.split_span((0, len(document)), overlap=20))
+
+    def test_empty(self):
+        self.assertEqual([], TokenizedDocument('', encoding=byte_encoding).chunks(100, overlap=10))
+
+
+class TestStreamingFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.txt_file = os.path.join(self.tmp_dir.name, 'article.txt')
+        with open(self.txt_file, 'w', encoding='utf8') as f:
+            f.write('  Abstract\n\n' + text.replace('. ', '.\n\t ') + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalised_text(self):
+        for block_size in [1, 2, 7, 64, 2 ** 20]:
+            self.assertEqual(get_txt_from_file(self.txt_file),
+                             ''.join(iter_normalised_text(self.txt_file, block_size=block_size)))
+
+    def test_file_chunks(self):
+        expected = TokenizedDocument(get_txt_from_file(self.txt_file), encoding=byte_encoding).chunks(100, overlap=40)
+        for block_size in [50, 150, 400, 2 ** 20]:
+            self.assertEqual(expected, list(iter_file_chunks(self.txt_file, 100, overlap=40, encoding=byte_encoding,
+                                                             block_size=block_size)))
+
+    def test_random_file_chunks(self):
+        # Texts with sentences, abbreviations and multi-byte characters, read over many blocks
+        rng = random.Random(0)
+        words = ['Ficus', 'elastica', 'F.', 'et', 'al.', 'contains', 'β-sitosterol', 'quercetin.', '(2R,3S)-catechin',
+                 'Mangifera', 'indica', 'rutin.', 'The', 'leaves', '12', 'mg/g.', 'α-amyrin', '漢字.', 'é']
+        for _ in range(40):
+            with open(self.txt_file, 'w', encoding='utf8') as f:
+                f.write(' '.join(rng.choice(words) + rng.choice([' ', '  ', '\n'])
+                                 for _ in range(rng.randint(50, 400))))
+            chunk_size = rng.randint(30, 120)
+            overlap = rng.randint(0, chunk_size - 1)
+            expected = TokenizedDocument(get_txt_from_file(self.txt_file), encoding=byte_encoding).chunks(
+                chunk_size, overlap=overlap)
+            chunks = list(iter_file_chunks(self.txt_file, chunk_size, overlap=overlap, encoding=byte_encoding,
+                                           block_size=rng.randint(20, 300)))
+            self.assertEqual(expected, chunks)
+
+
+class TestOutputText(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.txt_file = os.path.join(self.tmp_dir.name, 'article.txt')
+        self.json_dump = os.path.join(self.tmp_dir.name, 'article.json')
+        with open(self.txt_file, 'w', encoding='utf8') as f:
+            f.write(text)
+        self.text = get_txt_from_file(self.txt_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_full(self):
+        output = SimpleNamespace(taxa=[])
+        store_output_text(output, self.text, self.txt_file)
+        self.assertEqual(self.text, output.text)
+        self.assertEqual(self.text, get_output_text(output))
+
+    def test_reference(self):
+        output = SimpleNamespace(taxa=[])
+        store_output_text(output, self.text, self.txt_file, text_storage='reference')
+        self.assertIsNone(getattr(output, 'text', None))
+        # As loaded from a json dump
+        output = SimpleNamespace(**json.loads(json.dumps(vars(output))))
+        self.assertEqual(self.text, get_output_text(output))
+
+        with open(self.txt_file, 'w', encoding='utf8') as f:
+            f.write('changed')
+        with self.assertRaises(ValueError):
+            get_output_text(output)
+
+    def test_sidecar(self):
+        output = SimpleNamespace(taxa=[])
+        store_output_text(output, self.text, self.txt_file, text_storage='sidecar', json_dump=self.json_dump)
+        os.remove(self.txt_file)
+        self.assertTrue(output.text_path.endswith('article.txt.gz'))
+        self.assertEqual(self.text, get_output_text(output))
+
+        with self.assertRaises(ValueError):
+            store_output_text(output, self.text, self.txt_file, text_storage='sidecar')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+from phytochemMiner import Taxon, TaxaData, load_json_dumps
+
+
+class TestLoadJsonDumps(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_dumps = []
+        for i in range(5):
+            output = TaxaData(taxa=[Taxon(scientific_name=f'taxon {i}', compounds=['quercetin', 'rutin'],
+                                          accepted_name=f'Taxon {i}', inchi_key_simps={'quercetin': 'REFJWTPEDVJJIY'})],
+                              text=f'text {i}')
+            json_dump = os.path.join(self.tmp_dir.name, f'paper{i}.json')
+            with open(json_dump, 'w') as file_:
+                json.dump(output.model_dump(mode='json'), file_)
+            self.json_dumps.append(json_dump)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load(self):
+        outputs = load_json_dumps(self.json_dumps, batch_size=2, max_workers=2)
+        self.assertEqual([f'taxon {i}' for i in range(5)], [output.taxa[0].scientific_name for output in outputs])
+        self.assertEqual('text 3', outputs[3].text)
+        self.assertEqual('Taxon 3', outputs[3].taxa[0].accepted_name)
+
+    def test_without_text_or_validation(self):
+        outputs = load_json_dumps(self.tmp_dir.name, include_text=False, validate=False, max_workers=1)
+        self.assertEqual(5, len(outputs))
+        self.assertIsNone(getattr(outputs[0], 'text', None))
+        self.assertIsInstance(outputs[0].taxa[0], Taxon)
+        self.assertEqual(['quercetin', 'rutin'], outputs[0].taxa[0].compounds)
+        self.assertEqual('Taxon 0', outputs[0].taxa[0].accepted_name)
+
+    def test_as_dataframe(self):
+        occurrences = load_json_dumps(self.json_dumps, validate=False, as_dataframe=True, batch_size=2, max_workers=2)
+        self.assertEqual(10, len(occurrences))
+        self.assertEqual(['paper0', 'paper0', 'paper1'], occurrences['paper_id'].tolist()[:3])
+        self.assertEqual('REFJWTPEDVJJIY', occurrences['inchi_key_simp'].iloc[0])
+
+    def test_empty(self):
+        self.assertEqual([], load_json_dumps([]))
+        self.assertEqual(0, len(load_json_dumps([], as_dataframe=True)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from phytochemMiner import Taxon, TaxaData, OccurrenceDatasetWriter, read_occurrence_dataset, occurrence_columns
+
+
+def _output(scientific_name, compounds, inchi_key_simps=None):
+    return TaxaData(taxa=[Taxon(scientific_name=scientific_name, compounds=compounds, accepted_name=scientific_name,
+                                accepted_species=scientific_name, inchi_keys={},
+                                inchi_key_simps=inchi_key_simps or {})])
+
+
+class TestOccurrenceDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset_dir = os.path.join(self.tmp_dir.name, 'occurrences')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_and_read(self):
+        with OccurrenceDatasetWriter(self.dataset_dir, rows_per_part=2) as writer:
+            writer.add('paper1', _output('Ficus elastica', ['quercetin', 'rutin'], {'quercetin': 'REFJWTPEDVJJIY'}))
+            writer.add('paper2', _output('Mangifera indica', None))
+        self.assertEqual(2, len([f for f in os.listdir(self.dataset_dir) if f.endswith('.parquet')]))
+
+        occurrences = read_occurrence_dataset(self.dataset_dir)
+        self.assertEqual(occurrence_columns, list(occurrences.columns))
+        self.assertEqual(['paper1', 'paper1', 'paper2'], occurrences['paper_id'].tolist())
+        self.assertEqual('REFJWTPEDVJJIY', occurrences['inchi_key_simp'].iloc[0])
+        self.assertTrue(occurrences['compound'].iloc[2:].isna().all())
+
+    def test_latest_part_is_kept(self):
+        with OccurrenceDatasetWriter(self.dataset_dir) as writer:
+            writer.add('paper1', _output('Ficus elastica', ['quercetin']))
+            writer.add('paper2', _output('Mangifera indica', ['mangiferin']))
+        with OccurrenceDatasetWriter(self.dataset_dir) as writer:
+            writer.add('paper1', _output('Ficus elastica', ['rutin', 'lupeol']))
+
+        occurrences = read_occurrence_dataset(self.dataset_dir, columns=['compound'])
+        self.assertEqual(['compound'], list(occurrences.columns))
+        self.assertEqual(['mangiferin', 'rutin', 'lupeol'], occurrences['compound'].tolist())
+
+    def test_empty(self):
+        with OccurrenceDatasetWriter(self.dataset_dir):
+            pass
+        self.assertEqual(0, len(read_occurrence_dataset(self.dataset_dir)))
+
+
+if __name__ == "__main__":
+    unittest.main()
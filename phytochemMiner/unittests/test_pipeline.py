@@ -0,0 +1,111 @@
+import os
+import unittest
+from unittest import mock
+
+from phytochemMiner import EXTRACTION_STAGE, DEDUPLICATION_STAGE, ACCEPTED_NAMES_STAGE, COMPOUNDS_STAGE, \
+    pipeline_stages, get_stage_artifacts, run_pipeline, run_accepted_names_stage, run_phytochem_model_on_corpus, \
+    get_json_dumps, load_json_dump
+from model_testing import FakeModel, ModelTestCase, extract_taxa, model_result
+
+
+def _add_accepted_names(outputs, wcvp, wcvp_version=None):
+    for output in outputs:
+        for taxon in output.taxa:
+            taxon.accepted_name = taxon.scientific_name.capitalize()
+
+
+def _add_inchi_keys(outputs, max_workers=8):
+    for output in outputs:
+        for taxon in output.taxa:
+            taxon.inchi_keys = {compound: compound.upper() for compound in taxon.compounds or []}
+
+
+class TestPipeline(ModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.artifact_dir = os.path.join(self.tmp_dir.name, 'artifacts')
+        self.add_accepted_names = mock.Mock(side_effect=_add_accepted_names)
+        self.add_inchi_keys = mock.Mock(side_effect=_add_inchi_keys)
+        patchers = [mock.patch('phytochemMiner.pipeline.add_accepted_info_to_outputs', self.add_accepted_names),
+                    mock.patch('phytochemMiner.pipeline.add_inchi_keys_to_outputs', self.add_inchi_keys)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run(self, model, **kwargs):
+        return run_pipeline(model, self.text_files, 10000, None, self.artifact_dir, self.json_dump_dir, **kwargs)
+
+    def _artifact_times(self, stage):
+        return {text_file: os.path.getmtime(artifact) for text_file, artifact in
+                get_stage_artifacts(self.text_files, self.artifact_dir, stage).items()}
+
+    def test_same_outputs_as_corpus_run(self):
+        errors = self._run(FakeModel())
+        self.assertEqual({stage: {} for stage in pipeline_stages}, errors)
+        json_dumps = get_json_dumps(self.text_files, self.json_dump_dir)
+        self.assertTrue(all(os.path.exists(json_dump) for json_dump in json_dumps.values()))
+
+        with mock.patch('phytochemMiner.running_models.add_accepted_info',
+                        lambda output, wcvp, wcvp_version=None: _add_accepted_names([output], wcvp)), \
+                mock.patch('phytochemMiner.running_models.add_inchi_keys', lambda output: _add_inchi_keys([output])):
+            results, _ = run_phytochem_model_on_corpus(FakeModel(), self.text_files, 10000, None)
+        for text_file, result in results.items():
+            self.assertEqual(result.model_dump(), load_json_dump(json_dumps[text_file]).model_dump())
+
+    def test_up_to_date_stages_are_skipped(self):
+        self._run(FakeModel())
+        times = {stage: self._artifact_times(stage) for stage in pipeline_stages}
+
+        model = FakeModel()
+        self._run(model)
+        self.assertEqual(0, len(model.calls))
+        self.assertEqual(1, self.add_accepted_names.call_count)
+        self.assertEqual(1, self.add_inchi_keys.call_count)
+        for stage, stage_times in times.items():
+            self.assertEqual(stage_times, self._artifact_times(stage))
+
+    def test_rerun_from(self):
+        self._run(FakeModel())
+        extraction_times = self._artifact_times(EXTRACTION_STAGE)
+        deduplication_times = self._artifact_times(DEDUPLICATION_STAGE)
+
+        model = FakeModel()
+        self._run(model, rerun_from=ACCEPTED_NAMES_STAGE)
+        self.assertEqual(0, len(model.calls))
+        self.assertEqual(extraction_times, self._artifact_times(EXTRACTION_STAGE))
+        self.assertEqual(deduplication_times, self._artifact_times(DEDUPLICATION_STAGE))
+        self.assertEqual(2, self.add_accepted_names.call_count)
+        self.assertEqual(2, self.add_inchi_keys.call_count)
+
+        with self.assertRaises(ValueError):
+            self._run(model, rerun_from='unknown')
+
+    def test_failed_files(self):
+        def respond(text):
+            if 'religiosa' in text:
+                raise ValueError('Invalid request')
+            return model_result(extract_taxa(text))
+
+        errors = self._run(FakeModel(respond))
+        self.assertEqual([self.text_files[2]], list(errors[EXTRACTION_STAGE]))
+        self.assertIsInstance(errors[EXTRACTION_STAGE][self.text_files[2]], ValueError)
+        self.assertEqual({}, errors[COMPOUNDS_STAGE])
+        self.assertEqual(['paper0.json', 'paper1.json'], sorted(os.listdir(self.json_dump_dir)))
+
+    def test_failed_batches(self):
+        self._run(FakeModel())
+
+        def add_accepted_names(outputs, wcvp, wcvp_version=None):
+            if any(taxon.scientific_name == 'ficus religiosa' for output in outputs for taxon in output.taxa):
+                raise ValueError('Matching failed')
+            _add_accepted_names(outputs, wcvp)
+
+        with mock.patch('phytochemMiner.pipeline.add_accepted_info_to_outputs', add_accepted_names):
+            errors = run_accepted_names_stage(self.text_files, self.artifact_dir, None, rerun=True, batch_size=1)
+        self.assertEqual([self.text_files[2]], list(errors))
+        self.assertIsInstance(errors[self.text_files[2]], ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main()
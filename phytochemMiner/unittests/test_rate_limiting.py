@@ -0,0 +1,93 @@
+import unittest
+import urllib.error
+from email.message import Message
+
+import pubchempy
+
+from phytochemMiner import ServiceRateLimiter, get_retry_after, is_retryable_error
+
+
+def _http_error(code: int, retry_after: str = None):
+    headers = Message()
+    if retry_after is not None:
+        headers['Retry-After'] = retry_after
+    return urllib.error.HTTPError('https://example.com', code, 'error', headers, None)
+
+
+class TestServiceRateLimiter(unittest.TestCase):
+
+    def test_bucket_limits_bursts(self):
+        limiter = ServiceRateLimiter(requests_per_second=0.1, max_bucket_size=2)
+        self.assertTrue(limiter.acquire(blocking=False))
+        self.assertTrue(limiter.acquire(blocking=False))
+        self.assertFalse(limiter.acquire(blocking=False))
+
+    def test_retries_transient_errors(self):
+        limiter = ServiceRateLimiter(requests_per_second=1000, base_backoff=0.001)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise _http_error(503)
+            return 'ok'
+
+        self.assertEqual('ok', limiter.call(flaky))
+        self.assertEqual(3, len(attempts))
+
+    def test_gives_up_after_max_retries(self):
+        limiter = ServiceRateLimiter(requests_per_second=1000, base_backoff=0.001, max_retries=2)
+        attempts = []
+
+        def failing():
+            attempts.append(1)
+            raise _http_error(429)
+
+        with self.assertRaises(urllib.error.HTTPError):
+            limiter.call(failing)
+        self.assertEqual(3, len(attempts))
+
+    def test_does_not_retry_other_errors(self):
+        limiter = ServiceRateLimiter(requests_per_second=1000, base_backoff=0.001)
+        attempts = []
+
+        def failing():
+            attempts.append(1)
+            raise _http_error(400)
+
+        with self.assertRaises(urllib.error.HTTPError):
+            limiter.call(failing)
+        self.assertEqual(1, len(attempts))
+
+    def test_failure_blocks_requests(self):
+        limiter = ServiceRateLimiter(requests_per_second=1000, max_bucket_size=10)
+        limiter.report_failure(retry_after=60)
+        self.assertFalse(limiter.acquire(blocking=False))
+
+
+class TestErrorInspection(unittest.TestCase):
+
+    def test_retry_after(self):
+        self.assertEqual(5, get_retry_after(_http_error(429, '5')))
+        self.assertIsNone(get_retry_after(_http_error(429)))
+        self.assertIsNone(get_retry_after(ValueError()))
+
+    def test_retry_after_from_pubchempy_error(self):
+        # pubchempy raises its own errors, without headers, from the urllib error
+        http_error = _http_error(503, '7')
+        try:
+            raise pubchempy.create_http_error(http_error) from http_error
+        except pubchempy.PubChemHTTPError as error:
+            self.assertEqual(7, get_retry_after(error))
+            self.assertTrue(is_retryable_error(error))
+
+    def test_is_retryable_error(self):
+        self.assertTrue(is_retryable_error(_http_error(429)))
+        self.assertTrue(is_retryable_error(_http_error(503)))
+        self.assertTrue(is_retryable_error(urllib.error.URLError('connection refused')))
+        self.assertFalse(is_retryable_error(_http_error(404)))
+        self.assertFalse(is_retryable_error(ValueError()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,400 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+from email.message import Message
+from unittest import mock
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.prompts import ChatPromptTemplate
+
+from phytochemMiner import TokenizedDocument, CorpusManifest, EXTRACTED, INCHI_RESOLVED, run_phytochem_model, \
+    arun_phytochem_model, run_phytochem_model_on_corpus, resume_corpus_run, read_occurrence_dataset, \
+    get_model_response_cache, refresh_inchi_keys_in_dumps, use_translation_caches, ServiceRateLimiter
+from phytochemMiner import extending_model_outputs
+from model_testing import byte_encoding, extract_taxa, model_result, FakeModel, ModelTestCase
+
+
+class TestRunOnCorpus(ModelTestCase):
+
+    def test_results_and_errors(self):
+        def respond(text):
+            if 'religiosa' in text:
+                raise ValueError('Invalid request')
+            if 'elastica' in text:
+                # Finishes last
+                time.sleep(0.2)
+            return model_result(extract_taxa(text))
+
+        results, errors = run_phytochem_model_on_corpus(FakeModel(respond), self.text_files, 10000, None,
+                                                        json_dump_dir=self.json_dump_dir, max_concurrency=3)
+        self.assertEqual(self.text_files[:2], list(results))
+        self.assertEqual(['ficus elastica'], [taxon.scientific_name for taxon in results[self.text_files[0]].taxa])
+        self.assertEqual(['mangifera indica'], [taxon.scientific_name for taxon in results[self.text_files[1]].taxa])
+        self.assertEqual([self.text_files[2]], list(errors))
+        self.assertIsInstance(errors[self.text_files[2]], ValueError)
+        self.assertEqual(['paper0.json', 'paper1.json'], sorted(os.listdir(self.json_dump_dir)))
+
+    def test_retryable_errors_are_retried(self):
+        failures = []
+
+        def respond(text):
+            if len(failures) == 0:
+                failures.append(text)
+                raise ConnectionError('Connection reset')
+            return model_result(extract_taxa(text))
+
+        model = FakeModel(respond)
+        results, errors = run_phytochem_model_on_corpus(model, self.text_files[:1], 10000, None, max_concurrency=1)
+        self.assertEqual({}, errors)
+        self.assertEqual(['ficus elastica'], [taxon.scientific_name for taxon in results[self.text_files[0]].taxa])
+        self.assertEqual(2, len(model.calls))
+
+
+class TestChunkDispatch(ModelTestCase):
+    texts = {'long_paper': ' '.join(f'Ficus species{i} contains compound{i}.' for i in range(40))}
+
+    def setUp(self):
+        super().setUp()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        document = TokenizedDocument(self.texts['long_paper'], encoding=byte_encoding)
+        self.chunks = document.chunks(300, overlap=50)
+
+    def _respond(self, text):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return model_result(extract_taxa(text))
+
+    def _check(self, model, output):
+        self.assertGreater(len(self.chunks), 3)
+        self.assertEqual(sorted(self.chunks), sorted(model.calls))
+        self.assertEqual(40, len(output.taxa))
+        self.assertGreater(self.max_in_flight, 1)
+        self.assertLessEqual(self.max_in_flight, 3)
+
+    def test_chunks_sent_concurrently(self):
+        model = FakeModel(self._respond)
+        output = run_phytochem_model(model, self.text_files[0], 300, None, single_chunk=False, chunk_overlap=50,
+                                     max_chunk_concurrency=3)
+        self._check(model, output)
+
+    def test_chunks_sent_concurrently_async(self):
+        model = FakeModel(self._respond)
+        output = asyncio.run(arun_phytochem_model(model, self.text_files[0], 300, None, single_chunk=False,
+                                                  chunk_overlap=50, max_chunk_concurrency=3))
+        self._check(model, output)
+
+
+class TestRetries(ModelTestCase):
+    texts = {'paper0': ModelTestCase.texts['paper0']}
+
+    def setUp(self):
+        super().setUp()
+        self.call_times = []
+
+    def _respond(self, text):
+        self.call_times.append(time.monotonic())
+        if len(self.call_times) == 1:
+            headers = Message()
+            headers['Retry-After'] = '0.2'
+            raise urllib.error.HTTPError('https://example.com', 429, 'Too Many Requests', headers, None)
+        return model_result(extract_taxa(text))
+
+    def _check(self, run):
+        model = FakeModel(self._respond)
+        model.rate_limiter = ServiceRateLimiter(requests_per_second=1000, base_backoff=0.001)
+        with mock.patch.object(model.rate_limiter, 'report_failure', wraps=model.rate_limiter.report_failure) as \
+                report_failure:
+            output = run(model)
+        report_failure.assert_called_once_with(0.2)
+        self.assertEqual(2, len(self.call_times))
+        self.assertGreaterEqual(self.call_times[1] - self.call_times[0], 0.2)
+        self.assertEqual(2, len(output.taxa[0].compounds))
+
+    def test_backs_off_before_retrying(self):
+        self._check(lambda model: run_phytochem_model(model, self.text_files[0], 1000, None))
+
+    def test_backs_off_before_retrying_async(self):
+        self._check(lambda model: asyncio.run(arun_phytochem_model(model, self.text_files[0], 1000, None)))
+
+
+class TestAsyncParity(ModelTestCase):
+    texts = {
+        'long_paper': ' '.join(f'Ficus species{i} contains compound{i}.' for i in range(40)),
+        'short_paper': 'Ficus elastica contains quercetin. Mangifera indica contains mangiferin.',
+    }
+
+    def _assert_same_outputs(self, respond, **kwargs) -> list:
+        outputs = []
+        for text_file in self.text_files:
+            output = run_phytochem_model(FakeModel(respond), text_file, 300, None, single_chunk=False,
+                                         chunk_overlap=50, **kwargs)
+            async_output = asyncio.run(arun_phytochem_model(FakeModel(respond), text_file, 300, None,
+                                                            single_chunk=False, chunk_overlap=50, **kwargs))
+            self.assertEqual(output.model_dump(), async_output.model_dump())
+            outputs.append(output)
+        return outputs
+
+    def test_same_outputs(self):
+        long_output, short_output = self._assert_same_outputs(lambda text: model_result(extract_taxa(text)))
+        self.assertEqual(40, len(long_output.taxa))
+        self.assertEqual(['ficus elastica', 'mangifera indica'], [taxon.scientific_name for taxon in short_output.taxa])
+
+    def test_same_outputs_when_splitting(self):
+        def respond(text):
+            return model_result(extract_taxa(text), finish_reason='length' if len(text) > 200 else 'stop')
+
+        long_output, _ = self._assert_same_outputs(respond, max_split_depth=2)
+        self.assertEqual(40, len(long_output.taxa))
+        self.assertGreater(long_output.chunk_split_depth, 0)
+
+    def test_same_json_dumps(self):
+        for text_file in self.text_files:
+            json_dump = os.path.join(self.tmp_dir.name, 'output.json')
+            async_json_dump = os.path.join(self.tmp_dir.name, 'async_output.json')
+            run_phytochem_model(FakeModel(), text_file, 300, None, json_dump=json_dump, chunk_overlap=50)
+            asyncio.run(arun_phytochem_model(FakeModel(), text_file, 300, None, json_dump=async_json_dump,
+                                             chunk_overlap=50))
+            with open(json_dump) as file_, open(async_json_dump) as async_file:
+                self.assertEqual(file_.read(), async_file.read())
+
+
+class TestChunkSplitting(ModelTestCase):
+    texts = {'long_paper': ' '.join(f'Ficus species{i} contains compound{i}.' for i in range(40))}
+    all_names = {f'ficus species{i}' for i in range(40)}
+
+    def _run(self, respond):
+        model = FakeModel(respond)
+        output = run_phytochem_model(model, self.text_files[0], 10000, None, max_split_depth=3)
+        return output, model.calls
+
+    def test_unparsed_outputs_are_split(self):
+        def respond(text):
+            if len(text) > 500:
+                return model_result(None, parsing_error=OutputParserException('Output is too long'))
+            return model_result(extract_taxa(text))
+
+        output, calls = self._run(respond)
+        self.assertEqual(self.all_names, {taxon.scientific_name for taxon in output.taxa})
+        self.assertGreater(output.chunk_split_depth, 0)
+        self.assertTrue(all(len(call) <= 500 for call in calls[-2:]))
+
+    def test_cut_off_outputs_are_kept_at_max_depth(self):
+        output, calls = self._run(lambda text: model_result(extract_taxa(text), finish_reason='length'))
+        # Split into 2, 4 then 8 chunks, and the outputs of the last are kept
+        self.assertEqual(15, len(calls))
+        self.assertEqual(3, output.chunk_split_depth)
+        self.assertEqual(self.all_names, {taxon.scientific_name for taxon in output.taxa})
+
+    def test_unparsed_outputs_are_discarded_at_max_depth(self):
+        output, calls = self._run(lambda text: model_result(None, parsing_error=OutputParserException('Invalid json')))
+        self.assertEqual(15, len(calls))
+        self.assertEqual(3, output.chunk_split_depth)
+        self.assertEqual([], output.taxa)
+
+    def test_cut_off_output_is_kept_when_text_cant_be_split(self):
+        with open(self.text_files[0], 'w') as file_:
+            file_.write('Ficus elastica contains quercetin.')
+        output, calls = self._run(lambda text: model_result(extract_taxa(text), finish_reason='length'))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, output.chunk_split_depth)
+        self.assertEqual(['ficus elastica'], [taxon.scientific_name for taxon in output.taxa])
+
+
+class TestModelResponseCache(ModelTestCase):
+
+    def _run(self, model, response_cache, text_file=None):
+        output = run_phytochem_model(model, text_file or self.text_files[0], 10000, None,
+                                     response_cache=response_cache)
+        return [taxon.scientific_name for taxon in output.taxa]
+
+    def test_second_run_makes_no_calls(self):
+        response_cache = get_model_response_cache(os.path.join(self.tmp_dir.name, 'responses.sqlite'))
+        model = FakeModel()
+        self.assertEqual(['ficus elastica'], self._run(model, response_cache))
+        self.assertEqual(1, len(model.calls))
+
+        model = FakeModel()
+        self.assertEqual(['ficus elastica'], self._run(model, response_cache))
+        self.assertEqual(0, len(model.calls))
+
+        # Outputs with nothing extracted are also cached
+        model = FakeModel(lambda text: model_result(None))
+        self.assertEqual([], self._run(model, response_cache, self.text_files[1]))
+        self.assertEqual([], self._run(model, response_cache, self.text_files[1]))
+        self.assertEqual(1, len(model.calls))
+
+    def test_async_second_run_makes_no_calls(self):
+        response_cache = {}
+        asyncio.run(arun_phytochem_model(FakeModel(), self.text_files[0], 10000, None, response_cache=response_cache))
+        model = FakeModel()
+        output = asyncio.run(arun_phytochem_model(model, self.text_files[0], 10000, None,
+                                                  response_cache=response_cache))
+        self.assertEqual(['ficus elastica'], [taxon.scientific_name for taxon in output.taxa])
+        self.assertEqual(0, len(model.calls))
+
+    def test_failed_outputs_are_not_cached(self):
+        response_cache = {}
+        for respond in [lambda text: model_result(extract_taxa(text), finish_reason='length'),
+                        lambda text: model_result(None, parsing_error=OutputParserException('Invalid json'))]:
+            model = FakeModel(respond)
+            self._run(model, response_cache)
+            self._run(model, response_cache)
+            self.assertEqual(2, len(model.calls))
+        self.assertEqual({}, response_cache)
+
+    def test_key_depends_on_model_and_prompt(self):
+        response_cache = {}
+        self._run(FakeModel(name='model_a'), response_cache)
+
+        model = FakeModel(name='model_b')
+        self._run(model, response_cache)
+        self.assertEqual(1, len(model.calls))
+
+        prompt = ChatPromptTemplate.from_messages([('system', 'Extract phytochemicals.'), ('human', '{text}')])
+        with mock.patch('phytochemMiner.running_models.standard_prompt', prompt):
+            model = FakeModel(name='model_a')
+            self._run(model, response_cache)
+            self.assertEqual(1, len(model.calls))
+        self.assertEqual(3, len(response_cache))
+
+
+class TestCorpusManifest(ModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manifest_path = os.path.join(self.json_dump_dir, 'manifest.sqlite')
+
+    def test_existing_dumps_are_finished_without_rerun(self):
+        run_phytochem_model_on_corpus(FakeModel(), self.text_files, 10000, None, json_dump_dir=self.json_dump_dir)
+
+        model = FakeModel()
+        results, errors = run_phytochem_model_on_corpus(model, self.text_files, 10000, None,
+                                                        json_dump_dir=self.json_dump_dir, rerun=False,
+                                                        rerun_inchi_resolution=False,
+                                                        manifest_path=self.manifest_path)
+        self.assertEqual(3, len(results))
+        self.assertEqual(0, len(model.calls))
+        manifest = CorpusManifest(self.manifest_path)
+        self.assertEqual({}, manifest.get_json_dumps(unfinished_only=True))
+        parameters = manifest.get_parameters()
+        self.assertFalse(parameters['rerun'])
+        self.assertFalse(parameters['rerun_inchi_resolution'])
+
+        results, errors = resume_corpus_run(self.manifest_path, model, None)
+        self.assertEqual({}, results)
+        self.assertEqual(0, len(model.calls))
+
+    def test_resume_keeps_rerun_parameters(self):
+        run_phytochem_model_on_corpus(FakeModel(), self.text_files, 10000, None, json_dump_dir=self.json_dump_dir)
+        manifest = CorpusManifest(self.manifest_path)
+        manifest.set_parameters({'context_window': 10000, 'json_dump_dir': self.json_dump_dir, 'single_chunk': True,
+                                 'rerun': False, 'rerun_inchi_resolution': False, 'wcvp_version': None,
+                                 'text_storage': 'full'})
+        manifest.add_files({text_file: os.path.join(self.json_dump_dir, f'{paper_id}.json')
+                            for paper_id, text_file in zip(self.texts, self.text_files)})
+
+        # Not rerunning, so the existing dumps are used rather than extracting the files again
+        model = FakeModel()
+        results, errors = resume_corpus_run(self.manifest_path, model, None)
+        self.assertEqual(3, len(results))
+        self.assertEqual(0, len(model.calls))
+        self.assertEqual({}, manifest.get_json_dumps(unfinished_only=True))
+
+
+class TestOccurrenceExportDuringCorpusRun(ModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manifest_path = os.path.join(self.json_dump_dir, 'manifest.sqlite')
+        self.dataset_dir = os.path.join(self.tmp_dir.name, 'occurrences')
+
+    def test_occurrences_written_when_run_stops(self):
+        def run_until_paper2(model, text_file, *args, **kwargs):
+            if text_file == self.text_files[2]:
+                raise KeyboardInterrupt
+            return run_phytochem_model(model, text_file, *args, **kwargs)
+
+        with mock.patch('phytochemMiner.running_models.run_phytochem_model', run_until_paper2):
+            with self.assertRaises(KeyboardInterrupt):
+                run_phytochem_model_on_corpus(FakeModel(), self.text_files, 10000, None,
+                                              json_dump_dir=self.json_dump_dir, max_concurrency=1,
+                                              manifest_path=self.manifest_path,
+                                              occurrence_dataset_dir=self.dataset_dir)
+        occurrences = read_occurrence_dataset(self.dataset_dir)
+        self.assertEqual(['paper0', 'paper1'], sorted(occurrences['paper_id'].unique()))
+
+    def test_resume_exports_missing_occurrences(self):
+        run_phytochem_model_on_corpus(FakeModel(), self.text_files, 10000, None, json_dump_dir=self.json_dump_dir,
+                                      manifest_path=self.manifest_path, occurrence_dataset_dir=self.dataset_dir)
+        # As if the run had stopped before the buffered occurrences were written, and before paper2 finished
+        for part_file in os.listdir(self.dataset_dir):
+            os.remove(os.path.join(self.dataset_dir, part_file))
+        CorpusManifest(self.manifest_path).set_stage(self.text_files[2], EXTRACTED)
+
+        model = FakeModel()
+        results, errors = resume_corpus_run(self.manifest_path, model, None)
+        self.assertEqual([self.text_files[2]], list(results))
+        self.assertEqual(0, len(model.calls))
+        self.assertTrue(CorpusManifest(self.manifest_path).has_reached(self.text_files[2], INCHI_RESOLVED))
+
+        occurrences = read_occurrence_dataset(self.dataset_dir)
+        self.assertEqual(['paper0', 'paper0', 'paper1', 'paper2'], sorted(occurrences['paper_id']))
+
+
+class TestRefreshInchiKeys(unittest.TestCase):
+    quercetin = 'REFJWTPEDVJJIY-UHFFFAOYSA-N'
+    rutin = 'IKGXIBQEEMLURG-NVPNHPEKSA-N'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch.object(extending_model_outputs, '_inchi_translation_result', None)
+        self.patcher.start()
+        # Compounds are all in the cache, so nothing is looked up
+        use_translation_caches(inchi_cache={'quercetin': self.quercetin, 'rutin': self.rutin, 'unknown': None})
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def _write_dump(self, name: str, taxa: list) -> str:
+        json_dump = os.path.join(self.tmp_dir.name, f'{name}.json')
+        with open(json_dump, 'w') as file_:
+            json.dump({'taxa': taxa}, file_)
+        # Make sure rewrites are seen in the modified time
+        os.utime(json_dump, (0, 0))
+        return json_dump
+
+    def test_only_changed_dumps_rewritten(self):
+        stale = self._write_dump('stale', [
+            {'scientific_name': 'Ficus elastica', 'compounds': ['quercetin', 'rutin'],
+             'inchi_keys': {'quercetin': self.quercetin}, 'inchi_key_simps': {'quercetin': 'REFJWTPEDVJJIY'}}])
+        up_to_date = self._write_dump('up_to_date', [
+            {'scientific_name': 'Ficus benjamina', 'compounds': ['Quercetin', 'unknown'],
+             'inchi_keys': {'Quercetin': self.quercetin}, 'inchi_key_simps': {'Quercetin': 'REFJWTPEDVJJIY'}},
+            {'scientific_name': 'Mangifera indica', 'compounds': None, 'inchi_keys': {}, 'inchi_key_simps': {}}])
+
+        self.assertEqual([stale], refresh_inchi_keys_in_dumps(self.tmp_dir.name))
+        self.assertNotEqual(0, os.path.getmtime(stale))
+        self.assertEqual(0, os.path.getmtime(up_to_date))
+        with open(stale) as file_:
+            taxon = json.load(file_)['taxa'][0]
+        self.assertEqual({'quercetin': self.quercetin, 'rutin': self.rutin}, taxon['inchi_keys'])
+        self.assertEqual({'quercetin': 'REFJWTPEDVJJIY', 'rutin': 'IKGXIBQEEMLURG'}, taxon['inchi_key_simps'])
+
+        # Nothing changes when refreshed again
+        self.assertEqual([], refresh_inchi_keys_in_dumps([stale, up_to_date]))
+
+
+if __name__ == "__main__":
+    unittest.main()
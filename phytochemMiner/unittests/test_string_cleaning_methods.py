@@ -1,8 +1,10 @@
 # File: extraction\methods\unittests\test_string_cleaning_methods.py
 
+import sys
 import unittest
 
-from phytochemMiner import clean_taxon_strings, clean_compound_strings
+from phytochemMiner import clean_taxon_strings, clean_compound_strings, clean_taxon_series, clean_compound_series
+from phytochemMiner.string_cleaning_methods import _whitespace_characters
 
 
 class TestCleanTaxonStrings(unittest.TestCase):
@@ -51,6 +53,20 @@ class TestCleanTaxonStrings(unittest.TestCase):
         expected = None
         self.assertEqual(expected, clean_taxon_strings(given_str))
 
+    def test_nan_input(self):
+        given_str = float('nan')
+        self.assertIs(given_str, clean_taxon_strings(given_str))
+
+    def test_alternating_whitespace_and_punctuation(self):
+        given_str = " .\xa0( Ficus elastica )\u3000. ,"
+        expected = "ficus elastica"
+        self.assertEqual(expected, clean_taxon_strings(given_str))
+
+    def test_whitespace_characters(self):
+        # The characters stripped should be those removed by str.strip()
+        self.assertEqual(set(c for c in map(chr, range(sys.maxunicode + 1)) if c.isspace()),
+                         set(_whitespace_characters))
+
 
 class TestCleanCompoundStrings(unittest.TestCase):
     def test_basic_cleaning(self):
@@ -96,5 +112,21 @@ class TestCleanCompoundStrings(unittest.TestCase):
         self.assertEqual(expected, clean_compound_strings(given_str))
 
 
+class TestCleanSeries(unittest.TestCase):
+    def test_clean_taxon_series(self):
+        import pandas as pd
+
+        series = pd.Series(["  Hello, World!!  ", "line1\nline2\t   line3", None, " Taxon ."])
+        expected = [clean_taxon_strings(s) for s in series]
+        self.assertEqual(expected, clean_taxon_series(series).tolist())
+
+    def test_clean_compound_series(self):
+        import pandas as pd
+
+        series = pd.Series(["  Multi    Whitespace \nText ", "already clean", None])
+        expected = [clean_compound_strings(s) for s in series]
+        self.assertEqual(expected, clean_compound_series(series).tolist())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from phytochemMiner import abbreviate_sci_name, check_compound_names_match, check_organism_names_match
+from phytochemMiner import abbreviate_sci_name, check_compound_names_match, check_organism_names_match, NameMatchIndex
 
 
 class TestAbbreviateSciName(unittest.TestCase):
@@ -81,5 +81,34 @@ class TestCheckOrganismNamesMatch(unittest.TestCase):
         self.assertFalse(check_organism_names_match("× Ficus religiosa", "Ficus elastica"))
 
 
+class TestNameMatchIndex(unittest.TestCase):
+
+    def test_taxon_matches(self):
+        index = NameMatchIndex(["Ficus elastica", "F. religiosa", "Ficus religiosa L.", "Mangifera indica", None, ""])
+        self.assertEqual(["Ficus elastica"], index.matches("F. elastica"))
+        self.assertEqual(["Ficus elastica"], index.matches(" ficus  elastica."))
+        self.assertEqual(["F. religiosa", "Ficus religiosa L."], index.matches("Ficus religiosa"))
+        self.assertEqual([], index.matches("Ficus indica"))
+        self.assertTrue(index.has_match("M. indica"))
+        self.assertFalse(index.has_match("Fagus sylvatica"))
+
+    def test_taxon_matches_agree_with_check_organism_names_match(self):
+        names = ["Ficus elastica", "F. elastica", "Fagus elastica", "× Ficus elastica", "× F. elastica",
+                 "Ficus religiosa", "ficus religiosa var. religiosa", "Mangifera indica", "Ficus"]
+        index = NameMatchIndex(names)
+        for name in names + ["F. religiosa", "M. indica", "Ficus elastica Roxb.", "Fagus"]:
+            self.assertEqual([n for n in names if check_organism_names_match(name, n)], index.matches(name), name)
+
+    def test_compound_matches_agree_with_check_compound_names_match(self):
+        names = ["CompoundA", "compound a", "Compound   A", "CompoundB", ""]
+        index = NameMatchIndex(names, name_type='compound')
+        for name in names + ["  compounda ", "CompoundC"]:
+            self.assertEqual([n for n in names if check_compound_names_match(name, n)], index.matches(name), name)
+
+    def test_unknown_name_type(self):
+        with self.assertRaises(ValueError):
+            NameMatchIndex(["Ficus elastica"], name_type='organism')
+
+
 if __name__ == "__main__":
     unittest.main()
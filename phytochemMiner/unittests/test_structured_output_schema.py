@@ -0,0 +1,70 @@
+import unittest
+
+from phytochemMiner import Taxon, TaxaData, deduplicate_and_standardise_output_taxa_lists, reconcile_taxa_across_chunks
+
+
+class TestDeduplicateAndStandardiseOutputTaxaLists(unittest.TestCase):
+
+    def test_merges_cleaned_names(self):
+        taxa = [
+            Taxon(scientific_name="Ficus religiosa", compounds=["Compound1"]),
+            Taxon(scientific_name="Mangifera indica", compounds=["compound3"]),
+            Taxon(scientific_name=" FICUS religiosa.", compounds=["compound2", "compound1 "]),
+        ]
+        result = deduplicate_and_standardise_output_taxa_lists(taxa)
+        self.assertEqual(["ficus religiosa", "mangifera indica"], [t.scientific_name for t in result.taxa])
+        self.assertEqual(["compound1", "compound2"], result.taxa[0].compounds)
+        self.assertEqual(["compound3"], result.taxa[1].compounds)
+
+    def test_compound_order_is_deterministic(self):
+        compounds = [f"compound {i}" for i in range(50)]
+        result = deduplicate_and_standardise_output_taxa_lists(
+            [Taxon(scientific_name="Ficus religiosa", compounds=compounds + list(reversed(compounds)))])
+        self.assertEqual(compounds, result.taxa[0].compounds)
+
+    def test_no_compounds(self):
+        taxa = [
+            Taxon(scientific_name="Ficus religiosa", compounds=None),
+            Taxon(scientific_name="Ficus religiosa", compounds=["null", "NULL"]),
+        ]
+        result = deduplicate_and_standardise_output_taxa_lists(taxa)
+        self.assertEqual(1, len(result.taxa))
+        self.assertIsNone(result.taxa[0].compounds)
+
+    def test_none_scientific_name(self):
+        taxa = [
+            Taxon(scientific_name=None, compounds=["compound1"]),
+            Taxon(scientific_name="Ficus religiosa", compounds=["compound2"]),
+        ]
+        result = deduplicate_and_standardise_output_taxa_lists(taxa)
+        self.assertEqual(["ficus religiosa"], [t.scientific_name for t in result.taxa])
+        self.assertEqual(["compound2"], result.taxa[0].compounds)
+
+    def test_empty(self):
+        self.assertEqual([], deduplicate_and_standardise_output_taxa_lists([]).taxa)
+
+
+class TestReconcileTaxaAcrossChunks(unittest.TestCase):
+
+    def test_merges_abbreviated_names(self):
+        taxa = TaxaData(taxa=[
+            Taxon(scientific_name="ficus elastica", compounds=["compound1"]),
+            Taxon(scientific_name="mangifera indica", compounds=["compound2"]),
+            Taxon(scientific_name="f. elastica", compounds=["compound3", "compound1"]),
+        ])
+        result = reconcile_taxa_across_chunks(taxa)
+        self.assertEqual(["ficus elastica", "mangifera indica"], [t.scientific_name for t in result.taxa])
+        self.assertEqual(["compound1", "compound3"], result.taxa[0].compounds)
+
+    def test_ambiguous_abbreviations_are_kept(self):
+        taxa = TaxaData(taxa=[
+            Taxon(scientific_name="ficus elastica", compounds=["compound1"]),
+            Taxon(scientific_name="fagus elastica", compounds=["compound2"]),
+            Taxon(scientific_name="f. elastica", compounds=["compound3"]),
+        ])
+        result = reconcile_taxa_across_chunks(taxa)
+        self.assertEqual(3, len(result.taxa))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import unittest
+
+from phytochemMiner import SQLiteTranslationCache
+from phytochemMiner.translation_cache import FOUND, NOT_FOUND, FAILED
+
+
+class TestSQLiteTranslationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_set_and_get(self):
+        cache = SQLiteTranslationCache(self.db_path, 'inchi')
+        cache['glucose'] = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
+        cache['surelythiscantbeacompound'] = None
+        self.assertEqual('WQZGKKKJIJFFOK-GASJEMHNSA-N', cache['glucose'])
+        self.assertIn('surelythiscantbeacompound', cache)
+        self.assertIsNone(cache['surelythiscantbeacompound'])
+        self.assertNotIn('reserpine', cache)
+        with self.assertRaises(KeyError):
+            cache['reserpine']
+        self.assertEqual(2, len(cache))
+
+    def test_upsert(self):
+        cache = SQLiteTranslationCache(self.db_path, 'inchi')
+        cache['glucose'] = None
+        cache['glucose'] = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
+        self.assertEqual('WQZGKKKJIJFFOK-GASJEMHNSA-N', cache['glucose'])
+        self.assertEqual(1, len(cache))
+
+    def test_persisted_between_instances(self):
+        SQLiteTranslationCache(self.db_path, 'inchi')['glucose'] = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
+        self.assertEqual('WQZGKKKJIJFFOK-GASJEMHNSA-N', SQLiteTranslationCache(self.db_path, 'inchi')['glucose'])
+        self.assertNotIn('glucose', SQLiteTranslationCache(self.db_path, 'smiles'))
+
+    def test_statuses(self):
+        cache = SQLiteTranslationCache(self.db_path, 'inchi')
+        cache['glucose'] = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
+        cache['surelythiscantbeacompound'] = None
+        cache.record_failure('reserpine')
+        self.assertEqual(FOUND, cache.get_entry('glucose').status)
+        self.assertEqual(NOT_FOUND, cache.get_entry('surelythiscantbeacompound').status)
+        self.assertEqual(FAILED, cache.get_entry('reserpine').status)
+        self.assertEqual(['reserpine'], cache.keys_with_status(FAILED))
+        self.assertIn('reserpine', cache)
+        self.assertIsNone(cache['reserpine'])
+
+    def test_expired_entries(self):
+        cache = SQLiteTranslationCache(self.db_path, 'inchi', not_found_ttl=0, failed_ttl=0)
+        cache['glucose'] = 'WQZGKKKJIJFFOK-GASJEMHNSA-N'
+        cache['surelythiscantbeacompound'] = None
+        cache.record_failure('reserpine')
+        self.assertIn('glucose', cache)
+        self.assertNotIn('surelythiscantbeacompound', cache)
+        self.assertNotIn('reserpine', cache)
+        self.assertEqual(['glucose'], list(cache))
+        # Expired entries are still kept until they're looked up again
+        self.assertEqual(FAILED, cache.get_entry('reserpine').status)
+
+    def test_never_expire(self):
+        cache = SQLiteTranslationCache(self.db_path, 'inchi', not_found_ttl=None)
+        cache['surelythiscantbeacompound'] = None
+        self.assertIn('surelythiscantbeacompound', cache)
+
+    def test_adds_statuses_to_old_tables(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.execute('CREATE TABLE inchi (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute("INSERT INTO inchi VALUES ('glucose', 'WQZGKKKJIJFFOK-GASJEMHNSA-N'), "
+                           "('surelythiscantbeacompound', NULL)")
+        connection.commit()
+        connection.close()
+
+        cache = SQLiteTranslationCache(self.db_path, 'inchi')
+        self.assertEqual(FOUND, cache.get_entry('glucose').status)
+        self.assertEqual(NOT_FOUND, cache.get_entry('surelythiscantbeacompound').status)
+        self.assertEqual(2, len(cache))
+
+    def test_migrates_legacy_pickle(self):
+        legacy_pickle = os.path.join(self.tmp_dir.name, 'inchi_translation_cache.pkl')
+        with open(legacy_pickle, 'wb') as pfile:
+            pickle.dump({'glucose': 'WQZGKKKJIJFFOK-GASJEMHNSA-N', 'surelythiscantbeacompound': None}, pfile)
+
+        cache = SQLiteTranslationCache(self.db_path, 'inchi', legacy_pickle=legacy_pickle)
+        self.assertEqual({'glucose': 'WQZGKKKJIJFFOK-GASJEMHNSA-N', 'surelythiscantbeacompound': None}, dict(cache))
+
+        # Only migrated once
+        cache['glucose'] = 'changed'
+        cache = SQLiteTranslationCache(self.db_path, 'inchi', legacy_pickle=legacy_pickle)
+        self.assertEqual('changed', cache['glucose'])
+
+
+if __name__ == "__main__":
+    unittest.main()
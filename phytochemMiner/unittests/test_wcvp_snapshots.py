@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from phytochemMiner import save_wcvp_snapshot, load_wcvp_snapshot, get_accepted_info_for_names
+
+wcvp = pd.DataFrame({
+    'taxon_name': ['Ficus elastica', 'Ficus benjamina', 'Mangifera indica', 'Ficus doubtful'],
+    'accepted_name': ['Ficus elastica', 'Ficus benjamina', 'Mangifera indica', np.nan],
+    'accepted_species': ['Ficus elastica', 'Ficus benjamina', 'Mangifera indica', np.nan],
+    'taxon_rank': ['Species', 'Species', 'Species', 'Species'],
+})
+
+
+def _match_names(names_df: pd.DataFrame, column: str, all_taxa: pd.DataFrame) -> pd.DataFrame:
+    # Matches names exactly, checking for missing values with `x != x` as wcvpy does
+    accepted = {}
+    for taxon_name, accepted_name, accepted_species in zip(all_taxa['taxon_name'], all_taxa['accepted_name'],
+                                                           all_taxa['accepted_species']):
+        if accepted_name != accepted_name:
+            continue
+        accepted[taxon_name] = (accepted_name, accepted_species)
+    matches = [accepted.get(name, (np.nan, np.nan)) for name in names_df[column]]
+    return names_df.assign(accepted_name=[m[0] for m in matches], accepted_species=[m[1] for m in matches])
+
+
+class TestWcvpSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp_dir.name, 'wcvp.arrow')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        save_wcvp_snapshot(wcvp, self.snapshot_path)
+        loaded = load_wcvp_snapshot(self.snapshot_path)
+        pd.testing.assert_frame_equal(wcvp, loaded, check_dtype=False)
+        # Missing values are NaN, as expected by wcvpy
+        self.assertTrue(loaded['accepted_name'][3] != loaded['accepted_name'][3])
+
+        columns = load_wcvp_snapshot(self.snapshot_path, columns=('taxon_name', 'accepted_name'))
+        self.assertEqual(['taxon_name', 'accepted_name'], list(columns.columns))
+
+    def test_names_not_copied(self):
+        import pyarrow as pa
+
+        names = pd.DataFrame({'taxon_name': [f'Ficus {i} ' + 'x' * 100 for i in range(10000)]})
+        save_wcvp_snapshot(names, self.snapshot_path)
+        allocated = pa.total_allocated_bytes()
+        loaded = load_wcvp_snapshot(self.snapshot_path)
+        # The names use the memory-mapped data, rather than a copy allocated in this process
+        self.assertLess(pa.total_allocated_bytes() - allocated, 10000)
+        self.assertEqual('pyarrow', loaded['taxon_name'].dtype.storage)
+        self.assertEqual(names['taxon_name'].tolist(), loaded['taxon_name'].tolist())
+
+    def test_reloaded_when_saved_again(self):
+        save_wcvp_snapshot(wcvp, self.snapshot_path)
+        self.assertEqual(4, len(load_wcvp_snapshot(self.snapshot_path)))
+        save_wcvp_snapshot(wcvp.head(2), self.snapshot_path)
+        modified_time = os.path.getmtime(self.snapshot_path) + 10
+        os.utime(self.snapshot_path, (modified_time, modified_time))
+        self.assertEqual(2, len(load_wcvp_snapshot(self.snapshot_path)))
+
+    def test_accepted_info_matches_dataframe(self):
+        save_wcvp_snapshot(wcvp, self.snapshot_path)
+        names = ['Ficus elastica', 'Mangifera indica', 'Ficus doubtful', 'Unknown name', 'Ficus elastica']
+        with mock.patch('phytochemMiner.extending_model_outputs.get_accepted_info_from_names_in_column',
+                        _match_names):
+            from_dataframe = get_accepted_info_for_names(names, wcvp)
+            from_snapshot = get_accepted_info_for_names(names, self.snapshot_path)
+        pd.testing.assert_frame_equal(from_dataframe, from_snapshot)
+        self.assertEqual('Ficus elastica', from_snapshot.loc['Ficus elastica', 'accepted_name'])
+        self.assertTrue(pd.isna(from_snapshot.loc['Ficus doubtful', 'accepted_name']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def save_wcvp_snapshot(wcvp: pd.DataFrame, snapshot_path: str, columns: List[str] = None):
+    """
+    Save a copy of the wcvp (from get_all_taxa) as a snapshot which can be memory-mapped by load_wcvp_snapshot.
+
+    The snapshot is an uncompressed Arrow IPC (Feather) file, so loading it doesn't copy the data into each process.
+
+    Requires pyarrow.
+
+    :param wcvp: A copy of the wcvp, from get_all_taxa.
+    :param snapshot_path: Path to write the snapshot to.
+    :param columns: Columns to keep in the snapshot. Defaults to all columns, as needed by wcvpy name matching. Fewer
+    columns can be given when only specific wcvpy functions are used.
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+
+    if columns is not None:
+        wcvp = wcvp[columns]
+    table = pa.Table.from_pandas(wcvp, preserve_index=False)
+    feather.write_feather(table, snapshot_path, compression='uncompressed')
+
+
+def load_wcvp_snapshot(snapshot_path: str, columns: tuple = None) -> pd.DataFrame:
+    """
+    Load a snapshot saved with save_wcvp_snapshot, for use wherever a wcvp DataFrame is needed.
+
+    The file is memory-mapped and string columns use the mapped Arrow data directly, without copying it. Worker
+    processes loading the same snapshot therefore share one copy of the names in the OS page cache, rather than each
+    holding their own copy. Missing strings are NaN, as expected by wcvpy name matching. Other columns, e.g. numbers,
+    are copied into the process. Snapshots are only loaded once per process, unless the file is modified.
+
+    Only the columns saved in the snapshot are loaded, so to reduce memory further save only the columns needed by the
+    wcvpy functions being used (see save_wcvp_snapshot).
+
+    Requires pyarrow and pandas>=2.1.
+
+    :param snapshot_path: Path of the snapshot.
+    :param columns: Columns to load, as a tuple. Defaults to all columns in the snapshot.
+    :return: The wcvp DataFrame.
+    """
+    # Keyed on the modification time, so that a snapshot which has been saved again is reloaded
+    return _load_wcvp_snapshot(snapshot_path, os.path.getmtime(snapshot_path), columns)
+
+
+def _arrow_string_dtype() -> pd.StringDtype:
+    # Arrow backed strings which use NaN rather than pd.NA for missing values, as wcvpy checks for them with x != x
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except TypeError:
+        # Before pandas 2.3
+        return pd.StringDtype('pyarrow_numpy')
+
+
+@lru_cache(maxsize=None)
+def _load_wcvp_snapshot(snapshot_path: str, modified_time: float, columns: tuple) -> pd.DataFrame:
+    import pyarrow as pa
+
+    # The memory map isn't closed, as the loaded data refers to it
+    source = pa.memory_map(snapshot_path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(list(columns))
+    string_dtype = _arrow_string_dtype()
+    return table.to_pandas(types_mapper={pa.string(): string_dtype, pa.large_string(): string_dtype}.get)
+
+
+def get_wcvp(wcvp) -> pd.DataFrame:
+    """
+    Get the wcvp DataFrame from either a DataFrame or a path to a snapshot from save_wcvp_snapshot.
+    """
+    if isinstance(wcvp, str):
+        return load_wcvp_snapshot(wcvp)
+    return wcvp
@@ -6,7 +6,7 @@ setup(
     packages=find_packages(include=['phytochemMiner']),
     install_requires=[
         'langchain_core',
-        'langchain-text-splitters',
+        'tiktoken',
         'pydantic_core',
         'pandas',
         'tqdm',
@@ -15,6 +15,10 @@ setup(
         'pubchempy',
         'cirpy'
     ],
+    extras_require={
+        'snapshots': ['pyarrow'],
+        'export': ['pyarrow'],
+    },
     url='https://github.com/alrichardbollans/phytochemMiner',
     license='Attribution-NonCommercial-ShareAlike 4.0 International',
     author='Adam Richard-Bollans',